@@ -10,6 +10,11 @@ from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, OperationFailure
 import os
 from dotenv import load_dotenv
+from contact_dedup import resolve_contact, setup_dedup_indexes
+from contact_schema import normalize_contact_fields, normalize_domain
+from instrumentation import timed
+from reporting import report
+from single_flight import flight_key, get_single_flight, normalize_url
 
 load_dotenv()
 
@@ -41,15 +46,24 @@ def get_db_connection():
         db = client[MONGO_DB_NAME]
         return client, db
     except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
+        report.error(f"❌ **Database Connection Error:** {e}")
         return None, None
 
+def setup_database_indexes(db):
+    """Creates the indexes duplicate matching relies on, so each saved contact is an indexed lookup."""
+    try:
+        setup_dedup_indexes(db)
+    except OperationFailure as e:
+        report.warning(f"⚠ Could not create contact indexes. Error: {e}")
+
+@timed()
 def google_search(query, num_results=5):
     params = {"q": query, "api_key": SERPAPI_API_KEY, "num": num_results}
     search = GoogleSearch(params)
     results = search.get_dict().get("organic_results", [])
     return [{"title": r.get("title"), "url": r.get("link"), "snippet": r.get("snippet")} for r in results]
 
+@timed()
 def find_contact_page(website_url):
     try:
         headers = {"User-Agent": "Mozilla/5.0"}
@@ -64,6 +78,7 @@ def find_contact_page(website_url):
         pass
     return website_url
 
+@timed()
 def scrape_contact_page(contact_url):
     emails, phones = [], []
     if not contact_url:
@@ -78,16 +93,23 @@ def scrape_contact_page(contact_url):
         pass
     return {"emails": emails, "phones": phones}
 
+def fetch_contact_info(website_url):
+    """Scrapes a site's contact details, sharing the work with any identical scrape already running."""
+    return get_single_flight().do(
+        flight_key("scrape", normalize_url(website_url)),
+        lambda: scrape_contact_page(find_contact_page(website_url))
+    )
+
 def save_to_raw_scraped_log(db, data):
     try:
         db[RAW_SCRAPED_COLLECTION].insert_one(data)
     except Exception as e:
-        st.error(f"❌ Error saving to raw scrape log: {e}")
+        report.error(f"❌ Error saving to raw scrape log: {e}")
 
 def save_to_cleaned_mongo(db, dict_data):
     source_url = dict_data.get("source_url")
     if not source_url:
-        st.warning(f"⚠️ Skipped saving '{dict_data.get('name', 'Unknown')}' to cleaned contacts: Source URL is missing.")
+        report.warning(f"⚠️ Skipped saving '{dict_data.get('name', 'Unknown')}' to cleaned contacts: Source URL is missing.")
         return
     try:
         result = db[CLEANED_COLLECTION_NAME].update_one(
@@ -96,11 +118,15 @@ def save_to_cleaned_mongo(db, dict_data):
             upsert=True
         )
         if result.upserted_id:
-            st.success(f"✅ Added new unique contact '{dict_data.get('name')}' to cleaned data.")
+            golden_id = resolve_contact(db, result.upserted_id)
+            if golden_id != result.upserted_id:
+                report.info(f"🔗 '{dict_data.get('name')}' matches an existing contact; merged into it.")
+            else:
+                report.success(f"✅ Added new unique contact '{dict_data.get('name')}' to cleaned data.")
         else:
-            st.info(f"ℹ️ Contact '{dict_data.get('name')}' already exists (duplicate source URL).")
+            report.info(f"ℹ️ Contact '{dict_data.get('name')}' already exists (duplicate source URL).")
     except Exception as e:
-        st.error(f"❌ Error during cleaned save operation: {e}")
+        report.error(f"❌ Error during cleaned save operation: {e}")
 
 def process_and_save_results(results, query, db):
     rows_for_display = []
@@ -109,8 +135,8 @@ def process_and_save_results(results, query, db):
         all_emails = contact_info.get("emails", [])
         website_url = (item.get("url") or "").rstrip('/')
 
-        work_emails = [email for email in all_emails if email.split('@')[-1] not in PERSONAL_EMAIL_DOMAINS]
-        personal_emails = [email for email in all_emails if email.split('@')[-1] in PERSONAL_EMAIL_DOMAINS]
+        work_emails = [email for email in all_emails if email.split('@')[-1].lower() not in PERSONAL_EMAIL_DOMAINS]
+        personal_emails = [email for email in all_emails if email.split('@')[-1].lower() in PERSONAL_EMAIL_DOMAINS]
 
         raw_scrape_data = {
             "query": query, "company_name": item.get("title", ""), "website_url": website_url,
@@ -122,10 +148,8 @@ def process_and_save_results(results, query, db):
         cleaned_data = {
             "name": item.get("title", ""),
             "source_url": website_url,
-            "work_emails": ", ".join(work_emails),
-            "personal_emails": ", ".join(personal_emails),
-            "phones": ", ".join(contact_info.get("phones", [])),
-            "domain": website_url.split('/')[2] if website_url else None,
+            **normalize_contact_fields(work_emails, personal_emails, contact_info.get("phones", [])),
+            "domain": normalize_domain(website_url),
             "source": "Web Scraper",
             "created_at": dt.datetime.now(dt.timezone.utc)
         }
@@ -139,6 +163,31 @@ def process_and_save_results(results, query, db):
         })
     return pd.DataFrame(rows_for_display)
 
+def scrape_results(results, progress=None):
+    """Finds and scrapes the contact page of every search result that has a URL."""
+    scraped_data_list = []
+    for i, item in enumerate(results):
+        website = item.get("url")
+        if website:
+            if progress:
+                progress(i + 1, len(results), f"Scraping: {item.get('title', 'Unknown')} ({website})")
+            item["contact_info"] = fetch_contact_info(website)
+            scraped_data_list.append(item)
+        else:
+            report.warning(f"Skipping a result due to missing URL: {item.get('title', 'N/A')}")
+    return scraped_data_list
+
+def run_scrape(db, query, num_results=5, progress=None):
+    """Searches, scrapes and stores contacts for `query`. Returns the scraped rows as a DataFrame."""
+    setup_database_indexes(db)
+    results = google_search(query, num_results=num_results)
+    if not results:
+        report.info("No organic search results found for your query. Try a different query.")
+        return pd.DataFrame()
+    scraped_data_list = scrape_results(results, progress)
+    report.success("✅ Website scraping complete! Processing and saving data...")
+    return process_and_save_results(scraped_data_list, query, db)
+
 # ===============================
 # STREAMLIT UI
 # ===============================
@@ -264,16 +313,9 @@ def main():
             progress_text = "Scraping in progress. Please wait."
             progress_bar = st.progress(0, text=progress_text)
 
-            scraped_data_list = []
-            for i, item in enumerate(results):
-                website = item.get("url")
-                if website:
-                    progress_bar.progress((i + 1) / len(results), text=f"Scraping: {item.get('title', 'Unknown')} ({website})")
-                    contact_page = find_contact_page(website)
-                    item["contact_info"] = scrape_contact_page(contact_page)
-                    scraped_data_list.append(item)
-                else:
-                    st.warning(f"Skipping a result due to missing URL: {item.get('title', 'N/A')}")
+            scraped_data_list = scrape_results(
+                results, lambda done, total, text: progress_bar.progress(done / total, text=text)
+            )
 
             progress_bar.empty() # Clear the progress bar after completion
             st.success("✅ Website scraping complete! Processing and saving data...")
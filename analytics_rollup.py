@@ -0,0 +1,232 @@
+import datetime
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+# ===============================
+# CONFIGURATION
+# ===============================
+ROLLUP_COLLECTION = "email_rollups"
+GRANULARITIES = ("hour", "day")
+UNASSIGNED_CAMPAIGN = "unassigned"
+UNKNOWN_SENDER = "unknown"
+COUNTER_FIELDS = [
+    "sends", "follow_ups", "received", "failures",
+    "replies_positive", "replies_negative", "replies_neutral", "bounces",
+]
+
+# ===============================
+# EVENT CLASSIFICATION
+# ===============================
+def classify_event(event_type, status=None, interest_level=None):
+    """Maps an email_logs event onto the rollup counter it increments, if any."""
+    if status == "failed":
+        return "failures"
+    if event_type == "initial_outreach":
+        return "sends"
+    if event_type == "follow_up_sent":
+        return "follow_ups"
+    if event_type == "received":
+        return "received"
+    if event_type == "bounced":
+        return "bounces"
+    if event_type and event_type.startswith("replied_"):
+        return f"replies_{interest_level or event_type[len('replied_'):]}"
+    return None
+
+def interest_counts(counts):
+    """Reply counts per interest level, from rollup counters."""
+    return {field[len("replies_"):]: count for field, count in counts.items()
+            if field.startswith("replies_") and count}
+
+def bucket_start(timestamp, granularity):
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _bucket_key(granularity, bucket, campaign_id, sender):
+    return {
+        "granularity": granularity,
+        "bucket": bucket,
+        "campaign_id": campaign_id or UNASSIGNED_CAMPAIGN,
+        "sender": sender or UNKNOWN_SENDER,
+    }
+
+# ===============================
+# INCREMENTAL UPDATES
+# ===============================
+def setup_rollup_indexes(db):
+    try:
+        db[ROLLUP_COLLECTION].create_index(
+            [("granularity", 1), ("bucket", 1), ("campaign_id", 1), ("sender", 1)], unique=True
+        )
+    except OperationFailure:
+        pass
+
+def record_event(db, event_type, timestamp, status=None, interest_level=None, campaign_id=None, sender=None):
+    """Increments the hourly and daily counters for one logged event."""
+    field = classify_event(event_type, status, interest_level)
+    # Every event is also tallied under its own type, failed or not, for the per-type breakdown
+    increments = {f"events.{event_type}": 1} if event_type else {}
+    if field is not None:
+        increments[f"counts.{field}"] = 1
+    if not increments:
+        return
+    operations = [
+        UpdateOne(
+            _bucket_key(granularity, bucket_start(timestamp, granularity), campaign_id, sender),
+            {"$inc": increments},
+            upsert=True
+        )
+        for granularity in GRANULARITIES
+    ]
+    db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+# ===============================
+# BACKFILL
+# ===============================
+def build_backfill_pipeline(granularity, since=None):
+    """Aggregates email_logs into rollup documents and merges them into the rollup collection."""
+    match = {"timestamp": {"$gte": since}} if since else {"timestamp": {"$type": "date"}}
+    counter = {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$status", "failed"]}, "then": "failures"},
+                {"case": {"$eq": ["$event_type", "initial_outreach"]}, "then": "sends"},
+                {"case": {"$eq": ["$event_type", "follow_up_sent"]}, "then": "follow_ups"},
+                {"case": {"$eq": ["$event_type", "received"]}, "then": "received"},
+                {"case": {"$eq": ["$event_type", "bounced"]}, "then": "bounces"},
+                {"case": {"$regexMatch": {"input": {"$ifNull": ["$event_type", ""]}, "regex": "^replied_"}},
+                 "then": {"$concat": ["replies_", {"$ifNull": [
+                     "$interest_level", {"$substrCP": ["$event_type", 8, 32]}
+                 ]}]}},
+            ],
+            "default": None,
+        }
+    }
+    return [
+        {"$match": match},
+        {"$project": {
+            "_id": 0,
+            "counter": counter,
+            "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}},
+            "campaign_id": {"$ifNull": ["$campaign_id", UNASSIGNED_CAMPAIGN]},
+            "sender": {"$ifNull": ["$sender", UNKNOWN_SENDER]},
+        }},
+        {"$match": {"counter": {"$ne": None}}},
+        {"$group": {
+            "_id": {"bucket": "$bucket", "campaign_id": "$campaign_id", "sender": "$sender", "counter": "$counter"},
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"bucket": "$_id.bucket", "campaign_id": "$_id.campaign_id", "sender": "$_id.sender"},
+            "counts": {"$push": {"k": "$_id.counter", "v": "$count"}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "granularity": granularity,
+            "bucket": "$_id.bucket",
+            "campaign_id": "$_id.campaign_id",
+            "sender": "$_id.sender",
+            "counts": {"$arrayToObject": "$counts"},
+        }},
+        {"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["granularity", "bucket", "campaign_id", "sender"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+def build_event_backfill_pipeline(granularity, since=None):
+    """Aggregates email_logs into per-event-type tallies and merges them into existing rollup documents."""
+    match = {"timestamp": {"$gte": since}} if since else {"timestamp": {"$type": "date"}}
+    return [
+        {"$match": {**match, "event_type": {"$type": "string"}}},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}},
+                "campaign_id": {"$ifNull": ["$campaign_id", UNASSIGNED_CAMPAIGN]},
+                "sender": {"$ifNull": ["$sender", UNKNOWN_SENDER]},
+                "event_type": "$event_type",
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"bucket": "$_id.bucket", "campaign_id": "$_id.campaign_id", "sender": "$_id.sender"},
+            "events": {"$push": {"k": "$_id.event_type", "v": "$count"}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "granularity": granularity,
+            "bucket": "$_id.bucket",
+            "campaign_id": "$_id.campaign_id",
+            "sender": "$_id.sender",
+            "events": {"$arrayToObject": "$events"},
+        }},
+        {"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["granularity", "bucket", "campaign_id", "sender"],
+            "whenMatched": [{"$set": {"events": "$$new.events"}}],
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+def backfill_rollups(db, since=None):
+    """Rebuilds rollup buckets from email_logs, from `since` (truncated to the day) or from the start.
+
+    Buckets in the range are recomputed from the logs, so running it again, or
+    alongside incremental updates, never double counts.
+    """
+    setup_rollup_indexes(db)
+    if since is not None:
+        since = bucket_start(since, "day")
+        db[ROLLUP_COLLECTION].delete_many({"bucket": {"$gte": since}})
+    else:
+        db[ROLLUP_COLLECTION].delete_many({})
+    for granularity in GRANULARITIES:
+        list(db.email_logs.aggregate(build_backfill_pipeline(granularity, since)))
+        list(db.email_logs.aggregate(build_event_backfill_pipeline(granularity, since)))
+
+def fetch_rollups(db, granularity, since, campaign_id=None, sender=None):
+    """Returns the rollup documents for a time range, optionally for one campaign or sender."""
+    query = {"granularity": granularity, "bucket": {"$gte": bucket_start(since, granularity)}}
+    if campaign_id:
+        query["campaign_id"] = campaign_id
+    if sender:
+        query["sender"] = sender
+    return list(db[ROLLUP_COLLECTION].find(query, {"_id": 0}).sort("bucket", 1))
+
+def total_rollups(db, granularity, before):
+    """Sums every counter, and every per-event-type tally, over the buckets that start before `before`.
+
+    Returns (counts, events).
+    """
+    pipeline = [
+        {"$match": {"granularity": granularity, "bucket": {"$lt": before}}},
+        {"$facet": {
+            "counts": [
+                {"$group": {"_id": None, **{field: {"$sum": f"$counts.{field}"} for field in COUNTER_FIELDS}}},
+            ],
+            "events": [
+                {"$project": {"events": {"$objectToArray": {"$ifNull": ["$events", {}]}}}},
+                {"$unwind": "$events"},
+                {"$group": {"_id": "$events.k", "count": {"$sum": "$events.v"}}},
+            ],
+        }},
+    ]
+    result = next(db[ROLLUP_COLLECTION].aggregate(pipeline), {})
+    totals = (result.get("counts") or [{}])[0]
+    counts = {field: totals.get(field, 0) for field in COUNTER_FIELDS}
+    events = {doc["_id"]: doc["count"] for doc in result.get("events", [])}
+    return counts, events
+
+if __name__ == "__main__":
+    import os
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGO_URI"))
+    backfill_rollups(client[os.getenv("MONGO_DB_NAME")])
+    print("Rollups rebuilt from email_logs.")
+    client.close()
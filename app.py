@@ -7,6 +7,9 @@ from reply import main as reply_main
 from dashboard import main as dashboard_main
 from clean_data import main as clean_data_main
 from download_all_data import main as download_data_main # <-- IMPORT THE NEW MODULE
+from performance import main as performance_main
+from instrumentation import install_mongo_listener, start_metrics_server
+from profiling import profile_page, profiling_enabled, render_profile_panel
 import os
 
 # ===============================
@@ -19,6 +22,10 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Time every MongoDB command and serve /metrics when METRICS_PORT is set
+install_mongo_listener()
+start_metrics_server()
+
 # ===============================
 # CUSTOM STYLING
 # ===============================
@@ -48,7 +55,7 @@ with st.sidebar:
     # **MODIFICATION:** Add "Download Data" to the navigation options
     page = st.radio(
         "📍 Navigate to:",
-        ("Collect Contacts", "AI Web Scraper", "Show Cleaned Data", "Generate & Edit Emails", "Email Preview", "Handle Replies", "Dashboard", "Download Data")
+        ("Collect Contacts", "AI Web Scraper", "Show Cleaned Data", "Generate & Edit Emails", "Email Preview", "Handle Replies", "Dashboard", "Download Data", "Performance")
     )
 
     st.markdown("---")
@@ -63,23 +70,24 @@ with st.sidebar:
 # ===============================
 st.markdown('<div class="main-header"><h1> Morphius AI — Email Automation</h1></div>', unsafe_allow_html=True)
 
-if page == "Collect Contacts":
-    contactout_main()
-elif page == "AI Web Scraper":
-    web_scraper_main()
-elif page == "Show Cleaned Data":
-    clean_data_main()
-elif page == "Generate & Edit Emails":
-    send_email_main()
-elif page == "Email Preview":
-    email_preview_main()
-elif page == "Handle Replies":
-    reply_main()
-elif page == "Dashboard":
-    dashboard_main()
-# **MODIFICATION:** Add the logic to display the new page
-elif page == "Download Data":
-    download_data_main()
+PAGES = {
+    "Collect Contacts": contactout_main,
+    "AI Web Scraper": web_scraper_main,
+    "Show Cleaned Data": clean_data_main,
+    "Generate & Edit Emails": send_email_main,
+    "Email Preview": email_preview_main,
+    "Handle Replies": reply_main,
+    "Dashboard": dashboard_main,
+    "Download Data": download_data_main,
+    "Performance": performance_main,
+}
+
+# Opt-in render profiling: PROFILE_PAGES=true, or open the app with ?profile=1
+if profiling_enabled():
+    profile_page(page, PAGES[page])
+    render_profile_panel(page)
+else:
+    PAGES[page]()
 
 # ===============================
 # FOOTER
@@ -0,0 +1,43 @@
+"""Microbenchmark: per-message build cost of MIMEMultipart + as_string() versus message_builder.
+
+    python -m benchmarks.message_build --messages 10000
+"""
+import argparse
+import sys
+import timeit
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import make_msgid
+from email_templates import render_with_unsubscribe
+from message_builder import build_message
+
+SENDER = "outreach@morphius.test"
+SUBJECT = "Quick Follow-Up"
+
+def legacy_build(recipient, body, message_id):
+    msg = MIMEMultipart()
+    msg["From"], msg["To"], msg["Subject"] = SENDER, recipient, SUBJECT
+    msg["Message-ID"] = message_id
+    msg.attach(MIMEText(body, "plain"))
+    return msg.as_string()
+
+def lean_build(recipient, body, message_id):
+    return build_message(SENDER, recipient, SUBJECT, body, message_id)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    inputs = [(f"lead{i}@prospect.test", render_with_unsubscribe("follow_up", f"lead{i}@prospect.test"),
+               make_msgid(domain="morphius.test")) for i in range(args.messages)]
+    print(f"{'builder':<10}{'us/message':>12}{'bytes/message':>15}")
+    for name, build in (("legacy", legacy_build), ("lean", lean_build)):
+        best = min(timeit.repeat(lambda: [build(*item) for item in inputs], number=1, repeat=args.repeat))
+        size = sum(len(build(*item)) for item in inputs[:100]) / min(len(inputs), 100)
+        print(f"{name:<10}{best / len(inputs) * 1e6:>12.1f}{size:>15.0f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
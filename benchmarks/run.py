@@ -0,0 +1,176 @@
+"""Offline throughput benchmarks for the send, reply and scrape flows.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run --flows send,reply,scrape --scales 100,1000,10000
+
+SMTP, IMAP, OpenAI and the scraped websites are replaced by the local
+stand-ins in benchmarks/standins.py. MongoDB is mongomock unless
+--mongo-uri points at a disposable local mongod (its database is dropped
+before every run). Each run reports messages/sec and p95 latency of the
+flow's per-message operation, taken from the instrumentation histograms.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from benchmarks.standins import FakeImapServer, SmtpSink, StaticSiteServer, StubOpenAIServer, build_reply
+
+SENDER = "bench@morphius.test"
+BENCH_DB_NAME = "morphius_bench"
+# The operation whose p95 is reported for each flow
+FLOW_OPERATIONS = {
+    "send": "smtp_send",
+    "reply": "send_reply",
+    "scrape": "scrape_contact_page",
+}
+
+# ===============================
+# SETUP
+# ===============================
+def configure_environment(smtp, imap, openai_stub, mongo_uri):
+    """Points the app's configuration at the stand-ins. Must run before any app module is imported."""
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(smtp.port), "SMTP_USE_TLS": "false",
+        "IMAP_SERVER": "127.0.0.1", "IMAP_PORT": str(imap.port), "IMAP_USE_SSL": "false",
+        "SENDER_EMAIL": SENDER, "SENDER_PASSWORD": "bench",
+        "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": openai_stub.base_url,
+        "MONGO_URI": mongo_uri or "", "MONGO_DB_NAME": BENCH_DB_NAME,
+    })
+
+def fresh_database(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri)
+        client.drop_database(BENCH_DB_NAME)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    db = client[BENCH_DB_NAME]
+
+    # Share the run's database with the LLM cache and start it empty
+    import llm_cache
+    llm_cache._cache = llm_cache.LLMResponseCache(db[llm_cache.LLM_CACHE_COLLECTION])
+    return client, db
+
+# ===============================
+# FLOWS
+# ===============================
+def run_send(db, scale, services):
+    from email_preview import send_emails
+    emails = [{"to_email": f"lead{i}@prospect.test", "subject": "Connecting from Morphius AI",
+               "body": f"Hello lead {i},\n\nShort note about Morphius AI.\n"} for i in range(scale)]
+    sent, _ = send_emails(db, emails)
+    return sent
+
+def run_reply(db, scale, services):
+    from reply import process_inbox, setup_database_indexes
+    setup_database_indexes(db)
+    db.email_logs.insert_many([{
+        "timestamp": datetime.datetime.now(datetime.timezone.utc), "event_type": "initial_outreach", "recipient_email": f"lead{i}@prospect.test",
+        "status": "success", "sender": SENDER, "message_id": f"<out{i}@morphius.test>",
+    } for i in range(scale)])
+    for i in range(scale):
+        services["imap"].mailbox.add(build_reply(
+            f"lead{i}@prospect.test", SENDER, f"<out{i}@morphius.test>",
+            f"Thanks for reaching out. Could you share pricing for a team of {i + 2}?"
+        ))
+    process_inbox(db)
+    return services["smtp"].handler.messages
+
+def run_scrape(db, scale, services):
+    from ai_webscraper import process_and_save_results, scrape_results
+    results = [{"title": f"Company {i}", "url": services["sites"].site_url(i), "snippet": ""} for i in range(scale)]
+    df = process_and_save_results(scrape_results(results), "benchmark", db)
+    return len(df)
+
+FLOWS = {"send": run_send, "reply": run_reply, "scrape": run_scrape}
+
+# ===============================
+# RUNNER
+# ===============================
+def start_services(openai_latency_ms, openai_jitter_ms):
+    return {
+        "smtp": SmtpSink().start(),
+        "imap": FakeImapServer().start(),
+        "openai": StubOpenAIServer(openai_latency_ms, openai_jitter_ms).start(),
+        "sites": StaticSiteServer().start(),
+    }
+
+def reset_services(services):
+    services["smtp"].handler.messages = 0
+    services["smtp"].handler.recipients = 0
+    services["imap"].mailbox.messages.clear()
+    services["imap"].mailbox.seen.clear()
+
+def run_once(flow, scale, services, mongo_uri):
+    from instrumentation import latency_summary, reset_metrics
+    random.seed(scale)
+    reset_services(services)
+    client, db = fresh_database(mongo_uri)
+    reset_metrics()
+    started = time.perf_counter()
+    items = FLOWS[flow](db, scale, services)
+    elapsed = time.perf_counter() - started
+    client.close()
+    operations = {row["series"]: row for row in latency_summary() if row["metric"] == "operation_duration_seconds"}
+    main_op = operations.get(FLOW_OPERATIONS[flow], {})
+    return {
+        "flow": flow, "scale": scale, "items": items, "elapsed_s": round(elapsed, 3),
+        "msgs_per_sec": round(items / elapsed, 2) if elapsed else None,
+        "p95_ms": round(main_op.get("p95_ms", 0), 2),
+        "operations": {name: {key: row[key] for key in ("calls", "errors", "p50_ms", "p95_ms")}
+                       for name, row in operations.items()},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the outreach pipeline.")
+    parser.add_argument("--flows", default="send,reply,scrape")
+    parser.add_argument("--scales", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per flow and scale; the median run is reported.")
+    parser.add_argument("--openai-latency-ms", type=float, default=200)
+    parser.add_argument("--openai-jitter-ms", type=float, default=50)
+    parser.add_argument("--mongo-uri", help="Use this (disposable) mongod instead of mongomock.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"Unknown flow(s): {', '.join(sorted(unknown))}")
+    scales = [int(scale) for scale in args.scales.split(",")]
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    services = start_services(args.openai_latency_ms, args.openai_jitter_ms)
+    configure_environment(services["smtp"], services["imap"], services["openai"], args.mongo_uri)
+    from reporting import LogReporter, set_reporter
+    set_reporter(LogReporter())
+
+    results = []
+    print(f"{'flow':<8}{'scale':>8}{'items':>8}{'elapsed s':>12}{'msgs/sec':>12}{'p95 ms':>10}")
+    for flow in flows:
+        for scale in scales:
+            runs = sorted((run_once(flow, scale, services, args.mongo_uri) for _ in range(args.repeat)),
+                          key=lambda run: run["elapsed_s"])
+            result = runs[len(runs) // 2]
+            result["runs_elapsed_s"] = [run["elapsed_s"] for run in runs]
+            if len(runs) > 1:
+                result["elapsed_stdev_s"] = round(statistics.stdev(result["runs_elapsed_s"]), 3)
+            results.append(result)
+            print(f"{flow:<8}{scale:>8}{result['items']:>8}{result['elapsed_s']:>12}"
+                  f"{result['msgs_per_sec']:>12}{result['p95_ms']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump({"openai_latency_ms": args.openai_latency_ms, "mongo": args.mongo_uri or "mongomock",
+                       "results": results}, handle, indent=2)
+    for service in services.values():
+        service.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""Local stand-ins for the external services the pipeline talks to.
+
+Every server binds to 127.0.0.1 on a free port and runs in a daemon thread,
+so a benchmark can start them, point the app's environment variables at
+them and throw them away afterwards.
+"""
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import make_msgid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+except ImportError:  # Only the SMTP sink needs aiosmtpd
+    Controller = None
+    AuthResult = None
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ===============================
+# SMTP SINK
+# ===============================
+class _CountingHandler:
+    def __init__(self):
+        self.messages = 0
+        self.recipients = 0
+        self.lock = threading.Lock()
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            self.messages += 1
+            self.recipients += len(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+class SmtpSink:
+    """An aiosmtpd server that accepts any login and discards every message."""
+
+    def __init__(self, port=0):
+        if Controller is None:
+            raise RuntimeError("The SMTP sink needs the 'aiosmtpd' package (pip install -r benchmarks/requirements.txt).")
+        self.handler = _CountingHandler()
+        self.controller = Controller(
+            self.handler, hostname="127.0.0.1", port=port or _free_port(),
+            auth_require_tls=False, authenticator=lambda *args: AuthResult(success=True),
+        )
+
+    def start(self):
+        self.controller.start()
+        return self
+
+    def stop(self):
+        self.controller.stop()
+
+    @property
+    def port(self):
+        return self.controller.port
+
+
+def _free_port():
+    with socketserver.TCPServer(("127.0.0.1", 0), None) as probe:
+        return probe.server_address[1]
+
+# ===============================
+# FAKE IMAP SERVER
+# ===============================
+class Mailbox:
+    """A thread-safe in-memory INBOX of raw RFC 822 messages with a \\Seen flag each."""
+
+    def __init__(self):
+        self.messages = []
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def add(self, raw):
+        with self.lock:
+            self.messages.append(raw)
+
+    def unseen(self):
+        with self.lock:
+            return [i + 1 for i in range(len(self.messages)) if i + 1 not in self.seen]
+
+
+def build_reply(sender, recipient, in_reply_to, body):
+    msg = EmailMessage()
+    msg["From"], msg["To"], msg["Subject"] = sender, recipient, "Re: Connecting from Morphius AI"
+    msg["Message-ID"] = make_msgid(domain=sender.split("@")[-1])
+    msg["In-Reply-To"] = msg["References"] = in_reply_to
+    msg.set_content(body)
+    return msg.as_bytes()
+
+
+class _ImapHandler(socketserver.StreamRequestHandler):
+    """Implements the IMAP4rev1 subset imaplib uses: LOGIN, SELECT, SEARCH, FETCH RFC822, STORE, LOGOUT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self.reply("* OK IMAP4rev1 stand-in ready")
+        for raw in self.rfile:
+            parts = raw.decode(errors="ignore").strip().split(" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, command, args = parts[0], parts[1].upper(), parts[2] if len(parts) > 2 else ""
+            if command == "CAPABILITY":
+                self.reply("* CAPABILITY IMAP4rev1 AUTH=PLAIN")
+            elif command == "SELECT":
+                self.reply(f"* {len(mailbox.messages)} EXISTS")
+                self.reply("* 0 RECENT")
+                self.reply(f"{tag} OK [READ-WRITE] SELECT completed")
+                continue
+            elif command == "SEARCH":
+                self.reply("* SEARCH " + " ".join(str(i) for i in mailbox.unseen()))
+            elif command == "FETCH":
+                number = int(args.split(" ", 1)[0])
+                message = mailbox.messages[number - 1]
+                with mailbox.lock:
+                    mailbox.seen.add(number)
+                self.wfile.write(f"* {number} FETCH (RFC822 {{{len(message)}}}\r\n".encode() + message + b")\r\n")
+            elif command == "STORE":
+                number = int(args.split(" ", 1)[0])
+                with mailbox.lock:
+                    mailbox.seen.add(number)
+                self.reply(f"* {number} FETCH (FLAGS (\\Seen))")
+            elif command == "LOGOUT":
+                self.reply("* BYE logging out")
+                self.reply(f"{tag} OK LOGOUT completed")
+                return
+            self.reply(f"{tag} OK {command} completed")
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox=None):
+        super().__init__(("127.0.0.1", 0), _ImapHandler)
+        self.mailbox = mailbox or Mailbox()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        return _serve(self)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+# ===============================
+# STUB OPENAI ENDPOINT
+# ===============================
+DRAFT_TEXT = ("Dear Sir/Madam,\n\nI came across your work and wanted to introduce Morphius AI. "
+              "We help teams automate outreach without losing the personal touch. "
+              "Would you be open to a short call next week?\n\nBest regards,\nMorphius AI")
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.requests += 1
+        latency = self.server.latency_seconds + random.uniform(0, self.server.jitter_seconds)
+        time.sleep(latency)
+        prompt = " ".join(message.get("content", "") for message in request.get("messages", []))
+        text = random.choice(["positive", "neutral", "negative"]) if "Classify" in prompt else DRAFT_TEXT
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if request.get("stream"):
+            self._stream(request, text)
+            return
+        body = json.dumps({
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"), "usage": usage,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for token in re.findall(r"\S+\s*", text):
+            chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", "gpt-4o"),
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """Answers /v1/chat/completions after `latency_ms` (+ up to `jitter_ms`) with canned text."""
+
+    daemon_threads = True
+
+    def __init__(self, latency_ms=200, jitter_ms=50):
+        super().__init__(("127.0.0.1", 0), _OpenAIHandler)
+        self.latency_seconds = latency_ms / 1000
+        self.jitter_seconds = jitter_ms / 1000
+        self.requests = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        return _serve(self)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+# ===============================
+# STATIC SITE SERVER
+# ===============================
+class _SiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        match = re.match(r"^/site/(\d+)/(contact)?$", self.path)
+        if not match:
+            self.send_error(404)
+            return
+        i = int(match.group(1))
+        if match.group(2):
+            html = (f"<html><body><h1>Contact Company {i}</h1>"
+                    f"<p>Email: hello{i}@company{i}.test or founder{i}@gmail.com</p>"
+                    f"<p>Phone: (555) 010-{i % 10000:04d}</p></body></html>")
+        else:
+            html = (f"<html><body><h1>Company {i}</h1><p>{'Lorem ipsum dolor sit amet. ' * 40}</p>"
+                    f"<a href='/site/{i}/contact'>Contact us</a></body></html>")
+        body = html.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StaticSiteServer(ThreadingHTTPServer):
+    """Serves generated company sites at /site/<n>/ with a linked contact page."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SiteHandler)
+
+    def site_url(self, i):
+        return f"http://127.0.0.1:{self.server_address[1]}/site/{i}/"
+
+    def start(self):
+        return _serve(self)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
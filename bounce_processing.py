@@ -0,0 +1,177 @@
+import datetime
+import email
+import os
+import re
+from pymongo import UpdateMany, UpdateOne
+from dotenv import load_dotenv
+from contact_schema import CLEANED_COLLECTION_NAME
+from mail_threading import find_thread_origin, parse_message_ids
+from analytics_rollup import record_event
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+# Soft bounces (mailbox full, greylisting, ...) only suppress an address once they keep happening
+SOFT_BOUNCE_LIMIT = int(os.getenv("SOFT_BOUNCE_LIMIT", 3))
+BOUNCE_SENDER_PATTERN = re.compile(r"^(mailer-daemon|postmaster|mail-daemon)@", re.IGNORECASE)
+BOUNCE_SUBJECT_PATTERN = re.compile(
+    r"(undeliver|delivery status notification|delivery failure|returned mail|mail delivery failed|failure notice)",
+    re.IGNORECASE
+)
+STATUS_PATTERN = re.compile(r"\b([245])\.\d{1,3}\.\d{1,3}\b")
+SMTP_REPLY_PATTERN = re.compile(r"\b([245])\d\d\b")
+
+# ===============================
+# PARSING
+# ===============================
+def _address(value):
+    """Strips the address-type prefix from a DSN field ('rfc822; a@b.com')."""
+    if not value:
+        return None
+    address = str(value).split(";", 1)[-1].strip().strip("<>").lower()
+    return address if "@" in address else None
+
+def classify_bounce(status=None, action=None, diagnostic=None):
+    """Returns 'hard' for permanent failures (5.x.x), 'soft' for transient ones (4.x.x), or None."""
+    if action and action.strip().lower() in ("delivered", "relayed", "expanded"):
+        return None
+    if action and action.strip().lower() == "delayed":
+        return "soft"
+    match = STATUS_PATTERN.search(status or "") or SMTP_REPLY_PATTERN.search(diagnostic or "")
+    if not match:
+        # A failed action without a usable status code is treated as permanent
+        return "hard" if action and action.strip().lower() == "failed" else None
+    return {"5": "hard", "4": "soft"}.get(match.group(1))
+
+def is_bounce(msg):
+    if msg.get_content_type() == "multipart/report" and msg.get_param("report-type") == "delivery-status":
+        return True
+    sender = email.utils.parseaddr(msg.get("From", ""))[1]
+    return bool(BOUNCE_SENDER_PATTERN.match(sender) and BOUNCE_SUBJECT_PATTERN.search(msg.get("Subject", "")))
+
+def _original_message_ids(msg):
+    """Message-IDs of the returned message, from the attached original or its headers."""
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        if content_type == "message/rfc822" and part.is_multipart():
+            original = part.get_payload(0)
+            return parse_message_ids(original.get("Message-ID"))
+        if content_type == "text/rfc822-headers":
+            headers = email.message_from_string(part.get_payload(decode=True).decode(errors="ignore"))
+            return parse_message_ids(headers.get("Message-ID"))
+    return parse_message_ids(msg.get("In-Reply-To")) + parse_message_ids(msg.get("References"))
+
+def _delivery_status_fields(msg):
+    """Yields the per-recipient field blocks of a message/delivery-status part."""
+    for part in msg.walk():
+        if part.get_content_type() != "message/delivery-status":
+            continue
+        # The email package exposes each block (per-message, then per-recipient) as a sub-message
+        for block in part.get_payload():
+            if block.get("Final-Recipient") or block.get("Original-Recipient"):
+                yield block
+
+def parse_bounce(msg):
+    """Extracts bounced recipients from a DSN (RFC 3464) or a non-standard bounce message.
+
+    Returns None for ordinary mail, otherwise a dict with the original
+    `message_ids` and a list of `recipients` ({email, kind, status, diagnostic}).
+    """
+    if not is_bounce(msg):
+        return None
+    recipients = []
+    for block in _delivery_status_fields(msg):
+        address = _address(block.get("Final-Recipient")) or _address(block.get("Original-Recipient"))
+        kind = classify_bounce(block.get("Status"), block.get("Action"), block.get("Diagnostic-Code"))
+        if address and kind:
+            recipients.append({
+                "email": address, "kind": kind,
+                "status": (block.get("Status") or "").strip() or None,
+                "diagnostic": (block.get("Diagnostic-Code") or "").strip() or None,
+            })
+    if not recipients:
+        # Non-DSN bounces: Exim/qmail style X-Failed-Recipients header, status guessed from the text
+        text = ""
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain":
+                text = part.get_payload(decode=True).decode(errors="ignore")
+                break
+        kind = classify_bounce(diagnostic=text) or "hard"
+        for address in (msg.get("X-Failed-Recipients") or "").split(","):
+            address = _address(address)
+            if address:
+                recipients.append({"email": address, "kind": kind, "status": None, "diagnostic": None})
+    return {"message_ids": _original_message_ids(msg), "recipients": recipients}
+
+# ===============================
+# SUPPRESSION
+# ===============================
+def setup_bounce_indexes(db):
+    db.email_logs.create_index([("event_type", 1), ("recipient_email", 1)])
+
+def apply_bounces(db, bounces):
+    """Records parsed bounces and updates suppression and contact deliverability in bulk.
+
+    Hard bounces are suppressed immediately; soft bounces once an address
+    reaches SOFT_BOUNCE_LIMIT. Returns the number of addresses newly suppressed.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    log_entries, hard, soft = [], set(), set()
+    for bounce in bounces:
+        origin = find_thread_origin(db, references=bounce["message_ids"]) or {}
+        for recipient in bounce["recipients"]:
+            (hard if recipient["kind"] == "hard" else soft).add(recipient["email"])
+            log_entries.append({
+                "timestamp": now, "event_type": "bounced", "recipient_email": recipient["email"],
+                "status": recipient["kind"], "bounce_status": recipient["status"],
+                "diagnostic": recipient["diagnostic"], "in_reply_to": origin.get("message_id"),
+                "campaign_id": origin.get("campaign_id"), "sender": origin.get("sender"),
+            })
+    if not log_entries:
+        return 0
+    db.email_logs.insert_many(log_entries, ordered=False)
+    for entry in log_entries:
+        record_event(db, "bounced", now, status=entry["status"],
+                     campaign_id=entry["campaign_id"], sender=entry["sender"])
+
+    soft -= hard
+    if soft:
+        counts = db.email_logs.aggregate([
+            {"$match": {"event_type": "bounced", "status": "soft", "recipient_email": {"$in": list(soft)}}},
+            {"$group": {"_id": "$recipient_email", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gte": SOFT_BOUNCE_LIMIT}}},
+        ])
+        exhausted = {doc["_id"] for doc in counts}
+    else:
+        exhausted = set()
+
+    contact_updates = [
+        UpdateMany({"emails": address}, {"$set": {"deliverability": "hard_bounce", "bounced_at": now}})
+        for address in hard
+    ] + [
+        UpdateMany({"emails": address, "deliverability": {"$ne": "hard_bounce"}},
+                   {"$set": {"deliverability": "soft_bounce", "bounced_at": now}})
+        for address in soft
+    ]
+    db[CLEANED_COLLECTION_NAME].bulk_write(contact_updates, ordered=False)
+
+    suppress = [(address, "Hard bounce") for address in hard]
+    suppress += [(address, f"{SOFT_BOUNCE_LIMIT} soft bounces") for address in exhausted]
+    if not suppress:
+        return 0
+    result = db.unsubscribe_list.bulk_write([
+        UpdateOne({"email": address},
+                  {"$setOnInsert": {"email": address, "reason": reason, "created_at": now}}, upsert=True)
+        for address, reason in suppress
+    ], ordered=False)
+    return result.upserted_count
+
+def suppressed_addresses(db, addresses):
+    """Returns which of `addresses` are on the suppression list, in one indexed query."""
+    addresses = [address.strip().lower() for address in addresses if address]
+    if not addresses:
+        return set()
+    return set(db.unsubscribe_list.distinct("email", {"email": {"$in": addresses}}))
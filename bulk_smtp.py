@@ -0,0 +1,211 @@
+import os
+import re
+import smtplib
+from dotenv import load_dotenv
+from instrumentation import timer
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+# Many providers cap messages per connection; reconnect before hitting the limit
+SMTP_MAX_MESSAGES_PER_SESSION = int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", 100))
+SMTP_BATCH_SIZE = int(os.getenv("SMTP_BATCH_SIZE", 50))
+CRLF = b"\r\n"
+LEADING_DOT = re.compile(rb"(?m)^\.")
+
+
+class SendResult:
+    """Outcome of one message: `refused` maps recipients the server rejected to (code, reply)."""
+
+    def __init__(self, key, recipients):
+        self.key = key
+        self.recipients = recipients
+        self.refused = {}
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and len(self.refused) < len(self.recipients)
+
+    def __repr__(self):
+        return f"SendResult({self.key!r}, ok={self.ok}, refused={self.refused}, error={self.error!r})"
+
+
+def _data_block(message):
+    """Dot-stuffs a message and appends the end-of-data marker (RFC 5321 4.5.2)."""
+    data = LEADING_DOT.sub(b"..", message)
+    if not data.endswith(CRLF):
+        data += CRLF
+    return data + b"." + CRLF
+
+# ===============================
+# BULK SENDER
+# ===============================
+class BulkSmtpSender:
+    """Sends many messages over as few SMTP sessions as possible.
+
+    `connect` returns a connected, authenticated smtplib.SMTP. When the server
+    advertises PIPELINING, each message's MAIL/RCPT/DATA group is written in a
+    single packet together with the previous message's content (RFC 2920), so
+    a message costs about one round trip. Otherwise messages are sent one after
+    another on the same session. A rejected sender, recipient or message only
+    fails that message; a dropped connection or protocol error is reopened and
+    the batch carries on.
+    """
+
+    def __init__(self, connect, sender, max_per_session=SMTP_MAX_MESSAGES_PER_SESSION):
+        self.connect = connect
+        self.sender = sender
+        self.max_per_session = max_per_session
+
+    def send(self, items, on_result=None):
+        """`items` is an iterable of (key, recipients, message_bytes); returns a SendResult per item, in order.
+
+        `on_result(result)` is called as soon as each message's outcome is
+        known, so callers can checkpoint it before the rest of the batch goes out.
+        """
+        items = [(key, [recipients] if isinstance(recipients, str) else list(recipients), message)
+                 for key, recipients, message in items]
+        results = []
+
+        def finish(result):
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+        while len(results) < len(items):
+            chunk = items[len(results):len(results) + self.max_per_session]
+            try:
+                with timer("smtp_session"):
+                    server = self.connect()
+            except Exception as e:
+                # No session means nothing in this chunk can go out
+                for key, recipients, _ in chunk:
+                    result = SendResult(key, recipients)
+                    result.error = f"connect failed: {e}"
+                    finish(result)
+                continue
+            in_flight = []
+            try:
+                server.ehlo_or_helo_if_needed()
+                if server.has_extn("pipelining"):
+                    self._send_pipelined(server, chunk, finish, in_flight)
+                else:
+                    self._send_sequential(server, chunk, finish, in_flight)
+            except Exception as e:
+                # The session is out of step: messages in flight have an unknown outcome and are
+                # reported failed rather than resent; the rest go out on a fresh connection
+                if not in_flight and len(results) < len(items):
+                    key, recipients, _ = items[len(results)]
+                    in_flight.append(SendResult(key, recipients))
+                for result in in_flight:
+                    result.error = result.error or f"session error: {e}"
+                    finish(result)
+            finally:
+                try:
+                    server.quit()
+                except Exception:
+                    server.close()
+        return results
+
+    def _send_sequential(self, server, chunk, finish, in_flight):
+        for key, recipients, message in chunk:
+            result = SendResult(key, recipients)
+            in_flight[:] = [result]
+            try:
+                with timer("smtp_send"):
+                    result.refused = server.sendmail(self.sender, recipients, message)
+            except smtplib.SMTPRecipientsRefused as e:
+                result.refused = e.recipients
+            except smtplib.SMTPResponseException as e:
+                result.error = f"{e.smtp_code} {e.smtp_error.decode(errors='ignore')}"
+                server.rset()
+            except smtplib.SMTPServerDisconnected:
+                raise
+            except (smtplib.SMTPException, UnicodeError, ValueError) as e:
+                # e.g. a non-ASCII address the server can't take; the transaction is reset and the batch goes on
+                result.error = f"{type(e).__name__}: {e}"
+                server.rset()
+            in_flight.clear()
+            finish(result)
+
+    def _envelope(self, recipients):
+        commands = [f"MAIL FROM:{smtplib.quoteaddr(self.sender)}"]
+        commands += [f"RCPT TO:{smtplib.quoteaddr(recipient)}" for recipient in recipients]
+        commands.append("DATA")
+        return ("\r\n".join(commands) + "\r\n").encode("ascii")
+
+    def _read_envelope_replies(self, server, result):
+        """Reads the MAIL, RCPT and DATA replies; returns True if the server is ready for content."""
+        code, reply = server.getreply()
+        if code != 250:
+            result.error = f"sender refused: {code} {reply.decode(errors='ignore')}"
+        for recipient in result.recipients:
+            code, reply = server.getreply()
+            if code not in (250, 251) and not result.error:
+                result.refused[recipient] = (code, reply)
+        code, reply = server.getreply()
+        if code == 354 and not result.error and len(result.refused) < len(result.recipients):
+            return True
+        if code == 354:
+            # Ready for data despite no usable recipient: end the empty transaction cleanly
+            server.send(b"." + CRLF)
+            server.getreply()
+        elif not result.error and len(result.refused) < len(result.recipients):
+            result.error = f"DATA refused: {code} {reply.decode(errors='ignore')}"
+        return False
+
+    def _send_pipelined(self, server, chunk, finish, in_flight):
+        # `carry` is written ahead of the next envelope: the previous message's content or an RSET
+        carry, awaiting = b"", None
+        for key, recipients, message in chunk:
+            result = SendResult(key, recipients)
+            try:
+                envelope = self._envelope(recipients)
+                data = _data_block(message)
+            except (UnicodeError, ValueError) as e:
+                # Nothing was written for this message, so the session is unaffected
+                result.error = f"{type(e).__name__}: {e}"
+                if awaiting is None:
+                    finish(result)
+                else:
+                    # Keep results in order: this one follows the message still awaiting its reply
+                    in_flight.append(result)
+                continue
+            in_flight.append(result)
+            with timer("smtp_send"):
+                server.send(carry + envelope)
+                if awaiting is not None:
+                    self._read_final_reply(server, awaiting)
+                elif carry:
+                    server.getreply()
+                # Everything ahead of the current message is settled now
+                while in_flight[0] is not result:
+                    finish(in_flight.pop(0))
+                ready = self._read_envelope_replies(server, result)
+            if ready:
+                carry, awaiting = data, result
+            else:
+                carry, awaiting = b"RSET" + CRLF, None
+                finish(in_flight.pop(0))
+        if awaiting is not None:
+            with timer("smtp_send"):
+                server.send(carry)
+                self._read_final_reply(server, awaiting)
+        elif carry:
+            server.send(carry)
+            server.getreply()
+        while in_flight:
+            finish(in_flight.pop(0))
+
+    def _read_final_reply(self, server, result):
+        code, reply = server.getreply()
+        if code != 250:
+            result.error = f"message refused: {code} {reply.decode(errors='ignore')}"
+
+def batched(items, size=SMTP_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
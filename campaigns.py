@@ -0,0 +1,204 @@
+import datetime
+import os
+from bson import ObjectId
+from pymongo import DESCENDING, InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+# ===============================
+# CONFIGURATION
+# ===============================
+CAMPAIGNS_COLLECTION = "campaigns"
+CAMPAIGN_RECIPIENTS_COLLECTION = "campaign_recipients"
+RECIPIENT_STATES = ("pending", "sending", "sent", "failed", "suppressed")
+# A run renews its lease as it goes; a lease left to expire means the run died and the campaign may be resumed
+CAMPAIGN_LEASE_SECONDS = int(os.getenv("CAMPAIGN_LEASE_SECONDS", 300))
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _campaign_id(campaign_id):
+    return campaign_id if isinstance(campaign_id, ObjectId) else ObjectId(campaign_id)
+
+# ===============================
+# DATABASE
+# ===============================
+def setup_campaign_indexes(db):
+    recipients = db[CAMPAIGN_RECIPIENTS_COLLECTION]
+    recipients.create_index([("campaign_id", 1), ("recipient", 1)], unique=True)
+    # Resume scans one campaign's unfinished recipients in draft order
+    recipients.create_index([("campaign_id", 1), ("status", 1), ("position", 1)])
+    db[CAMPAIGNS_COLLECTION].create_index([("status", 1), ("created_at", -1)])
+
+def create_campaign(db, drafts, name=None, sender=None):
+    """Stores a campaign and one pending recipient per draft; returns the campaign id.
+
+    `drafts` are dicts with 'to_email', 'subject' and 'body' (and optionally
+    'name'). A repeated address is only stored, and so only sent, once.
+    """
+    setup_campaign_indexes(db)
+    now = _now()
+    campaign_id = db[CAMPAIGNS_COLLECTION].insert_one({
+        "name": name or f"Outreach {now:%Y-%m-%d %H:%M}",
+        "sender": sender, "status": "pending", "total": 0,
+        "counts": {state: 0 for state in RECIPIENT_STATES},
+        "created_at": now, "updated_at": now,
+    }).inserted_id
+    operations = [
+        InsertOne({
+            "campaign_id": campaign_id, "position": position,
+            "recipient": draft["to_email"].strip().lower(), "name": draft.get("name"),
+            "subject": draft["subject"], "body": draft["body"],
+            "status": "pending", "attempts": 0, "message_id": None, "updated_at": now,
+        })
+        for position, draft in enumerate(drafts)
+    ]
+    if operations:
+        try:
+            db[CAMPAIGN_RECIPIENTS_COLLECTION].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate addresses hit the unique index; anything else is a real failure
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    refresh_campaign(db, campaign_id)
+    return campaign_id
+
+def get_campaign(db, campaign_id):
+    return db[CAMPAIGNS_COLLECTION].find_one({"_id": _campaign_id(campaign_id)})
+
+def list_unfinished_campaigns(db, limit=20):
+    return list(db[CAMPAIGNS_COLLECTION].find({"status": {"$ne": "completed"}})
+                .sort("created_at", DESCENDING).limit(limit))
+
+def is_campaign_leased(campaign):
+    """True while another run is sending the campaign and its lease has not expired."""
+    expires_at = campaign.get("lease_expires_at")
+    if campaign.get("status") != "sending" or expires_at is None:
+        return False
+    return expires_at.replace(tzinfo=datetime.timezone.utc) > _now()
+
+# ===============================
+# CAMPAIGN LEASE
+# ===============================
+def claim_campaign(db, campaign_id, owner):
+    """Takes the send lease on a campaign; returns the campaign, or None if a live run holds it.
+
+    Pending and incomplete campaigns can be claimed, as can one left 'sending'
+    by a run whose lease expired.
+    """
+    now = _now()
+    return db[CAMPAIGNS_COLLECTION].find_one_and_update(
+        {"_id": _campaign_id(campaign_id), "$or": [
+            {"status": {"$in": ["pending", "incomplete"]}},
+            {"status": "sending", "lease_expires_at": {"$not": {"$gt": now}}},
+        ]},
+        {"$set": {"status": "sending", "lease_owner": owner,
+                  "lease_expires_at": now + datetime.timedelta(seconds=CAMPAIGN_LEASE_SECONDS), "updated_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def renew_campaign_lease(db, campaign_id, owner):
+    """Extends the lease; returns False if this run no longer holds it."""
+    now = _now()
+    result = db[CAMPAIGNS_COLLECTION].update_one(
+        {"_id": _campaign_id(campaign_id), "status": "sending", "lease_owner": owner},
+        {"$set": {"lease_expires_at": now + datetime.timedelta(seconds=CAMPAIGN_LEASE_SECONDS), "updated_at": now}}
+    )
+    return result.matched_count == 1
+
+# ===============================
+# RECIPIENT STATE
+# ===============================
+def reconcile_in_flight(db, campaign_id):
+    """Settles recipients left in 'sending' by a crash, using the send log keyed by their Message-ID.
+
+    A logged success means the message went out; anything else is retried.
+    """
+    recipients = db[CAMPAIGN_RECIPIENTS_COLLECTION]
+    in_flight = list(recipients.find({"campaign_id": _campaign_id(campaign_id), "status": "sending"},
+                                     {"message_id": 1}))
+    if not in_flight:
+        return 0
+    logged = {
+        doc["message_id"]: doc["status"]
+        for doc in db.email_logs.find(
+            {"message_id": {"$in": [r["message_id"] for r in in_flight if r.get("message_id")]}},
+            {"message_id": 1, "status": 1}
+        )
+    }
+    for recipient in in_flight:
+        status = logged.get(recipient.get("message_id"))
+        new_status = "sent" if status == "success" else "failed" if status == "failed" else "pending"
+        recipients.update_one({"_id": recipient["_id"], "status": "sending"},
+                              {"$set": {"status": new_status, "updated_at": _now()}})
+    return len(in_flight)
+
+def unfinished_recipients(db, campaign_id, retry_failed=False, batch_size=500):
+    """Yields recipients still to send in draft order, a batch at a time.
+
+    Batches are keyed on `position` and served by the (campaign_id, status,
+    position) index, so a resumed 10k campaign goes straight to the first
+    unsent recipient.
+    """
+    states = ["pending", "failed"] if retry_failed else ["pending"]
+    last_position = -1
+    while True:
+        batch = list(db[CAMPAIGN_RECIPIENTS_COLLECTION].find({
+            "campaign_id": _campaign_id(campaign_id), "status": {"$in": states},
+            "position": {"$gt": last_position},
+        }).sort("position", 1).limit(batch_size))
+        if not batch:
+            return
+        yield batch
+        last_position = batch[-1]["position"]
+
+def count_unfinished(db, campaign_id, retry_failed=False):
+    states = ["pending", "failed"] if retry_failed else ["pending"]
+    return db[CAMPAIGN_RECIPIENTS_COLLECTION].count_documents(
+        {"campaign_id": _campaign_id(campaign_id), "status": {"$in": states}}
+    )
+
+def claim_recipient(db, recipient_id, message_id, states=("pending",)):
+    """Atomically moves a recipient from one of `states` to 'sending'; returns None if another run took it.
+
+    The Message-ID is stored with the claim so a crash mid-send can be reconciled.
+    """
+    return db[CAMPAIGN_RECIPIENTS_COLLECTION].find_one_and_update(
+        {"_id": recipient_id, "status": {"$in": list(states)}},
+        {"$set": {"status": "sending", "message_id": message_id, "updated_at": _now()}, "$inc": {"attempts": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def mark_recipient(db, recipient_id, status, message_id=None, error=None):
+    update = {"$set": {"status": status, "updated_at": _now()}}
+    if message_id:
+        update["$set"]["message_id"] = message_id
+    if error:
+        update["$set"]["error"] = error
+    db[CAMPAIGN_RECIPIENTS_COLLECTION].update_one({"_id": recipient_id}, update)
+
+# ===============================
+# CAMPAIGN STATE
+# ===============================
+def refresh_campaign(db, campaign_id, finished=False, owner=None):
+    """Recomputes per-state counts; a finished run completes the campaign unless failures remain.
+
+    A finished run also gives up its lease; `owner` makes sure only the lease holder settles the status.
+    """
+    campaign_id = _campaign_id(campaign_id)
+    counts = {state: 0 for state in RECIPIENT_STATES}
+    for doc in db[CAMPAIGN_RECIPIENTS_COLLECTION].aggregate([
+        {"$match": {"campaign_id": campaign_id}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]):
+        counts[doc["_id"]] = doc["count"]
+    update = {"$set": {"counts": counts, "total": sum(counts.values()), "updated_at": _now()}}
+    query = {"_id": campaign_id}
+    if finished:
+        update["$set"]["status"] = "completed" if not (counts["pending"] or counts["failed"] or counts["sending"]) \
+            else "incomplete"
+        update["$set"]["finished_at"] = _now()
+        update["$unset"] = {"lease_owner": "", "lease_expires_at": ""}
+        if owner:
+            query["lease_owner"] = owner
+    db[CAMPAIGNS_COLLECTION].update_one(query, update)
+    return counts
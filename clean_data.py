@@ -7,6 +7,8 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime
 import pytz
+from contact_dedup import ACTIVE_CONTACT_FILTER, count_golden_contacts
+from export_engine import cleanup_spool, export_collection
 
 # Load environment variables
 load_dotenv()
@@ -16,8 +18,12 @@ load_dotenv()
 # ===============================
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
-CLEANED_CSV_PATH = "cleaned_contacts.csv"
 CLEANED_COLLECTION_NAME = "cleaned_contacts"
+PAGE_SIZE = int(os.getenv("CLEANED_CONTACTS_PAGE_SIZE", 100))
+DISPLAY_COLUMNS = [
+    "name", "work_emails", "personal_emails", "phones",
+    "source", "source_url", "domain", "created_at"
+]
 
 # ===============================
 # DATABASE & DATA FUNCTIONS
@@ -35,34 +41,45 @@ def get_db_connection():
         return None, None
 
 
-def fetch_cleaned_contacts(db):
-    """Fetches records and ensures clean display with ordered columns."""
+@st.cache_data(ttl=30)
+def count_cleaned_contacts(_db):
+    """Returns the number of unmerged contacts without scanning the collection."""
     try:
-        cursor = db[CLEANED_COLLECTION_NAME].find().sort('_id', -1)
-        df = pd.DataFrame(list(cursor))
-        if df.empty:
-            return pd.DataFrame()
+        return count_golden_contacts(_db)
+    except Exception as error:
+        st.warning(f"⚠️ Could not count cleaned contacts. Error: {error}")
+        return 0
+
 
-        if '_id' in df.columns:
-            df = df.drop(columns=['_id'])
+def fetch_cleaned_contacts(db, before_id=None, page_size=PAGE_SIZE):
+    """Fetches one page of records, newest first, with only the displayed columns.
+
+    Returns the page, the `_id` to continue from for the next page (or None
+    when this is the last page).
+    """
+    try:
+        query = dict(ACTIVE_CONTACT_FILTER)
+        if before_id is not None:
+            query["_id"] = {"$lt": before_id}
+        projection = {col: 1 for col in DISPLAY_COLUMNS}
+        docs = list(db[CLEANED_COLLECTION_NAME].find(query, projection).sort('_id', -1).limit(page_size + 1))
+        next_id = docs[page_size - 1]["_id"] if len(docs) > page_size else None
+        df = pd.DataFrame(docs[:page_size])
+        if df.empty:
+            return pd.DataFrame(), None
 
-        desired_order = [
-            "name", "work_emails", "personal_emails", "phones",
-            "source", "source_url", "domain", "created_at"
-        ]
-        final_columns = [col for col in desired_order if col in df.columns]
-        return df[final_columns]
+        final_columns = [col for col in DISPLAY_COLUMNS if col in df.columns]
+        return df[final_columns], next_id
     except Exception as error:
         st.warning(f"⚠️ Could not fetch cleaned contacts. Error: {error}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
 
 
-def save_df_to_csv(df):
-    """Saves the DataFrame to a CSV file for download."""
-    if not df.empty:
-        df.to_csv(CLEANED_CSV_PATH, index=False)
-        return True
-    return False
+def export_cleaned_contacts_csv(db):
+    """Streams the displayed columns of the whole collection into a spooled CSV file."""
+    projection = {"_id": 0, **{col: 1 for col in DISPLAY_COLUMNS}}
+    return export_collection(db[CLEANED_COLLECTION_NAME], "csv", query=ACTIVE_CONTACT_FILTER,
+                             projection=projection, sort=[("_id", -1)])
 
 
 # ===============================
@@ -134,19 +151,24 @@ def main():
     col1, col2 = st.columns([1, 6])
     with col1:
         if st.button("🔄 Refresh Data"):
+            count_cleaned_contacts.clear()
+            st.session_state.cleaned_page_cursors = [None]
+            st.session_state.cleaned_page = 0
             st.rerun()
 
     client, db = get_db_connection()
     if not client:
         return
 
-    cleaned_df = fetch_cleaned_contacts(db)
-    client.close()
+    if 'cleaned_page_cursors' not in st.session_state:
+        st.session_state.cleaned_page_cursors = [None]
+        st.session_state.cleaned_page = 0
+    page = st.session_state.cleaned_page
+    total_contacts = count_cleaned_contacts(db)
+    cleaned_df, next_id = fetch_cleaned_contacts(db, st.session_state.cleaned_page_cursors[page])
 
     # --- DATA DISPLAY ---
     if not cleaned_df.empty:
-        csv_saved = save_df_to_csv(cleaned_df)
-
         # ✅ FIX TIMEZONE (India Time)
         india_tz = pytz.timezone("Asia/Kolkata")
         local_time = datetime.now(india_tz).strftime("%Y-%m-%d %H:%M:%S")
@@ -158,7 +180,7 @@ def main():
             st.markdown(f"""
                 <div class='metric-card'>
                     <h3>👥 Total Contacts</h3>
-                    <h2>{len(cleaned_df)}</h2>
+                    <h2>{total_contacts}</h2>
                 </div>
             """, unsafe_allow_html=True)
         with col2:
@@ -179,21 +201,49 @@ def main():
         st.markdown("### 📋 Contacts Data")
         st.dataframe(cleaned_df, use_container_width=True)
 
+        # --- PAGINATION ---
+        total_pages = max(1, -(-total_contacts // PAGE_SIZE))
+        p_col1, p_col2, p_col3 = st.columns([1, 4, 1])
+        with p_col1:
+            if st.button("⬅ Previous", disabled=page == 0):
+                st.session_state.cleaned_page -= 1
+                client.close()
+                st.rerun()
+        with p_col2:
+            st.caption(f"Page {page + 1} of ~{total_pages}")
+        with p_col3:
+            if st.button("Next ➡", disabled=next_id is None):
+                cursors = st.session_state.cleaned_page_cursors
+                del cursors[page + 1:]
+                cursors.append(next_id)
+                st.session_state.cleaned_page += 1
+                client.close()
+                st.rerun()
+
         # --- DOWNLOAD BUTTON ---
-        if csv_saved:
-            with open(CLEANED_CSV_PATH, "rb") as file:
-                st.download_button(
-                    label="📥 Download Cleaned Data (CSV)",
-                    data=file,
-                    file_name="cleaned_contacts.csv",
-                    mime="text/csv",
-                    key="download_button",
-                    use_container_width=True,
-                    type="primary"
-                )
+        if st.button("📦 Prepare CSV Download", use_container_width=True):
+            with st.spinner("Exporting cleaned contacts..."):
+                cleanup_spool()
+                export = export_cleaned_contacts_csv(db)
+            try:
+                with open(export["path"], "rb") as file:
+                    st.download_button(
+                        label=f"📥 Download Cleaned Data (CSV, {export['rows']} rows)",
+                        data=file,
+                        file_name="cleaned_contacts.csv",
+                        mime="text/csv",
+                        key="download_button",
+                        use_container_width=True,
+                        type="primary"
+                    )
+            finally:
+                # download_button has taken its own copy of the bytes, so the spool file can go
+                os.remove(export["path"])
     else:
         st.info("ℹ️ No unique contacts found yet. Go to **'Collect Contacts'** or **'AI Web Scraper'** to add some!")
 
+    client.close()
+
 
 if __name__ == '__main__':
     main()
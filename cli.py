@@ -0,0 +1,189 @@
+"""Headless entry point for the outreach pipeline, for cron, systemd timers or ad-hoc runs.
+
+    python cli.py scrape --query "dentists in new york" --num-results 10
+    python cli.py enrich --linkedin-url https://www.linkedin.com/in/someone
+    python cli.py generate --domain edtech --limit 50 --output drafts.json
+    python cli.py send --input drafts.json
+    python cli.py send --resume <campaign id>
+    python cli.py process-replies
+    python cli.py worker --metrics-port 9101
+"""
+import argparse
+import json
+import logging
+import sys
+from instrumentation import install_mongo_listener, start_metrics_server
+from reporting import LogReporter, report, set_reporter
+
+# ===============================
+# COMMANDS
+# ===============================
+def load_templates(db):
+    from email_templates import load_templates_from_db
+    try:
+        load_templates_from_db(db)
+    except Exception as e:
+        logging.getLogger("morphius").warning(f"Could not load email templates, using built-in defaults: {e}")
+
+def cmd_scrape(args):
+    from ai_webscraper import SERPAPI_API_KEY, get_db_connection, run_scrape
+    if not SERPAPI_API_KEY:
+        print("SERPAPI_API_KEY is not set.", file=sys.stderr)
+        return 1
+    client, db = get_db_connection()
+    if not client:
+        return 1
+    try:
+        df = run_scrape(db, args.query, args.num_results, progress=report.progress)
+        print(f"Scraped {len(df)} site(s) for '{args.query}'.")
+    finally:
+        client.close()
+    return 0
+
+def cmd_enrich(args):
+    from contactout import build_enrichment_payload, process_enrichment, setup_database_indexes
+    payload = build_enrichment_payload(args.linkedin_url, args.email, args.name, args.company, args.domain)
+    if not payload:
+        print("Give --linkedin-url, --email, --name with --company, or --domain.", file=sys.stderr)
+        return 2
+    setup_database_indexes()
+    enriched = process_enrichment(payload)
+    if not enriched:
+        return 1
+    print(json.dumps(enriched, default=str, indent=2))
+    return 0
+
+def cmd_generate(args):
+    from send_email import build_drafts, fetch_all_matching_contacts, get_db_connection
+    client, db = get_db_connection()
+    if not client:
+        return 1
+    try:
+        load_templates(db)
+        contacts = fetch_all_matching_contacts(db, args.domain)
+        if args.limit:
+            contacts = contacts[:args.limit]
+        drafts = build_drafts([(str(contact["mongo_id"]), contact) for contact in contacts], progress=report.progress)
+    finally:
+        client.close()
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(drafts, handle, default=str, indent=2)
+    print(f"Wrote {len(drafts)} draft(s) to {args.output}.")
+    return 0
+
+def cmd_send(args):
+    from campaigns import create_campaign, get_campaign
+    from email_preview import SENDER_EMAIL, get_db_connection, send_campaign
+    drafts = None
+    if not args.resume:
+        with open(args.input, encoding="utf-8") as handle:
+            drafts = json.load(handle)
+    client, db = get_db_connection()
+    if not client:
+        return 1
+    try:
+        campaign_id = args.resume or create_campaign(db, drafts, name=args.name, sender=SENDER_EMAIL)
+        outcome = send_campaign(db, campaign_id, progress=report.progress, retry_failed=args.retry_failed)
+        if outcome is None:
+            return 1
+        campaign = get_campaign(db, campaign_id)
+    finally:
+        client.close()
+    sent, skipped = outcome
+    counts = campaign.get("counts", {})
+    print(f"Sent {sent} email(s); {skipped} suppressed; {counts.get('failed', 0)} failed.")
+    # Scripts and cron rely on a non-zero exit unless every recipient was sent or suppressed
+    return 0 if campaign.get("status") == "completed" and not counts.get("failed") else 1
+
+def cmd_process_replies(args):
+    from reply import get_db_connection, run_automations, setup_database_indexes
+    client, db = get_db_connection()
+    if not client:
+        return 1
+    try:
+        setup_database_indexes(db)
+        load_templates(db)
+        summary = run_automations(db)
+    finally:
+        client.close()
+    print(f"Sent {summary['follow_ups']} follow-up(s); unsubscribed {summary['unsubscribes']} contact(s).")
+    return 0
+
+def cmd_worker(args):
+    from reply import get_db_connection, setup_database_indexes
+    from scheduler import default_worker_id, register_default_jobs, run_due_jobs, run_worker, setup_scheduler
+    client, db = get_db_connection()
+    if not client:
+        return 1
+    try:
+        start_metrics_server(args.metrics_port)
+        setup_database_indexes(db)
+        load_templates(db)
+        register_default_jobs()
+        if args.once:
+            setup_scheduler(db)
+            print(f"Ran {run_due_jobs(db, args.worker_id or default_worker_id())} due job(s).")
+        else:
+            run_worker(db, args.worker_id, args.poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+    return 0
+
+# ===============================
+# ARGUMENT PARSING
+# ===============================
+def build_parser():
+    parser = argparse.ArgumentParser(description="Morphius AI outreach pipeline (headless).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress as well as results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape = commands.add_parser("scrape", help="Search the web for a query and store scraped contacts.")
+    scrape.add_argument("--query", required=True)
+    scrape.add_argument("--num-results", type=int, default=5)
+    scrape.set_defaults(handler=cmd_scrape)
+
+    enrich = commands.add_parser("enrich", help="Enrich and store one contact via ContactOut.")
+    enrich.add_argument("--linkedin-url")
+    enrich.add_argument("--email")
+    enrich.add_argument("--name")
+    enrich.add_argument("--company")
+    enrich.add_argument("--domain", help="Company domain, e.g. apple.com")
+    enrich.set_defaults(handler=cmd_enrich)
+
+    generate = commands.add_parser("generate", help="Draft outreach emails for cleaned contacts into a JSON file.")
+    generate.add_argument("--domain", help="Only contacts whose domain matches this keyword.")
+    generate.add_argument("--limit", type=int, default=0, help="Draft at most this many contacts (0 = all).")
+    generate.add_argument("--output", default="drafts.json")
+    generate.set_defaults(handler=cmd_generate)
+
+    send = commands.add_parser("send", help="Send the drafts written by 'generate' as a campaign, or resume one.")
+    send.add_argument("--input", default="drafts.json")
+    send.add_argument("--name", help="Campaign name (defaults to the current time).")
+    send.add_argument("--resume", metavar="CAMPAIGN_ID", help="Resume an unfinished campaign instead.")
+    send.add_argument("--retry-failed", action="store_true", help="With --resume, also retry failed recipients.")
+    send.set_defaults(handler=cmd_send)
+
+    replies = commands.add_parser("process-replies", help="Handle the inbox, follow-ups and unresponsive contacts.")
+    replies.set_defaults(handler=cmd_process_replies)
+
+    worker = commands.add_parser("worker", help="Run scheduled automations (inbox, follow-ups, unsubscribes).")
+    worker.add_argument("--once", action="store_true", help="Run whatever is due now and exit (for cron).")
+    worker.add_argument("--worker-id", help="Lock owner name; defaults to host-pid-random.")
+    worker.add_argument("--poll-seconds", type=float, default=5.0)
+    worker.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus /metrics on this port (off by default; must differ from the app's).")
+    worker.set_defaults(handler=cmd_worker)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    set_reporter(LogReporter())
+    install_mongo_listener()
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
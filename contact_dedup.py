@@ -0,0 +1,210 @@
+import datetime
+import difflib
+import os
+import re
+from pymongo import UpdateMany, UpdateOne
+from dotenv import load_dotenv
+from contact_schema import normalize_emails, normalize_phones
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+CLEANED_COLLECTION_NAME = "cleaned_contacts"
+MAX_CANDIDATES = int(os.getenv("DEDUP_MAX_CANDIDATES", 200))
+NAME_SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_NAME_SIMILARITY", 0.9))
+MERGE_PROJECTION = {
+    "name": 1, "domain": 1, "source": 1, "source_url": 1, "created_at": 1,
+    "work_emails": 1, "personal_emails": 1, "emails": 1, "phones": 1,
+    "sources": 1, "source_urls": 1, "merged_from": 1,
+}
+# Only golden (unmerged) records take part in matching
+ACTIVE_CONTACT_FILTER = {"merged_into": {"$exists": False}}
+
+# ===============================
+# BLOCKING KEYS
+# ===============================
+def registrable_domain(value):
+    """Reduces a URL or host name to a bare lowercase domain without 'www.'."""
+    if not value:
+        return None
+    host = re.sub(r"^[a-z][a-z0-9+.-]*://", "", str(value).strip().lower()).split("/")[0].split(":")[0]
+    if host.startswith("www."):
+        host = host[4:]
+    # LinkedIn profile URLs say nothing about the person's company
+    if not host or host.endswith("linkedin.com"):
+        return None
+    return host
+
+def normalize_name(name):
+    if not name:
+        return None
+    cleaned = re.sub(r"[^\w\s]", " ", str(name).lower())
+    return " ".join(cleaned.split()) or None
+
+def linkedin_profile(value):
+    """Reduces a LinkedIn profile URL to its lowercase path (e.g. 'in/someone'), or None."""
+    if not value:
+        return None
+    url = re.sub(r"^[a-z][a-z0-9+.-]*://", "", str(value).strip().lower())
+    host, _, path = url.partition("/")
+    if not host.split(":")[0].endswith("linkedin.com"):
+        return None
+    path = path.split("?")[0].split("#")[0].strip("/")
+    return path if path.startswith("in/") else None
+
+def contact_domain(contact):
+    return registrable_domain(contact.get("domain")) or registrable_domain(contact.get("source_url"))
+
+def exact_keys(contact):
+    """Returns the blocking keys that identify one person on their own: email addresses and LinkedIn profile."""
+    keys = [f"email:{address}" for address in normalize_emails(contact.get("emails"))]
+    profile = linkedin_profile(contact.get("source_url"))
+    if profile:
+        keys.append(f"linkedin:{profile}")
+    return keys
+
+def blocking_keys(contact):
+    """Returns the keys a contact is indexed under for candidate lookup."""
+    keys = exact_keys(contact)
+    # Phones only match alongside a similar name, and switchboard numbers are shared widely
+    keys += [f"phone:{phone}" for phone in normalize_phones(contact.get("phones"))]
+    name = normalize_name(contact.get("name"))
+    domain = contact_domain(contact)
+    if domain:
+        keys.append(f"domain:{domain}")
+    if name:
+        keys.append(f"name:{name}")
+    return keys
+
+# ===============================
+# MATCHING
+# ===============================
+def is_same_entity(a, b):
+    """Decides whether two candidate records describe the same person or company."""
+    if set(normalize_emails(a.get("emails"))) & set(normalize_emails(b.get("emails"))):
+        return True
+    profile_a = linkedin_profile(a.get("source_url"))
+    if profile_a and profile_a == linkedin_profile(b.get("source_url")):
+        return True
+    name_a, name_b = normalize_name(a.get("name")), normalize_name(b.get("name"))
+    if not name_a or not name_b:
+        return False
+    names_match = difflib.SequenceMatcher(None, name_a, name_b).ratio() >= NAME_SIMILARITY_THRESHOLD
+    if not names_match:
+        return False
+    domain_a, domain_b = contact_domain(a), contact_domain(b)
+    if domain_a and domain_a == domain_b:
+        return True
+    return bool(set(a.get("phones") or []) & set(b.get("phones") or []))
+
+def find_candidates(db, contact):
+    """Indexed lookup of golden records sharing at least one blocking key with `contact`.
+
+    Records sharing an exact key are always returned; the phone, name and
+    domain blocks can be huge (a switchboard number, a common name, a big
+    company), so only the oldest MAX_CANDIDATES of those are considered.
+    """
+    collection = db[CLEANED_COLLECTION_NAME]
+    exact = exact_keys(contact)
+    fuzzy = [key for key in blocking_keys(contact) if key not in exact]
+    candidates = []
+    if exact:
+        query = {**ACTIVE_CONTACT_FILTER, "blocking_keys": {"$in": exact}, "_id": {"$ne": contact["_id"]}}
+        candidates = list(collection.find(query, MERGE_PROJECTION))
+    if fuzzy:
+        seen = [contact["_id"]] + [doc["_id"] for doc in candidates]
+        query = {**ACTIVE_CONTACT_FILTER, "blocking_keys": {"$in": fuzzy}, "_id": {"$nin": seen}}
+        candidates += list(collection.find(query, MERGE_PROJECTION).sort("_id", 1).limit(MAX_CANDIDATES))
+    return candidates
+
+def _union(*lists):
+    merged = []
+    for values in lists:
+        for value in values or []:
+            if value and value not in merged:
+                merged.append(value)
+    return merged
+
+def merge_contacts(records):
+    """Combines matched records into the fields of one golden contact (the oldest record)."""
+    golden, *others = sorted(records, key=lambda doc: doc["_id"])
+    work = _union(*(doc.get("work_emails") for doc in [golden] + others))
+    personal = [address for address in _union(*(doc.get("personal_emails") for doc in [golden] + others))
+                if address not in work]
+    merged = {
+        "name": golden.get("name") or next((doc.get("name") for doc in others if doc.get("name")), None),
+        "domain": golden.get("domain") or next((doc.get("domain") for doc in others if doc.get("domain")), None),
+        "work_emails": work,
+        "personal_emails": personal,
+        "emails": work + personal,
+        "phones": _union(*(doc.get("phones") for doc in [golden] + others)),
+        "sources": _union(*([doc.get("source")] + (doc.get("sources") or []) for doc in [golden] + others)),
+        "source_urls": _union(*([doc.get("source_url")] + (doc.get("source_urls") or []) for doc in [golden] + others)),
+        "merged_from": _union(golden.get("merged_from"), *([doc["_id"]] + (doc.get("merged_from") or []) for doc in others)),
+    }
+    merged["blocking_keys"] = blocking_keys(merged)
+    return golden, others, merged
+
+# ===============================
+# RESOLUTION
+# ===============================
+def count_golden_contacts(db):
+    """Counts unmerged contacts from collection metadata plus the sparse merged_into index."""
+    collection = db[CLEANED_COLLECTION_NAME]
+    return collection.estimated_document_count() - collection.count_documents({"merged_into": {"$exists": True}})
+
+def setup_dedup_indexes(db):
+    db[CLEANED_COLLECTION_NAME].create_index("blocking_keys")
+    db[CLEANED_COLLECTION_NAME].create_index("merged_into", sparse=True)
+
+def resolve_contact(db, contact_id):
+    """Matches one contact against existing golden records and merges it if it is a duplicate.
+
+    Returns the `_id` of the golden record the contact now belongs to.
+    """
+    collection = db[CLEANED_COLLECTION_NAME]
+    contact = collection.find_one({"_id": contact_id, **ACTIVE_CONTACT_FILTER}, MERGE_PROJECTION)
+    if not contact:
+        doc = collection.find_one({"_id": contact_id}, {"merged_into": 1})
+        return doc.get("merged_into") if doc else None
+
+    matches = [candidate for candidate in find_candidates(db, contact) if is_same_entity(contact, candidate)]
+    if not matches:
+        collection.update_one({"_id": contact_id}, {"$set": {"blocking_keys": blocking_keys(contact)}})
+        return contact_id
+
+    golden, others, merged = merge_contacts([contact] + matches)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    operations = [UpdateOne({"_id": golden["_id"]}, {"$set": {**merged, "updated_at": now}})]
+    operations += [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"merged_into": golden["_id"], "merged_at": now}})
+        for doc in others
+    ]
+    # Records previously merged into a now-absorbed golden record follow it
+    operations.append(UpdateMany(
+        {"merged_into": {"$in": [doc["_id"] for doc in others]}},
+        {"$set": {"merged_into": golden["_id"]}}
+    ))
+    collection.bulk_write(operations, ordered=True)
+    return golden["_id"]
+
+def resolve_all(db, batch_size=500):
+    """Backfills blocking keys and merges duplicates across the existing collection, oldest first."""
+    setup_dedup_indexes(db)
+    merged = 0
+    cursor = db[CLEANED_COLLECTION_NAME].find(ACTIVE_CONTACT_FILTER, {"_id": 1}).sort("_id", 1).batch_size(batch_size)
+    for doc in cursor:
+        if resolve_contact(db, doc["_id"]) != doc["_id"]:
+            merged += 1
+    return merged
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    count = resolve_all(client[os.getenv("MONGO_DB_NAME")])
+    print(f"Merged {count} duplicate contact(s).")
+    client.close()
@@ -0,0 +1,143 @@
+import os
+import re
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+CLEANED_COLLECTION_NAME = "cleaned_contacts"
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv("DEFAULT_PHONE_COUNTRY_CODE", "91")
+LIST_SEPARATORS = re.compile(r"[,;]")
+
+# ===============================
+# NORMALIZATION
+# ===============================
+def split_values(value):
+    """Accepts a comma-joined string, a list or None and returns the non-empty stripped items."""
+    if isinstance(value, str):
+        items = LIST_SEPARATORS.split(value)
+    elif isinstance(value, (list, tuple, set)):
+        items = value
+    else:
+        # None, or NaN from a DataFrame row
+        return []
+    return [str(item).strip() for item in items if item is not None and str(item).strip()]
+
+def normalize_emails(value):
+    """Returns lowercased, de-duplicated email addresses in their original order."""
+    seen = []
+    for item in split_values(value):
+        address = item.lower()
+        if "@" in address and address not in seen:
+            seen.append(address)
+    return seen
+
+def normalize_phone(raw, default_country_code=DEFAULT_PHONE_COUNTRY_CODE):
+    """Converts a phone number to E.164 (+<country><number>), or None if it can't be interpreted."""
+    raw = raw.strip()
+    digits = re.sub(r"\D", "", raw)
+    if raw.startswith("+"):
+        number = digits
+    elif digits.startswith("00"):
+        number = digits[2:]
+    elif len(digits) == 11 and digits.startswith("0"):
+        # National format with a trunk prefix, e.g. 0 98765 43210
+        number = default_country_code + digits[1:]
+    elif len(digits) == 10:
+        number = default_country_code + digits
+    else:
+        number = digits
+    # Country codes never start with 0, so anything else is a number we can't place
+    if number.startswith("0") or not 8 <= len(number) <= 15:
+        return None
+    return f"+{number}"
+
+def normalize_phones(value):
+    seen = []
+    for item in split_values(value):
+        phone = normalize_phone(item)
+        if phone and phone not in seen:
+            seen.append(phone)
+    return seen
+
+def normalize_domain(value):
+    """Lowercases a domain or URL to a bare host without scheme, 'www.', port or path."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    host = re.sub(r"^[a-z][a-z0-9+.-]*://", "", value.strip().lower()).split("/")[0].split(":")[0]
+    if host.startswith("www."):
+        host = host[4:]
+    return host or None
+
+def normalize_contact_fields(work_emails=None, personal_emails=None, phones=None):
+    """Builds the array-typed email and phone fields stored on a contact.
+
+    `emails` is the union of work and personal addresses and carries the
+    multikey index used for lookups by address.
+    """
+    work = normalize_emails(work_emails)
+    personal = [address for address in normalize_emails(personal_emails) if address not in work]
+    return {
+        "work_emails": work,
+        "personal_emails": personal,
+        "emails": work + personal,
+        "phones": normalize_phones(phones),
+    }
+
+def primary_email(contact):
+    """Returns the address to write to: the first work email, else the first personal one."""
+    emails = normalize_emails(contact.get("work_emails")) or normalize_emails(contact.get("personal_emails"))
+    return emails[0] if emails else None
+
+# ===============================
+# DATABASE
+# ===============================
+def setup_contact_schema_indexes(db):
+    db[CLEANED_COLLECTION_NAME].create_index("emails")
+
+def find_contact_by_email(db, email_addr, projection=None):
+    """Indexed point lookup of a contact by any of its addresses."""
+    return db[CLEANED_COLLECTION_NAME].find_one({"emails": email_addr.strip().lower()}, projection)
+
+def migrate_contacts(db, batch_size=1000):
+    """Converts legacy comma-joined contact fields to the normalized array schema and lowercases domains.
+
+    Only documents still holding string fields or lacking `emails` are
+    touched, so the migration can be re-run safely. Returns the number of
+    documents updated.
+    """
+    setup_contact_schema_indexes(db)
+    legacy = {"$or": [
+        {"work_emails": {"$type": "string"}},
+        {"personal_emails": {"$type": "string"}},
+        {"phones": {"$type": "string"}},
+        {"emails": {"$exists": False}},
+        # Anything normalize_domain would change: capitals, 'www.', a scheme, port or path
+        {"domain": {"$regex": "[A-Z]|^www\\.|[:/]"}},
+    ]}
+    projection = {"work_emails": 1, "personal_emails": 1, "phones": 1, "domain": 1}
+    migrated = 0
+    operations = []
+    for doc in db[CLEANED_COLLECTION_NAME].find(legacy, projection).batch_size(batch_size):
+        fields = normalize_contact_fields(doc.get("work_emails"), doc.get("personal_emails"), doc.get("phones"))
+        if doc.get("domain"):
+            fields["domain"] = normalize_domain(doc["domain"])
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            migrated += db[CLEANED_COLLECTION_NAME].bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        migrated += db[CLEANED_COLLECTION_NAME].bulk_write(operations, ordered=False).modified_count
+    return migrated
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    count = migrate_contacts(client[os.getenv("MONGO_DB_NAME")])
+    print(f"Migrated {count} contact(s) to the normalized schema.")
+    client.close()
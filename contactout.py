@@ -5,6 +5,11 @@ from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, OperationFailure
 from dotenv import load_dotenv
 import datetime
+from contact_dedup import resolve_contact, setup_dedup_indexes
+from contact_schema import normalize_contact_fields, normalize_domain, setup_contact_schema_indexes
+from instrumentation import timed
+from reporting import report
+from single_flight import flight_key, get_single_flight, normalize_url
 
 # ===============================
 # CONFIGURATION
@@ -17,14 +22,10 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 API_BASE = "https://api.contactout.com/v1/people/enrich"
 
 RAW_CONTACTOUT_COLLECTION = "contacts"
+INCLUDE_FIELDS = ["work_email", "personal_email", "phone"]
 CLEANED_COLLECTION_NAME = "cleaned_contacts"
 
-# ===============================
-# PAGE CONFIG & STYLING
-# ===============================
-st.set_page_config(page_title="Contact Information Collector", page_icon="📇", layout="centered")
-
-st.markdown("""
+PAGE_STYLE = """
     <style>
         /* General app style */
         .main {
@@ -73,27 +74,45 @@ st.markdown("""
         }
         footer {visibility: hidden;}
     </style>
-""", unsafe_allow_html=True)
+"""
 
 # ===============================
 # UTILITIES
 # ===============================
+@timed()
 def enrich_people(payload):
     headers = {
         "Content-Type": "application/json",
         "Accept": "application/json",
         "token": CONTACTOUT_API_TOKEN
     }
-    with st.spinner("🔄 Calling ContactOut API..."):
-        try:
-            resp = requests.post(API_BASE, headers=headers, json=payload)
-            if resp.status_code != 200:
-                st.error(f"❌ API Error {resp.status_code}")
-                st.json(resp.json())
-            return resp.status_code, resp.json()
-        except Exception as e:
-            st.error(f"A network error occurred: {e}")
-            return None, None
+    try:
+        resp = requests.post(API_BASE, headers=headers, json=payload)
+        if resp.status_code != 200:
+            report.error(f"❌ API Error {resp.status_code}: {resp.text[:500]}")
+        return resp.status_code, resp.json()
+    except Exception as e:
+        report.error(f"A network error occurred: {e}")
+        return None, None
+
+def enrichment_key(payload):
+    """Identifies an enrichment request; LinkedIn URLs are normalized so spelling variants coalesce."""
+    key = dict(payload)
+    if key.get("linkedin_url"):
+        key["linkedin_url"] = normalize_url(key["linkedin_url"])
+    return flight_key("contactout", key)
+
+def enrich_people_once(payload):
+    """Calls `enrich_people` unless the same enrichment is already in flight, then shares its result.
+
+    Only found / not-found answers are shared across processes; errors are retried by the next caller.
+    """
+    status, response = get_single_flight().do(
+        enrichment_key(payload),
+        lambda: enrich_people(payload),
+        shareable=lambda result: result[0] in (200, 404)
+    )
+    return status, response
 
 def extract_relevant_fields(response, original_payload={}):
     profile = response.get("profile", response)
@@ -102,10 +121,12 @@ def extract_relevant_fields(response, original_payload={}):
     return {
         "name": profile.get("full_name"),
         "source_url": linkedin_url.rstrip('/'),
-        "work_emails": ", ".join(profile.get("work_email", [])),
-        "personal_emails": ", ".join(profile.get("personal_email", [])),
-        "phones": ", ".join(profile.get("phone", [])),
-        "domain": profile.get("company", {}).get("domain") if profile.get("company") else None,
+        **normalize_contact_fields(
+            work_emails=profile.get("work_email", []),
+            personal_emails=profile.get("personal_email", []),
+            phones=profile.get("phone", [])
+        ),
+        "domain": normalize_domain(profile.get("company", {}).get("domain")) if profile.get("company") else None,
         "source": "ContactOut",
         "created_at": datetime.datetime.now(datetime.timezone.utc)
     }
@@ -117,7 +138,7 @@ def get_db_connection():
         db = client[MONGO_DB_NAME]
         return client, db
     except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
+        report.error(f"❌ **Database Connection Error:** {e}")
         return None, None
 
 def setup_database_indexes():
@@ -125,6 +146,8 @@ def setup_database_indexes():
     if not client: return
     try:
         db[CLEANED_COLLECTION_NAME].create_index("source_url", unique=True)
+        setup_contact_schema_indexes(db)
+        setup_dedup_indexes(db)
     except OperationFailure:
         pass
     finally:
@@ -133,14 +156,14 @@ def setup_database_indexes():
 def save_to_raw_log(db, data):
     try:
         db[RAW_CONTACTOUT_COLLECTION].insert_one(data)
-        st.success(f"✅ Saved '{data.get('name')}' to raw contacts log.")
+        report.success(f"✅ Saved '{data.get('name')}' to raw contacts log.")
     except Exception as e:
-        st.error(f"❌ Error during raw save operation: {e}")
+        report.error(f"❌ Error during raw save operation: {e}")
 
 def save_to_cleaned_mongo(db, dict_data):
     source_url = dict_data.get("source_url")
     if not source_url:
-        st.warning("⚠️ Skipped saving to cleaned contacts: Source URL is missing.")
+        report.warning("⚠️ Skipped saving to cleaned contacts: Source URL is missing.")
         return
     try:
         result = db[CLEANED_COLLECTION_NAME].update_one(
@@ -149,39 +172,64 @@ def save_to_cleaned_mongo(db, dict_data):
             upsert=True
         )
         if result.upserted_id:
-            st.success(f"✨ New contact added: {dict_data.get('name')}")
+            golden_id = resolve_contact(db, result.upserted_id)
+            if golden_id != result.upserted_id:
+                report.info(f"🔗 '{dict_data.get('name')}' matches an existing contact; merged into it.")
+            else:
+                report.success(f"✨ New contact added: {dict_data.get('name')}")
         else:
-            st.info(f"ℹ️ Contact already exists: {dict_data.get('name')}")
+            report.info(f"ℹ️ Contact already exists: {dict_data.get('name')}")
     except Exception as e:
-        st.error(f"❌ Error during cleaned save operation: {e}")
+        report.error(f"❌ Error during cleaned save operation: {e}")
+
+def build_enrichment_payload(linkedin_url=None, email=None, full_name=None, company=None, company_domain=None):
+    """Returns the ContactOut request for whichever input was given, or None."""
+    if linkedin_url:
+        return {"linkedin_url": linkedin_url, "include": INCLUDE_FIELDS}
+    if email:
+        return {"email": email, "include": INCLUDE_FIELDS}
+    if full_name and company:
+        return {"full_name": full_name, "company": [company], "include": INCLUDE_FIELDS}
+    if company_domain:
+        return {"company_domain": company_domain, "include": INCLUDE_FIELDS}
+    return None
 
 def process_enrichment(payload):
+    """Enriches one contact and stores it. Returns the enriched record, or None."""
     if not payload:
-        st.warning("⚠️ No valid input provided.")
-        return
-    status, response = enrich_people(payload)
+        report.warning("⚠️ No valid input provided.")
+        return None
+    status, response = enrich_people_once(payload)
     if status != 200 or not isinstance(response, dict):
-        if status == 404: st.warning("🟡 Contact Not Found.")
-        return
+        if status == 404: report.warning("🟡 Contact Not Found.")
+        return None
 
     enriched_data = extract_relevant_fields(response, payload)
-    st.markdown("### ✅ Enriched Data:")
-    st.json(enriched_data)
 
     client, db = get_db_connection()
-    if not client: return
+    if not client: return enriched_data
     try:
         save_to_raw_log(db, enriched_data)
         save_to_cleaned_mongo(db, enriched_data)
     except Exception as error:
-        st.error(f"❌ Error during database operation: {error}")
+        report.error(f"❌ Error during database operation: {error}")
     finally:
         client.close()
+    return enriched_data
 
 # ===============================
 # MAIN APP
 # ===============================
+def show_enrichment(payload):
+    with st.spinner("🔄 Calling ContactOut API..."):
+        enriched_data = process_enrichment(payload)
+    if enriched_data:
+        st.markdown("### ✅ Enriched Data:")
+        st.json(enriched_data)
+
 def main():
+    st.set_page_config(page_title="Contact Information Collector", page_icon="📇", layout="centered")
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
     st.markdown("<h1>📇 Contact Information Collector</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align:center; color:#555;'>Enrich professional data effortlessly using ContactOut API.</p>", unsafe_allow_html=True)
     setup_database_indexes()
@@ -192,39 +240,32 @@ def main():
         ("LinkedIn URL", "Email", "Name + Company", "Company Domain")
     )
 
-    include_fields = ["work_email", "personal_email", "phone"]
-    payload = {}
-
     # Input fields styled in cards
     with st.container():
         if choice == 'LinkedIn URL':
             linkedin_url = st.text_input("🔗 Enter LinkedIn URL:")
             if st.button("✨ Enrich from LinkedIn URL"):
                 if linkedin_url:
-                    payload = {"linkedin_url": linkedin_url, "include": include_fields}
-                    process_enrichment(payload)
+                    show_enrichment(build_enrichment_payload(linkedin_url=linkedin_url))
 
         elif choice == 'Email':
             email = st.text_input("📧 Enter Email Address:")
             if st.button("✨ Enrich from Email"):
                 if email:
-                    payload = {"email": email, "include": include_fields}
-                    process_enrichment(payload)
+                    show_enrichment(build_enrichment_payload(email=email))
 
         elif choice == 'Name + Company':
             name = st.text_input("👤 Full Name:")
             company = st.text_input("🏢 Company Name:")
             if st.button("✨ Enrich from Name + Company"):
                 if name and company:
-                    payload = {"full_name": name, "company": [company], "include": include_fields}
-                    process_enrichment(payload)
+                    show_enrichment(build_enrichment_payload(full_name=name, company=company))
 
         elif choice == 'Company Domain':
             domain = st.text_input("🌐 Company Domain (e.g. apple.com):")
             if st.button("✨ Enrich from Company Domain"):
                 if domain:
-                    payload = {"company_domain": domain, "include": include_fields}
-                    process_enrichment(payload)
+                    show_enrichment(build_enrichment_payload(company_domain=domain))
 
     
 
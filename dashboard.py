@@ -3,11 +3,13 @@ import pandas as pd
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 import plotly.express as px
-import time
 import datetime
 import os
 from dotenv import load_dotenv
 from zoneinfo import ZoneInfo # For modern timezone handling
+from live_metrics import LiveMetricsFeed
+from analytics_rollup import (COUNTER_FIELDS, ROLLUP_COLLECTION, backfill_rollups, bucket_start, classify_event,
+                              fetch_rollups, interest_counts, setup_rollup_indexes, total_rollups)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,25 +24,116 @@ DISPLAY_TIMEZONE = "Asia/Kolkata" # Set the target timezone for display
 # ===============================
 # DATABASE FUNCTIONS
 # ===============================
+LIVE_POLL_INTERVAL_SECONDS = int(os.getenv("LIVE_POLL_INTERVAL_SECONDS", 5))
+ACTIVITY_LOG_PAGE_SIZE = int(os.getenv("ACTIVITY_LOG_PAGE_SIZE", 100))
+ACTIVITY_LOG_PROJECTION = {"body": 0}
+
 @st.cache_resource
 def init_connection():
-    """Initializes and returns a MongoDB client."""
+    """Initializes and returns a MongoDB client, making sure the metric indexes exist."""
     try:
         client = MongoClient(MONGO_URI)
         client.admin.command('ismaster')
+        db = client[MONGO_DB_NAME]
+        db.email_logs.create_index([("event_type", 1), ("interest_level", 1)])
+        db.email_logs.create_index([("timestamp", -1)])
+        setup_rollup_indexes(db)
+        # Headline counts are read from the rollups, so build them once if they were never backfilled
+        # (or predate the per-event-type tallies)
+        if (db[ROLLUP_COLLECTION].find_one({"events": {"$exists": True}}, {"_id": 1}) is None
+                and db.email_logs.find_one({}, {"_id": 1})):
+            backfill_rollups(db)
         return client
     except ConnectionFailure as e:
         st.error(f"❌ **Database Connection Error:** {e}")
         return None
 
+def build_metrics_pipeline(since, with_ids=False):
+    """Groups the events logged since `since` by the fields the rollup counters are keyed on."""
+    group = {
+        '_id': {'event_type': '$event_type', 'status': '$status', 'interest_level': '$interest_level'},
+        'count': {'$sum': 1}
+    }
+    if with_ids:
+        group['ids'] = {'$push': '$_id'}
+    return [{'$match': {'timestamp': {'$gte': since}}}, {'$group': group}]
+
+def summarize_metrics(event_counts, interest_counts):
+    """Derives the dashboard's headline numbers from per-event and per-interest counts."""
+    total_sent = event_counts.get('initial_outreach', 0)
+    total_replies = sum(count for event, count in event_counts.items() if str(event).startswith('replied_'))
+    return {
+        "total_events": sum(event_counts.values()),
+        "total_sent": total_sent,
+        "total_replies": total_replies,
+        "total_follow_ups": event_counts.get('follow_up_sent', 0),
+        "positive_replies": interest_counts.get('positive', 0),
+        "negative_replies": interest_counts.get('negative', 0),
+        "reply_rate": (total_replies / total_sent * 100) if total_sent > 0 else 0,
+        "event_counts": dict(event_counts),
+        "interest_counts": dict(interest_counts),
+    }
+
+def aggregate_counts(db, until=None, with_ids=False):
+    """Returns (event_counts, interest_counts, counted_ids) without scanning the whole email log.
+
+    Days before `until` come from the daily rollup buckets; events from that
+    day on are read from email_logs through the timestamp index, and their
+    `_id`s are returned when `with_ids` is set so the live feed can skip them.
+    """
+    until = until or datetime.datetime.now(datetime.timezone.utc)
+    today = bucket_start(until, "day")
+    counts, event_counts = total_rollups(db, "day", today)
+    counted_ids = set()
+    for doc in db.email_logs.aggregate(build_metrics_pipeline(today, with_ids)):
+        event_type = doc['_id'].get('event_type')
+        if event_type is not None:
+            event_counts[event_type] = event_counts.get(event_type, 0) + doc['count']
+        field = classify_event(**doc['_id'])
+        if field in counts:
+            counts[field] += doc['count']
+        counted_ids.update(doc.get('ids', []))
+    return event_counts, interest_counts(counts), counted_ids
+
+def count_log_events(_client):
+    """Total documents in email_logs, read from collection metadata."""
+    try:
+        return _client[MONGO_DB_NAME].email_logs.estimated_document_count()
+    except Exception:
+        return 0
+
 @st.cache_data(ttl=10)
-def load_data(_client):
-    """Loads email log data from MongoDB and converts timestamps to the local timezone."""
+def load_metrics(_client):
+    """Computes funnel, metric and sentiment counts from the rollups plus today's events."""
+    if _client is None:
+        return summarize_metrics({}, {})
+    try:
+        events, interests, _ = aggregate_counts(_client[MONGO_DB_NAME])
+        return summarize_metrics(events, interests)
+    except Exception as e:
+        st.warning(f"Could not load metrics. Error: {e}")
+        return summarize_metrics({}, {})
+
+@st.cache_resource
+def get_live_feed(_client):
+    """Starts one shared change-stream (or polling) feed per server process."""
+    db = _client[MONGO_DB_NAME]
+    return LiveMetricsFeed(db.email_logs, lambda until: aggregate_counts(db, until, with_ids=True),
+                           poll_interval=LIVE_POLL_INTERVAL_SECONDS).start()
+
+@st.cache_data(max_entries=32)
+def load_activity_log(_client, page=0, version=None, page_size=ACTIVITY_LOG_PAGE_SIZE):
+    """Loads one page of the activity log (newest first) without email bodies.
+
+    `version` is part of the cache key: the live feed bumps it when new events
+    arrive, so an idle dashboard never re-queries the log.
+    """
     if _client is None:
         return pd.DataFrame()
     try:
         db = _client[MONGO_DB_NAME]
-        cursor = db.email_logs.find().sort('timestamp', -1)
+        cursor = (db.email_logs.find({}, ACTIVITY_LOG_PROJECTION)
+                  .sort('timestamp', -1).skip(page * page_size).limit(page_size))
         df = pd.DataFrame(list(cursor))
         if not df.empty and 'timestamp' in df.columns:
             # --- TIMEZONE FIX ---
@@ -56,35 +149,44 @@ def load_data(_client):
 # ===============================
 # MAIN STREAMLIT APP
 # ===============================
-def main():
-    st.set_page_config(page_title="Email Campaign Dashboard", page_icon="📊", layout="wide")
-    st.title("📊 Email Campaign Dashboard")
-
-    st.sidebar.title("⚙️ Settings")
-    auto_refresh_interval = st.sidebar.slider("Auto-refresh every (seconds)", 5, 60, 10, key="refresh_slider")
+@st.cache_data(max_entries=32)
+def load_rollup_series(_client, granularity, days, version=None):
+    """Loads pre-aggregated counters for the last `days` days as one row per time bucket."""
+    if _client is None:
+        return pd.DataFrame()
+    try:
+        since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+        docs = fetch_rollups(_client[MONGO_DB_NAME], granularity, since)
+        rows = [{"bucket": doc["bucket"], **doc.get("counts", {})} for doc in docs]
+        df = pd.DataFrame(rows, columns=["bucket"] + COUNTER_FIELDS)
+        if df.empty:
+            return df
+        df = df.fillna(0).groupby("bucket", as_index=False).sum()
+        df["bucket"] = pd.to_datetime(df["bucket"]).dt.tz_localize('UTC').dt.tz_convert(DISPLAY_TIMEZONE)
+        return df
+    except Exception as e:
+        st.warning(f"Could not load campaign trends. Error: {e}")
+        return pd.DataFrame()
 
-    last_updated_placeholder = st.empty()
-    
-    mongo_client = init_connection()
-    df = load_data(mongo_client)
+def render_dashboard(mongo_client, metrics, version, status_text):
+    """Draws the funnel, metrics and activity log from precomputed counts."""
+    st.text(status_text)
 
-    if mongo_client and df.empty:
+    if metrics['total_events'] == 0:
         st.info("No email data to display yet. Send some emails and process replies to see the dashboard.")
-        time.sleep(auto_refresh_interval)
-        st.rerun()
         return
 
-    # --- Pre-calculate all key metrics ---
-    total_sent = df[df['event_type'] == 'initial_outreach'].shape[0]
-    total_replies = df[df['event_type'].str.startswith('replied_', na=False)].shape[0]
-    total_follow_ups = df[df['event_type'] == 'follow_up_sent'].shape[0]
+    # --- Key metrics, computed server-side ---
+    total_sent = metrics['total_sent']
+    total_replies = metrics['total_replies']
+    total_follow_ups = metrics['total_follow_ups']
     
-    positive_replies = df[df['interest_level'] == 'positive'].shape[0]
-    negative_replies = df[df['interest_level'] == 'negative'].shape[0]
+    positive_replies = metrics['positive_replies']
+    negative_replies = metrics['negative_replies']
     
-    reply_rate = (total_replies / total_sent * 100) if total_sent > 0 else 0
+    reply_rate = metrics['reply_rate']
     
-    tab1, tab2, tab3 = st.tabs(["📈 Campaign Funnel", "Key Metrics", "📜 Full Activity Log"])
+    tab1, tab2, tab4, tab3 = st.tabs(["📈 Campaign Funnel", "Key Metrics", "📅 Trends", "📜 Full Activity Log"])
 
     with tab1:
         st.header("Email Outreach Funnel")
@@ -128,49 +230,105 @@ def main():
         
         with col_pie:
             st.subheader("Reply Sentiment Breakdown")
-            if 'interest_level' in df.columns:
-                sentiment_df = df[df['interest_level'].isin(['positive', 'negative'])]['interest_level'].value_counts().reset_index()
-                sentiment_df.columns = ['sentiment', 'count']
-                
-                if not sentiment_df.empty:
-                    pie_fig = px.pie(sentiment_df, names='sentiment', values='count', 
-                                    color='sentiment',
-                                    color_discrete_map={'positive':'#2ca02c', 'negative':'#d62728'},
-                                    hole=.3)
-                    pie_fig.update_traces(textposition='inside', textinfo='percent+label')
-                    st.plotly_chart(pie_fig, use_container_width=True)
-                else:
-                    st.info("No positive or negative replies to analyze yet.")
+            sentiment_df = pd.DataFrame(
+                [(level, count) for level, count in metrics['interest_counts'].items() if level in ('positive', 'negative')],
+                columns=['sentiment', 'count']
+            )
+            if not sentiment_df.empty:
+                pie_fig = px.pie(sentiment_df, names='sentiment', values='count', 
+                                color='sentiment',
+                                color_discrete_map={'positive':'#2ca02c', 'negative':'#d62728'},
+                                hole=.3)
+                pie_fig.update_traces(textposition='inside', textinfo='percent+label')
+                st.plotly_chart(pie_fig, use_container_width=True)
             else:
-                st.info("No sentiment data to analyze yet.")
+                st.info("No positive or negative replies to analyze yet.")
 
         with col_bar:
             st.subheader("Activity by Type")
-            if 'event_type' in df.columns:
-                event_counts = df['event_type'].value_counts()
+            if metrics['event_counts']:
+                event_counts = pd.Series(metrics['event_counts']).sort_values(ascending=False)
                 st.bar_chart(event_counts)
             else:
                 st.info("No event data to plot.")
 
+    with tab4:
+        st.header("Campaign Trends")
+        t_col1, t_col2 = st.columns(2)
+        with t_col1:
+            granularity = st.selectbox("Bucket size", ["day", "hour"], key="trend_granularity")
+        with t_col2:
+            days = st.selectbox("Time range (days)", [7, 30, 90, 365], index=1, key="trend_days")
+        trend_df = load_rollup_series(mongo_client, granularity, days, version)
+        if not trend_df.empty:
+            trend_fig = px.line(
+                trend_df.melt(id_vars="bucket", var_name="metric", value_name="count"),
+                x="bucket", y="count", color="metric", markers=True
+            )
+            trend_fig.update_layout(xaxis_title="", yaxis_title="Events", margin=dict(l=20, r=20, t=20, b=20), height=400)
+            st.plotly_chart(trend_fig, use_container_width=True)
+        else:
+            st.info("No rollup data for this range yet.")
+        if st.button("♻️ Rebuild Rollups from History", key="rebuild_rollups"):
+            with st.spinner("Rebuilding hourly and daily rollups..."):
+                backfill_rollups(mongo_client[MONGO_DB_NAME])
+            load_rollup_series.clear()
+            st.success("✅ Rollups rebuilt from the email log.")
+
     with tab3:
         st.header("Full Activity Log")
         st.markdown("A detailed, searchable log of all email events.")
-        if '_id' in df.columns:
-            df_display = df.drop(columns=['_id'])
-        else:
-            df_display = df
+        # The metrics only cover classified events; the pager needs every logged document
+        total_logged = count_log_events(mongo_client)
+        total_pages = max(1, -(-total_logged // ACTIVITY_LOG_PAGE_SIZE))
+        log_page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1, key="activity_log_page")
+        df_display = load_activity_log(mongo_client, int(log_page) - 1, version)
+        if '_id' in df_display.columns:
+            df_display = df_display.drop(columns=['_id'])
         
         # Format the timestamp for display in the dataframe
-        df_display['timestamp'] = df_display['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        if 'timestamp' in df_display.columns:
+            df_display['timestamp'] = df_display['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
         st.dataframe(df_display, use_container_width=True)
+        st.caption(f"Page {int(log_page)} of {total_pages} · {total_logged} events in total")
 
-    # --- TIMEZONE FIX ---
-    # Get current UTC time and convert it to the display timezone
-    now_local = datetime.datetime.now(datetime.timezone.utc).astimezone(ZoneInfo(DISPLAY_TIMEZONE))
-    last_updated_placeholder.text(f"Last updated: {now_local.strftime('%Y-%m-%d %H:%M:%S')} ({DISPLAY_TIMEZONE})")
-    
-    time.sleep(auto_refresh_interval)
-    st.rerun()
+def render_live_dashboard(mongo_client):
+    """Fragment body for live mode: reads the in-memory feed, never re-aggregates."""
+    feed = get_live_feed(mongo_client)
+    event_counts, interest_counts, version = feed.snapshot()
+    if feed.mode == "change_stream":
+        source = "live via MongoDB change stream"
+    elif feed.mode == "polling":
+        source = f"live via polling every {feed.poll_interval}s"
+    else:
+        source = f"live feed {feed.mode}"
+    last_event = "none yet"
+    if feed.last_event_at:
+        last_event = feed.last_event_at.astimezone(ZoneInfo(DISPLAY_TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+    render_dashboard(mongo_client, summarize_metrics(event_counts, interest_counts), version,
+                     f"Metrics {source} · last new event: {last_event} ({DISPLAY_TIMEZONE})")
+
+def main():
+    st.set_page_config(page_title="Email Campaign Dashboard", page_icon="📊", layout="wide")
+    st.title("📊 Email Campaign Dashboard")
+
+    st.sidebar.title("⚙️ Settings")
+    live_updates = st.sidebar.toggle("Live updates", value=True, key="live_updates")
+    refresh_interval = st.sidebar.slider("Refresh view every (seconds)", 1, 60, 5, key="refresh_slider",
+                                         disabled=not live_updates)
+
+    mongo_client = init_connection()
+    if mongo_client is None:
+        return
+
+    if live_updates:
+        st.fragment(render_live_dashboard, run_every=refresh_interval)(mongo_client)
+    else:
+        # --- TIMEZONE FIX ---
+        # Get current UTC time and convert it to the display timezone
+        now_local = datetime.datetime.now(datetime.timezone.utc).astimezone(ZoneInfo(DISPLAY_TIMEZONE))
+        render_dashboard(mongo_client, load_metrics(mongo_client), now_local,
+                         f"Last updated: {now_local.strftime('%Y-%m-%d %H:%M:%S')} ({DISPLAY_TIMEZONE})")
 
 if __name__ == "__main__":
     main()
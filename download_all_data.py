@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
+import os
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-import os
 from dotenv import load_dotenv
+from export_engine import EXPORT_FORMATS, available_formats
+from export_jobs import list_jobs, mark_stale_jobs, setup_export_job_indexes, start_export_job
 
 # Load environment variables
 load_dotenv()
@@ -14,38 +16,41 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 COLLECTION_NAMES = ["cleaned_contacts", "contacts", "scraped_contacts", "email_logs", "unsubscribe_list"]
+# Artifacts above this size are not pushed through the browser session; set EXPORT_DOWNLOAD_BASE_URL
+# to link them from a static file server (e.g. Streamlit static serving or a reverse proxy) instead
+EXPORT_INLINE_DOWNLOAD_MAX_BYTES = int(os.getenv("EXPORT_INLINE_DOWNLOAD_MAX_BYTES", 50 * 1024 * 1024))
+EXPORT_DOWNLOAD_BASE_URL = os.getenv("EXPORT_DOWNLOAD_BASE_URL")
 
 # ===============================
 # DATABASE & DATA FUNCTIONS
 # ===============================
+@st.cache_resource
+def init_connection():
+    """Creates one MongoDB client per server process, shared by every session and refresh."""
+    client = MongoClient(MONGO_URI)
+    client.admin.command('ismaster')
+    return client
+
 def get_db_connection():
-    """Establishes a connection to the MongoDB database."""
+    """Returns the shared MongoDB client and database."""
     try:
-        client = MongoClient(MONGO_URI)
-        client.admin.command('ismaster')
-        db = client[MONGO_DB_NAME]
-        return client, db
+        client = init_connection()
+        return client, client[MONGO_DB_NAME]
     except ConnectionFailure:
         st.error("❌ **Database Connection Error:** Could not connect to MongoDB.")
         return None, None
 
-def fetch_all_data(db, collection_name):
-    """Fetches all records from a specified collection."""
+def fetch_preview(db, collection_name, limit=5):
+    """Fetches a handful of records to preview a collection."""
     try:
-        cursor = db[collection_name].find()
-        df = pd.DataFrame(list(cursor))
+        df = pd.DataFrame(list(db[collection_name].find().limit(limit)))
         if '_id' in df.columns:
             df['_id'] = df['_id'].astype(str) # Convert ObjectId to string
         return df
     except Exception as e:
-        st.warning(f"⚠️ Could not fetch data from '{collection_name}'. It might be empty. Error: {e}")
+        st.warning(f"⚠️ Could not preview '{collection_name}'. Error: {e}")
         return pd.DataFrame()
 
-@st.cache_data
-def convert_df_to_csv(df):
-    """Caches the conversion of a DataFrame to a CSV string to improve performance."""
-    return df.to_csv(index=False).encode('utf-8')
-
 # ===============================
 # STREAMLIT UI
 # ===============================
@@ -54,37 +59,101 @@ def main():
     Main function to display the download page.
     """
     st.title("📥 Download All Collected Data")
-    st.markdown("Here you can download the data from your various database collections as a CSV file.")
+    st.markdown("Here you can export your database collections as CSV or Parquet. Exports run in the background and stay available for download.")
 
     client, db = get_db_connection()
     if not client:
         return
+    setup_export_job_indexes(db)
 
     # Let the user choose which collection to download
     selected_collection = st.selectbox(
         "Select a collection to download:",
         COLLECTION_NAMES
     )
+    export_format = st.selectbox(
+        "Export format:",
+        available_formats(),
+        format_func=lambda fmt: EXPORT_FORMATS[fmt]["label"]
+    )
 
-    if st.button(f"Prepare '{selected_collection}' for Download"):
-        with st.spinner(f"Fetching data from '{selected_collection}'..."):
-            df = fetch_all_data(db, selected_collection)
-            client.close()
-
-            if not df.empty:
-                st.success(f"✅ Successfully fetched {len(df)} records.")
-                st.dataframe(df.head()) # Show a preview
-
-                csv_data = convert_df_to_csv(df)
-
-                st.download_button(
-                    label=f"Download {selected_collection}.csv",
-                    data=csv_data,
-                    file_name=f"{selected_collection}.csv",
-                    mime="text/csv",
-                )
-            else:
-                st.info("ℹ️ This collection is currently empty. No data to download.")
+    incremental = st.checkbox(
+        "Only rows added since the last completed export of this collection",
+        value=False,
+        help="Incremental exports pick up where the previous export's snapshot ended."
+    )
+
+    if st.button(f"Start Export of '{selected_collection}'"):
+        job_id = start_export_job(db, selected_collection, export_format, incremental=incremental)
+        st.success(f"✅ Export job {job_id} started. It runs in the background; you can keep using the app.")
+
+    with st.expander(f"Preview '{selected_collection}'"):
+        st.dataframe(fetch_preview(db, selected_collection))
+
+    st.markdown("---")
+    st.subheader("Export Jobs")
+    st.fragment(render_export_jobs, run_every=3)()
+    render_job_download(db)
+
+def render_export_jobs():
+    """Lists recent export jobs with live progress; refreshed on a timer, so it never touches artifacts."""
+    client, db = get_db_connection()
+    if not client:
+        return
+    mark_stale_jobs(db)
+    jobs = list_jobs(db)
+
+    if not jobs:
+        st.info("ℹ️ No export jobs yet.")
+        return
+
+    for job in jobs:
+        kind = "incremental" if job.get("incremental") else "full"
+        label = f"**{job['collection']}** · {EXPORT_FORMATS[job['format']]['label']} · {kind} · {job['status']}"
+        st.markdown(label)
+        if job["status"] in ("queued", "running"):
+            total = job.get("rows_total") or 0
+            written = job.get("rows_written", 0)
+            fraction = min(written / total, 1.0) if total else 0.0
+            st.progress(fraction, text=f"{written:,} / {total:,} rows · {job.get('rows_per_sec', 0):,.0f} rows/sec")
+        elif job["status"] == "completed":
+            st.caption(f"{job['rows_written']:,} rows at {job.get('rows_per_sec', 0):,.0f} rows/sec · "
+                       f"{job.get('size_bytes', 0):,} bytes · sha256 {job.get('sha256', '')}")
+        else:
+            st.error(f"❌ Export failed: {job.get('error')}")
+
+def render_job_download(db):
+    """Offers the artifact of one completed job chosen by the user.
+
+    Only the selected file is served. Small files go through a download button;
+    larger ones are linked from EXPORT_DOWNLOAD_BASE_URL, or their path on the
+    server is shown, so they are never read into the session's memory.
+    """
+    completed = [job for job in list_jobs(db) if job["status"] == "completed"]
+    if not completed:
+        return
+    job = st.selectbox(
+        "Download a finished export:",
+        completed,
+        format_func=lambda job: f"{job['file_name']} ({job.get('size_bytes', 0):,} bytes)"
+    )
+    path = job.get("path", "")
+    if not os.path.exists(path):
+        st.warning("⚠️ The export file is no longer on disk.")
+    elif EXPORT_DOWNLOAD_BASE_URL:
+        st.link_button(f"Download {job['file_name']}", f"{EXPORT_DOWNLOAD_BASE_URL.rstrip('/')}/{job['file_name']}")
+    elif os.path.getsize(path) <= EXPORT_INLINE_DOWNLOAD_MAX_BYTES:
+        with open(path, "rb") as file:
+            st.download_button(
+                label=f"Download {job['file_name']}",
+                data=file,
+                file_name=job["file_name"],
+                mime=EXPORT_FORMATS[job["format"]]["mime"],
+                key=f"download_{job['_id']}",
+            )
+    else:
+        st.info(f"ℹ️ This export is too large to download through the browser session. "
+                f"It is stored on the server at `{os.path.abspath(path)}`; set `EXPORT_DOWNLOAD_BASE_URL` to link it.")
 
 if __name__ == '__main__':
     main()
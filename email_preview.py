@@ -3,10 +3,19 @@ import smtplib
 import datetime
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import os
+import uuid
 from dotenv import load_dotenv
+from analytics_rollup import record_event
+from bounce_processing import suppressed_addresses
+from bulk_smtp import BulkSmtpSender, batched
+from campaigns import (claim_campaign, claim_recipient, count_unfinished, create_campaign, is_campaign_leased,
+                       list_unfinished_campaigns, mark_recipient, reconcile_in_flight, refresh_campaign,
+                       renew_campaign_lease, unfinished_recipients)
+from message_builder import build_message
+from mail_threading import new_message_id, setup_thread_indexes
+from instrumentation import timer
+from reporting import report
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,6 +29,8 @@ SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+# Plain SMTP is only for local test servers (see benchmarks/)
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() != "false"
 
 # ===============================
 # HELPER FUNCTIONS
@@ -33,10 +44,10 @@ def get_db_connection():
         db = client[MONGO_DB_NAME]
         return client, db
     except ConnectionFailure as e:
-        st.error(f"❌ **Database Connection Error:** {e}")
+        report.error(f"❌ **Database Connection Error:** {e}")
         return None, None
 
-def log_event_to_db(db, event_type, email_addr, subject, body, status):
+def log_event_to_db(db, event_type, email_addr, subject, body, status, message_id=None, campaign_id=None):
     """Inserts an email event document into the 'email_logs' collection."""
     try:
         log_entry = {
@@ -45,43 +56,172 @@ def log_event_to_db(db, event_type, email_addr, subject, body, status):
             "recipient_email": email_addr,
             "subject": subject,
             "body": body,
-            "status": status
+            "status": status,
+            "sender": SENDER_EMAIL,
+            "message_id": message_id,
+            "campaign_id": campaign_id
         }
         db.email_logs.insert_one(log_entry)
     except Exception as e:
-        st.error(f"❌ Failed to log event to database: {e}")
-
-def send_email_smtp(db, to_email, subject, body):
-    """Connects to the SMTP server, sends the email, and logs the event to the database."""
+        report.error(f"❌ Failed to log event to database: {e}")
+        return
     try:
-        msg = MIMEMultipart()
-        msg["From"] = SENDER_EMAIL
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
+        record_event(db, event_type, log_entry["timestamp"], status=status, campaign_id=campaign_id,
+                     sender=SENDER_EMAIL)
+    except Exception as e:
+        report.warning(f"⚠ Failed to update analytics rollups: {e}")
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+def open_smtp_session():
+    """Connects and authenticates to the SMTP server; use as a context manager."""
+    with timer("smtp_connect"):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    if SMTP_USE_TLS:
+        with timer("smtp_starttls"):
             server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, to_email, msg.as_string())
-        
-        # --- CRITICAL FIX ---
-        # Log the first email with a specific, unique event type.
-        log_event_to_db(db, "initial_outreach", to_email, subject, body, "success")
-        return True
-    except Exception as e:
-        st.error(f"❌ Failed to send to {to_email}: {e}")
-        log_event_to_db(db, "initial_outreach", to_email, subject, body, "failed")
-        return False
+    with timer("smtp_login"):
+        server.login(SENDER_EMAIL, SENDER_PASSWORD)
+    return server
+
+def send_recipient_batch(db, recipients, campaign_key, states=("pending",)):
+    """Sends a batch of campaign recipients over one SMTP session; returns how many were sent.
+
+    Each recipient is claimed before it is sent, so one claimed by a concurrent run is skipped.
+    """
+    outgoing = []
+    for recipient in recipients:
+        message_id = new_message_id(SENDER_EMAIL)
+        if not claim_recipient(db, recipient['_id'], message_id, states):
+            continue
+        try:
+            with timer("build_message"):
+                msg = build_message(SENDER_EMAIL, recipient['recipient'], recipient['subject'], recipient['body'],
+                                    message_id)
+        except ValueError as e:
+            # A malformed row fails on its own instead of aborting the batch on every resume
+            report.error(f"❌ Cannot build email to {recipient['recipient']!r}: {e}")
+            log_event_to_db(db, "initial_outreach", recipient['recipient'], recipient['subject'], recipient['body'],
+                            "failed", message_id, campaign_key)
+            mark_recipient(db, recipient['_id'], "failed", error=str(e))
+            continue
+        outgoing.append((recipient, message_id, msg))
+
+    by_id = {recipient['_id']: (recipient, message_id) for recipient, message_id, _ in outgoing}
+
+    def checkpoint(result):
+        # Logged and marked the moment the server answers, so a crash re-sends nothing already accepted
+        recipient, message_id = by_id[result.key]
+        if not result.ok:
+            report.error(f"❌ Failed to send to {recipient['recipient']}: "
+                         f"{result.error or result.refused.get(recipient['recipient'])}")
+        log_event_to_db(db, "initial_outreach", recipient['recipient'], recipient['subject'], recipient['body'],
+                        "success" if result.ok else "failed", message_id, campaign_key)
+        mark_recipient(db, recipient['_id'], "sent" if result.ok else "failed")
+
+    sender = BulkSmtpSender(open_smtp_session, SENDER_EMAIL)
+    results = sender.send(((recipient['_id'], recipient['recipient'], msg) for recipient, _, msg in outgoing),
+                          on_result=checkpoint)
+    return sum(result.ok for result in results)
+
+def send_campaign(db, campaign_id, progress=None, retry_failed=False):
+    """Sends a campaign's unsent recipients, checkpointing each one's state in MongoDB.
+
+    Safe to call again after a crash: recipients already sent are skipped and
+    ones caught mid-send are settled from the send log first. Only one run at
+    a time holds a campaign's lease. Returns (sent, skipped) for this run, or
+    None if another run is still sending the campaign.
+    """
+    setup_thread_indexes(db)
+    owner = uuid.uuid4().hex
+    if not claim_campaign(db, campaign_id, owner):
+        report.warning(f"⏳ Campaign {campaign_id} is already being sent by another run.")
+        return None
+    reconcile_in_flight(db, campaign_id)
+    total = count_unfinished(db, campaign_id, retry_failed)
+    states = ("pending", "failed") if retry_failed else ("pending",)
+    campaign_key = str(campaign_id)
+    success_count = 0
+    skipped_count = 0
+    done = 0
+
+    for batch in unfinished_recipients(db, campaign_id, retry_failed):
+        # Bounced and unsubscribed addresses are never sent to
+        suppressed = suppressed_addresses(db, [recipient['recipient'] for recipient in batch])
+        outgoing = []
+        for recipient in batch:
+            done += 1
+            if progress:
+                progress(done, total, f"Sending email {done}/{total} to {recipient['recipient']}...")
+            if recipient['recipient'] in suppressed:
+                report.warning(f"🚫 Skipped {recipient['recipient']}: address is on the suppression list.")
+                mark_recipient(db, recipient['_id'], "suppressed")
+                skipped_count += 1
+                continue
+            outgoing.append(recipient)
+        for chunk in batched(outgoing):
+            if not renew_campaign_lease(db, campaign_id, owner):
+                report.error(f"❌ Lost the lease on campaign {campaign_id}; stopping this run.")
+                return success_count, skipped_count
+            success_count += send_recipient_batch(db, chunk, campaign_key, states)
+
+    refresh_campaign(db, campaign_id, finished=True, owner=owner)
+    return success_count, skipped_count
+
+def send_emails(db, emails, progress=None, name=None):
+    """Stores reviewed drafts as a new campaign and sends it.
+
+    `emails` are dicts with 'to_email', 'subject' and 'body'. Returns
+    (sent, skipped) counts.
+    """
+    campaign_id = create_campaign(db, emails, name=name, sender=SENDER_EMAIL)
+    report.info(f"📦 Campaign {campaign_id} created for {len(emails)} draft(s).")
+    return send_campaign(db, campaign_id, progress)
 
 # ===============================
 # MAIN STREAMLIT APP
 # ===============================
+def render_unfinished_campaigns():
+    """Lists campaigns that did not finish and lets the operator resume them."""
+    client, db = get_db_connection()
+    if not client:
+        return
+    try:
+        campaigns = list_unfinished_campaigns(db)
+        if not campaigns:
+            return
+        st.markdown("---")
+        st.header("Unfinished Campaigns")
+        retry_failed = st.checkbox("Also retry recipients that failed", value=False)
+        for campaign in campaigns:
+            counts = campaign.get("counts", {})
+            c_col1, c_col2 = st.columns([3, 1])
+            with c_col1:
+                st.markdown(f"**{campaign['name']}** · {campaign['status']} · "
+                            f"{counts.get('sent', 0)}/{campaign.get('total', 0)} sent, "
+                            f"{counts.get('pending', 0) + counts.get('sending', 0)} pending, "
+                            f"{counts.get('failed', 0)} failed, {counts.get('suppressed', 0)} suppressed")
+            with c_col2:
+                # A campaign with a live lease is still being sent elsewhere
+                resume = st.button("▶ Resume", key=f"resume_{campaign['_id']}", disabled=is_campaign_leased(campaign),
+                                   help="Being sent by another run" if is_campaign_leased(campaign) else None)
+            if resume:
+                progress_bar = st.progress(0, text="Resuming...")
+                outcome = send_campaign(
+                    db, campaign["_id"],
+                    lambda done, total, text: progress_bar.progress(done / max(total, 1), text=text),
+                    retry_failed=retry_failed
+                )
+                if outcome:
+                    sent, skipped = outcome
+                    st.success(f"Resumed '{campaign['name']}': sent {sent} more email(s), {skipped} suppressed.")
+    finally:
+        client.close()
+
 def main():
     st.title("Email Preview & Send")
 
     if 'edited_emails' not in st.session_state or not st.session_state.edited_emails:
         st.info("📧 Please generate and edit some email drafts on the 'Generate & Edit Emails' page first.")
+        render_unfinished_campaigns()
         return
 
     st.header("Final Review")
@@ -100,20 +240,21 @@ def main():
         if not client:
             st.error("Cannot send emails without a database connection for logging.")
             return
-        
-        success_count = 0
+        # The drafts now live in the campaign, so the session can be cleared before sending
+        campaign_id = create_campaign(db, st.session_state.edited_emails, sender=SENDER_EMAIL)
+        st.session_state.edited_emails = []
         progress_bar = st.progress(0, text="Initializing...")
-        
-        for i, email_to_send in enumerate(st.session_state.edited_emails):
-            progress_text = f"Sending email {i+1}/{len(st.session_state.edited_emails)} to {email_to_send['to_email']}..."
-            progress_bar.progress((i + 1) / len(st.session_state.edited_emails), text=progress_text)
-            if send_email_smtp(db, email_to_send['to_email'], email_to_send['subject'], email_to_send['body']):
-                success_count += 1
+        success_count, skipped_count = send_campaign(
+            db, campaign_id,
+            lambda done, total, text: progress_bar.progress(done / max(total, 1), text=text)
+        ) or (0, 0)
         
         client.close()
-        st.success(f"Campaign complete! Sent {success_count} out of {len(st.session_state.edited_emails)} emails. Full details logged to the database.")
-        st.session_state.edited_emails = []
+        st.success(f"Campaign complete! Sent {success_count} emails ({skipped_count} suppressed). "
+                   "Full details logged to the database.")
         st.rerun()
 
+    render_unfinished_campaigns()
+
 if __name__ == "__main__":
     main()
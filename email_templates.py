@@ -0,0 +1,146 @@
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from string import Template
+from urllib.parse import quote
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+UNSUBSCRIBE_BASE_URL = os.getenv("UNSUBSCRIBE_BASE_URL", "https://unsubscribe-52pwl9yyy-gowthami-gs-projects.vercel.app/unsubscribe")
+EMAIL_TEMPLATE_DIR = os.getenv("EMAIL_TEMPLATE_DIR")
+TEMPLATES_COLLECTION = "email_templates"
+RENDER_CACHE_SIZE = int(os.getenv("TEMPLATE_RENDER_CACHE_SIZE", 4096))
+
+# Values that are the same for every recipient. They are folded into the
+# template text at compile time, so rendering only substitutes per-recipient fields.
+TEMPLATE_CONSTANTS = {
+    "outreach_signature": "Best regards,\nGowthami\nEmployee, Morphius AI\nhttps://www.morphius.in/",
+    "reply_signature": "Best regards,\nAasrith",
+    "scheduling_link": os.getenv("SCHEDULING_LINK") or "",
+    "other_services_link": os.getenv("OTHER_SERVICES_LINK") or "",
+}
+
+DEFAULT_TEMPLATES = {
+    "outreach_unsubscribe_footer": "\n\n\nIf you prefer not to receive future emails, you can unsubscribe here: ${unsubscribe_url}",
+    "reply_unsubscribe_footer": "\n\nIf you prefer not to receive future emails, you can unsubscribe here: ${unsubscribe_url}",
+    "fallback_edtech": "Dear Sir/Madam,\n\nI came across your profile in the EdTech space. At Morphius AI, we personalize learning and improve educational outcomes.\n\nI would be keen to connect and share insights.\n\n${outreach_signature}",
+    "fallback_commerce": "Dear Sir/Madam,\n\nI noticed your experience in e-commerce. Morphius AI creates AI-driven tools that enhance customer engagement and optimize online retail.\n\nA brief chat about industry trends could be mutually beneficial.\n\n${outreach_signature}",
+    "fallback_health": "Dear Sir/Madam,\n\nYour work in healthcare is impressive. At Morphius AI, we leverage AI to streamline diagnostics and improve patient care pathways.\n\nI would value a discussion on healthcare technology.\n\n${outreach_signature}",
+    "fallback_general": "Dear Sir/Madam,\n\nI came across your profile and was interested in your work in the ${domain} sector. Morphius AI builds AI solutions across industries.\n\nI would be delighted to connect.\n\n${outreach_signature}",
+    "manual": "Hi ${name},\n\n\n\n${outreach_signature}",
+    "reply_positive": "Hi,\n\nThank you for your positive response! I'm glad to hear you're interested.\n\nYou can book a meeting with me directly here: ${scheduling_link}\n\nI look forward to speaking with you.\n\n${reply_signature}",
+    "reply_other": "Hi,\n\nThank you for getting back to me. I understand.\n\nIn case you're interested, we also offer other services which you can explore here: ${other_services_link}\n\n${reply_signature}",
+    "follow_up": "Hi,\n\nJust wanted to quickly follow up on my previous email. If it's not the right time, no worries.\n\nWe also have other services you might find interesting: ${other_services_link}\n\n${reply_signature}",
+}
+
+# ===============================
+# COMPILATION
+# ===============================
+class CompiledTemplate:
+    """A template parsed once into literal text and per-recipient field slots."""
+
+    def __init__(self, name, text, constants=None):
+        self.name = name
+        self.text = text
+        constants = constants or {}
+        segments = []
+        literal = []
+        position = 0
+        for match in Template.pattern.finditer(text):
+            literal.append(text[position:match.start()])
+            position = match.end()
+            field = match.group("named") or match.group("braced")
+            if match.group("escaped") is not None:
+                literal.append("$")
+            elif field in constants:
+                literal.append(str(constants[field]))
+            elif field:
+                if literal:
+                    segments.append(("".join(literal), None))
+                    literal = []
+                segments.append((None, field))
+            else:
+                raise ValueError(f"Invalid placeholder in template '{name}' at position {match.start()}")
+        literal.append(text[position:])
+        segments.append(("".join(literal), None))
+        self.segments = tuple(segments)
+        self.fields = frozenset(field for _, field in segments if field)
+
+    def render(self, variables):
+        try:
+            return "".join(text if field is None else str(variables[field]) for text, field in self.segments)
+        except KeyError as e:
+            raise KeyError(f"Template '{self.name}' is missing variable {e}") from None
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def register_template(name, text):
+    """Compiles and registers a template, replacing any previous one with the same name."""
+    compiled = CompiledTemplate(name, text, TEMPLATE_CONSTANTS)
+    with _registry_lock:
+        _registry[name] = compiled
+    _render_cached.cache_clear()
+    return compiled
+
+def load_templates_from_dir(directory):
+    """Registers every `<name>.txt` file in `directory` as a template."""
+    loaded = 0
+    for path in sorted(Path(directory).glob("*.txt")):
+        register_template(path.stem, path.read_text(encoding="utf-8"))
+        loaded += 1
+    return loaded
+
+_db_templates_loaded = False
+
+def load_templates_from_db(db, force=False):
+    """Registers template overrides stored as {name, body} documents in MongoDB.
+
+    Overrides are read once per process; pass `force=True` to pick up edits.
+    """
+    global _db_templates_loaded
+    if _db_templates_loaded and not force:
+        return 0
+    loaded = 0
+    for doc in db[TEMPLATES_COLLECTION].find({}, {"name": 1, "body": 1}):
+        if doc.get("name") and doc.get("body") is not None:
+            register_template(doc["name"], doc["body"])
+            loaded += 1
+    _db_templates_loaded = True
+    return loaded
+
+def get_template(name):
+    return _registry[name]
+
+
+# ===============================
+# RENDERING
+# ===============================
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render_cached(name, items):
+    return _registry[name].render(dict(items))
+
+def render_template(name, **variables):
+    """Renders a registered template; identical inputs are served from a bounded cache."""
+    return _render_cached(name, tuple(sorted(variables.items())))
+
+def unsubscribe_url(recipient_email):
+    return f"{UNSUBSCRIBE_BASE_URL}?email={quote(recipient_email)}"
+
+def render_with_unsubscribe(name, recipient_email, footer="reply_unsubscribe_footer", **variables):
+    """Renders a template and appends the recipient's unsubscribe footer."""
+    body = render_template(name, **variables)
+    return body + render_template(footer, unsubscribe_url=unsubscribe_url(recipient_email))
+
+# Built-in defaults first, then on-disk overrides
+for _name, _text in DEFAULT_TEMPLATES.items():
+    register_template(_name, _text)
+if EMAIL_TEMPLATE_DIR and os.path.isdir(EMAIL_TEMPLATE_DIR):
+    load_templates_from_dir(EMAIL_TEMPLATE_DIR)
@@ -0,0 +1,164 @@
+import csv
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import time
+from bson import ObjectId
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# ===============================
+# CONFIGURATION
+# ===============================
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+EXPORT_SPOOL_DIR = os.getenv("EXPORT_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "morphius_exports")
+EXPORT_SPOOL_MAX_AGE_HOURS = int(os.getenv("EXPORT_SPOOL_MAX_AGE_HOURS", 24))
+
+EXPORT_FORMATS = {
+    "csv": {"label": "CSV", "extension": ".csv", "mime": "text/csv"},
+    "csv.gz": {"label": "CSV (gzip)", "extension": ".csv.gz", "mime": "application/gzip"},
+    "parquet": {"label": "Parquet", "extension": ".parquet", "mime": "application/octet-stream"},
+}
+
+def available_formats():
+    """Returns the export formats usable in this environment (Parquet needs pyarrow)."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or pq is not None]
+
+# ===============================
+# HELPERS
+# ===============================
+def collection_field_names(collection, query=None, projection=None):
+    """Returns the union of top-level field names, computed server-side so documents are never loaded."""
+    projection = projection or {}
+    included = [field for field, include in projection.items() if include and field != "_id"]
+    if included:
+        return included if projection.get("_id", 1) == 0 else ["_id"] + included
+    pipeline = [
+        {"$match": query or {}},
+        {"$project": {"_id": 0, "keys": {"$map": {"input": {"$objectToArray": "$$ROOT"}, "in": "$$this.k"}}}},
+        {"$unwind": {"path": "$keys", "includeArrayIndex": "position"}},
+        {"$group": {"_id": "$keys", "position": {"$min": "$position"}}},
+        {"$sort": {"position": 1, "_id": 1}},
+    ]
+    excluded = {field for field, include in projection.items() if not include}
+    return [doc["_id"] for doc in collection.aggregate(pipeline, allowDiskUse=True) if doc["_id"] not in excluded]
+
+def to_cell(value):
+    """Flattens a BSON value into a string suitable for a CSV or Parquet cell."""
+    if value is None:
+        return ""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ", ".join(to_cell(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=str)
+    return str(value)
+
+def iter_batches(cursor, batch_size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def cleanup_spool(max_age_hours=EXPORT_SPOOL_MAX_AGE_HOURS):
+    """Deletes spooled export files older than `max_age_hours`."""
+    if not os.path.isdir(EXPORT_SPOOL_DIR):
+        return
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(EXPORT_SPOOL_DIR):
+        path = os.path.join(EXPORT_SPOOL_DIR, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+# ===============================
+# WRITERS
+# ===============================
+class CsvBatchWriter:
+    def __init__(self, path, fields, compress=False):
+        self.fields = fields
+        if compress:
+            self.handle = gzip.open(path, "wt", encoding="utf-8", newline="")
+        else:
+            self.handle = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.handle)
+        self.writer.writerow(fields)
+
+    def write(self, docs):
+        self.writer.writerows([to_cell(doc.get(field)) for field in self.fields] for doc in docs)
+
+    def close(self):
+        self.handle.close()
+
+
+class ParquetBatchWriter:
+    def __init__(self, path, fields):
+        self.fields = fields
+        self.schema = pa.schema([(field, pa.string()) for field in fields])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="snappy")
+
+    def write(self, docs):
+        columns = {field: [to_cell(doc.get(field)) for doc in docs] for field in self.fields}
+        self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+# ===============================
+# EXPORT
+# ===============================
+def export_collection(collection, fmt="csv", query=None, projection=None, sort=None,
+                      batch_size=EXPORT_BATCH_SIZE, progress=None):
+    """Streams a collection into a spooled export file with bounded memory.
+
+    Documents are read from the cursor `batch_size` at a time and written
+    straight to a temp file, so at most one batch is held in memory. `progress`,
+    if given, is called with the running row count after each batch.
+
+    Returns a dict with the file `path`, `rows` written and the `format`.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    if fmt == "parquet" and pq is None:
+        raise RuntimeError("Parquet export needs the 'pyarrow' package.")
+
+    os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+    fields = collection_field_names(collection, query, projection)
+    handle, path = tempfile.mkstemp(dir=EXPORT_SPOOL_DIR, prefix=f"{collection.name}_",
+                                    suffix=EXPORT_FORMATS[fmt]["extension"])
+    os.close(handle)
+
+    if fmt == "parquet":
+        writer = ParquetBatchWriter(path, fields)
+    else:
+        writer = CsvBatchWriter(path, fields, compress=fmt == "csv.gz")
+
+    rows = 0
+    try:
+        cursor = collection.find(query or {}, projection or None).batch_size(batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+        for batch in iter_batches(cursor, batch_size):
+            writer.write(batch)
+            rows += len(batch)
+            if progress:
+                progress(rows)
+    except Exception:
+        writer.close()
+        os.remove(path)
+        raise
+    writer.close()
+    return {"path": path, "rows": rows, "format": fmt, "fields": fields}
@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, DESCENDING
+from dotenv import load_dotenv
+from export_engine import EXPORT_FORMATS, cleanup_spool, export_collection
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+EXPORT_JOBS_COLLECTION = "export_jobs"
+EXPORT_ARTIFACT_DIR = os.getenv("EXPORT_ARTIFACT_DIR", "exports")
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", 2))
+# A running job that has not reported progress for this long is treated as dead
+EXPORT_JOB_STALE_SECONDS = int(os.getenv("EXPORT_JOB_STALE_SECONDS", 300))
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix="export-job")
+# Queued jobs carry the id of the process that will run them, which keeps their `updated_at` fresh
+_owner = uuid.uuid4().hex
+_queue_heartbeat = None
+_queue_heartbeat_lock = threading.Lock()
+
+# ===============================
+# HELPERS
+# ===============================
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def last_completed_job(db, collection_name):
+    return db[EXPORT_JOBS_COLLECTION].find_one(
+        {"collection": collection_name, "status": "completed", "max_id": {"$ne": None}},
+        sort=[("max_id", DESCENDING)]
+    )
+
+def setup_export_job_indexes(db):
+    db[EXPORT_JOBS_COLLECTION].create_index([("collection", 1), ("status", 1), ("max_id", -1)])
+    db[EXPORT_JOBS_COLLECTION].create_index([("created_at", -1)])
+
+def mark_stale_jobs(db):
+    """Fails jobs whose worker died (e.g. the server restarted mid-export or before the job started)."""
+    cutoff = _now() - datetime.timedelta(seconds=EXPORT_JOB_STALE_SECONDS)
+    db[EXPORT_JOBS_COLLECTION].update_many(
+        {"status": "running", "updated_at": {"$lt": cutoff}},
+        {"$set": {"status": "failed", "error": "Export worker stopped responding.", "finished_at": _now()}}
+    )
+    # A live owner refreshes its queued jobs, so a stale queued job belongs to a process that is gone
+    db[EXPORT_JOBS_COLLECTION].update_many(
+        {"status": "queued", "updated_at": {"$lt": cutoff}},
+        {"$set": {"status": "failed", "error": "Export was queued but never started.", "finished_at": _now()}}
+    )
+
+def list_jobs(db, limit=20):
+    return list(db[EXPORT_JOBS_COLLECTION].find().sort("created_at", DESCENDING).limit(limit))
+
+# ===============================
+# JOBS
+# ===============================
+def start_export_job(db, collection_name, fmt="csv", incremental=False):
+    """Queues a background export of `collection_name` and returns the job id.
+
+    The export is pinned to a snapshot: the highest `_id` at submission time.
+    Rows inserted while the job runs are left for the next export. With
+    `incremental=True` only rows added since the last completed export of the
+    collection are written.
+    """
+    collection = db[collection_name]
+    newest = collection.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    since_id = None
+    if incremental:
+        previous = last_completed_job(db, collection_name)
+        since_id = previous["max_id"] if previous else None
+
+    query = {}
+    if newest:
+        query["_id"] = {"$lte": newest["_id"]}
+        if since_id is not None:
+            query["_id"]["$gt"] = since_id
+    now = _now()
+    job = {
+        "collection": collection_name,
+        "format": fmt,
+        "incremental": incremental,
+        "since_id": since_id,
+        "max_id": newest["_id"] if newest else since_id,
+        "snapshot_time": now,
+        "status": "queued",
+        "owner": _owner,
+        "rows_written": 0,
+        "rows_total": collection.count_documents(query) if newest else 0,
+        "rows_per_sec": 0.0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    job_id = db[EXPORT_JOBS_COLLECTION].insert_one(job).inserted_id
+    _start_queue_heartbeat()
+    _executor.submit(run_export_job, job_id, query)
+    return job_id
+
+def _heartbeat(jobs, job_id, stop):
+    """Keeps `updated_at` fresh while the export is busy, e.g. during the field-name scan before the first batch."""
+    while not stop.wait(EXPORT_JOB_STALE_SECONDS / 3):
+        try:
+            jobs.update_one({"_id": job_id, "status": "running"}, {"$set": {"updated_at": _now()}})
+        except Exception:
+            return
+
+def _refresh_queued_jobs():
+    client = MongoClient(MONGO_URI)
+    jobs = client[MONGO_DB_NAME][EXPORT_JOBS_COLLECTION]
+    while True:
+        time.sleep(EXPORT_JOB_STALE_SECONDS / 3)
+        try:
+            jobs.update_many({"status": "queued", "owner": _owner}, {"$set": {"updated_at": _now()}})
+        except Exception:
+            pass
+
+def _start_queue_heartbeat():
+    """Starts the thread that keeps this process's queued jobs from being reaped while they wait for a worker."""
+    global _queue_heartbeat
+    with _queue_heartbeat_lock:
+        if _queue_heartbeat is None:
+            _queue_heartbeat = threading.Thread(target=_refresh_queued_jobs, name="export-queue-heartbeat", daemon=True)
+            _queue_heartbeat.start()
+
+def run_export_job(job_id, query):
+    """Runs one export job on its own MongoDB connection and records the artifact."""
+    client = MongoClient(MONGO_URI)
+    jobs = client[MONGO_DB_NAME][EXPORT_JOBS_COLLECTION]
+    started = time.monotonic()
+    # Only a job still queued is started; one already reaped as stale stays failed
+    job = jobs.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {"$set": {"status": "running", "started_at": _now(), "updated_at": _now()}}
+    )
+    if job is None:
+        client.close()
+        return
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(jobs, job_id, stop), daemon=True).start()
+    # Spool files left behind by crashed or abandoned exports are pruned before each job
+    cleanup_spool()
+
+    def report_progress(rows):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        jobs.update_one({"_id": job_id}, {"$set": {
+            "rows_written": rows, "rows_per_sec": rows / elapsed, "updated_at": _now()
+        }})
+
+    try:
+        export = export_collection(client[MONGO_DB_NAME][job["collection"]], job["format"], query=query,
+                                   sort=[("_id", 1)], progress=report_progress)
+        os.makedirs(EXPORT_ARTIFACT_DIR, exist_ok=True)
+        suffix = "_incremental" if job["incremental"] else ""
+        file_name = f"{job['collection']}{suffix}_{job_id}{EXPORT_FORMATS[job['format']]['extension']}"
+        path = os.path.join(EXPORT_ARTIFACT_DIR, file_name)
+        shutil.move(export["path"], path)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "completed",
+            "rows_written": export["rows"],
+            "rows_per_sec": export["rows"] / elapsed,
+            "path": path,
+            "file_name": file_name,
+            "size_bytes": os.path.getsize(path),
+            "sha256": file_sha256(path),
+            "finished_at": _now(),
+            "updated_at": _now(),
+        }})
+    except Exception as e:
+        jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "failed", "error": str(e), "finished_at": _now(), "updated_at": _now()
+        }})
+    finally:
+        stop.set()
+        client.close()
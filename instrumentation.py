@@ -0,0 +1,231 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pymongo import monitoring
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRIC_PREFIX = "morphius"
+# Upper bounds in seconds; spans a local Mongo query up to a slow LLM or SMTP call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Recent samples kept per series for the percentiles on the Performance page
+RECENT_SAMPLES = 1024
+logger = logging.getLogger("morphius.metrics")
+
+# ===============================
+# METRIC TYPES
+# ===============================
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def percentile(self, q):
+        with self.lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+_registry_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+def _series(store, factory, name, labels):
+    key = (name, tuple(sorted(labels.items())))
+    metric = store.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = store.setdefault(key, factory())
+    return metric
+
+def observe(name, seconds, **labels):
+    _series(_histograms, Histogram, name, labels).observe(seconds)
+
+def increment(name, amount=1, **labels):
+    _series(_counters, Counter, name, labels).inc(amount)
+
+def reset_metrics():
+    with _registry_lock:
+        _histograms.clear()
+        _counters.clear()
+
+# ===============================
+# TIMING HELPERS
+# ===============================
+@contextmanager
+def timer(operation, **labels):
+    """Times the enclosed block as `operation`; exceptions are counted and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        increment("operation_errors_total", operation=operation, **labels)
+        raise
+    finally:
+        observe("operation_duration_seconds", time.perf_counter() - started, operation=operation, **labels)
+
+def timed(operation=None):
+    """Decorator form of `timer`; the operation name defaults to the function name."""
+    def decorator(func):
+        name = operation or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ===============================
+# MONGODB COMMAND TIMING
+# ===============================
+class MongoCommandTimer(monitoring.CommandListener):
+    """Records the server round-trip time of every MongoDB command by command name."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe("mongo_command_duration_seconds", event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        observe("mongo_command_duration_seconds", event.duration_micros / 1e6, command=event.command_name)
+        increment("mongo_command_errors_total", command=event.command_name)
+
+_mongo_listener_installed = False
+
+def install_mongo_listener():
+    """Registers the command listener globally; applies to MongoClients created afterwards."""
+    global _mongo_listener_installed
+    if not _mongo_listener_installed:
+        monitoring.register(MongoCommandTimer())
+        _mongo_listener_installed = True
+
+# ===============================
+# EXPORT
+# ===============================
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+def _snapshot():
+    with _registry_lock:
+        return sorted(_histograms.items()), sorted(_counters.items())
+
+def render_prometheus():
+    """Renders all metrics in the Prometheus text exposition format."""
+    histograms, counters = _snapshot()
+    lines = []
+    for name in sorted({key[0] for key, _ in histograms}):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# TYPE {full_name} histogram")
+        for (series, labels), histogram in histograms:
+            if series != name:
+                continue
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{full_name}_bucket{_label_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full_name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{full_name}_count{_label_text(labels)} {count}")
+    for name in sorted({key[0] for key, _ in counters}):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# TYPE {full_name} counter")
+        for (series, labels), counter in counters:
+            if series == name:
+                lines.append(f"{full_name}{_label_text(labels)} {counter.value}")
+    return "\n".join(lines) + "\n"
+
+def latency_summary():
+    """Returns one row per timed series with call counts, errors and latency percentiles (ms)."""
+    histograms, counters = _snapshot()
+    counters = dict(counters)
+    rows = []
+    for (name, labels), histogram in histograms:
+        label_map = dict(labels)
+        error_name = name.replace("_duration_seconds", "_errors_total")
+        errors = counters.get((error_name, labels))
+        rows.append({
+            "metric": name,
+            "series": label_map.get("operation") or label_map.get("command") or "",
+            "calls": histogram.count,
+            "errors": errors.value if errors else 0,
+            "avg_ms": histogram.sum / histogram.count * 1000 if histogram.count else None,
+            "p50_ms": (histogram.percentile(0.5) or 0) * 1000,
+            "p95_ms": (histogram.percentile(0.95) or 0) * 1000,
+            "p99_ms": (histogram.percentile(0.99) or 0) * 1000,
+            "total_s": histogram.sum,
+        })
+    return rows
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_metrics_server = None
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serves /metrics on `port` from a daemon thread, once per process. Does nothing if port is 0."""
+    global _metrics_server
+    if not port or _metrics_server is not None:
+        return _metrics_server
+    try:
+        _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        # Usually another process on this host (the app or a second worker) already serves the port
+        logger.warning(f"Could not serve metrics on port {port}: {e}")
+        return None
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _metrics_server
@@ -0,0 +1,145 @@
+import datetime
+import threading
+from collections import Counter
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from analytics_rollup import classify_event, interest_counts
+
+# ===============================
+# CONFIGURATION
+# ===============================
+WATCH_PROJECTION = {"_id": 1, "event_type": 1, "status": 1, "interest_level": 1, "timestamp": 1}
+RETRY_DELAY_SECONDS = 5
+# ObjectIds are generated by each writer before inserting, so polling re-reads this window to catch
+# late arrivals; it also bounds the clock skew tolerated between writers and this process
+POLL_LOOKBACK_SECONDS = 60
+
+# ===============================
+# LIVE METRICS FEED
+# ===============================
+class LiveMetricsFeed:
+    """Keeps email_logs counters current from inserts instead of re-querying on every refresh.
+
+    On start the feed opens a change stream on `email_logs` and seeds its
+    counters with `seed(until)`, which returns the counts so far and the
+    `_id`s of the recent documents it counted. Every insert seen afterwards
+    is applied as a delta unless its `_id` was already counted; writers set
+    their own timestamps, so those are never used to dedup. A dropped
+    stream resumes from its resume token, so nothing is missed or counted
+    twice across reconnects. Standalone servers do not support change
+    streams, so the feed then polls by `_id`, re-reading a short lookback
+    window and skipping documents it has seen.
+    """
+
+    def __init__(self, collection, seed, poll_interval=5):
+        self.collection = collection
+        self.seed = seed
+        self.poll_interval = poll_interval
+        self.mode = "starting"
+        self.version = 0
+        self.last_event_at = None
+        self.error = None
+        self._event_counts = Counter()
+        self._interest_counts = Counter()
+        self._seeded_at = None
+        self._seeded_ids = set()
+        self._resume_token = None
+        self._seen_ids = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="live-metrics-feed", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self):
+        """Returns copies of the current counters and the version they belong to."""
+        with self._lock:
+            return dict(self._event_counts), dict(self._interest_counts), self.version
+
+    def _reseed(self):
+        until = datetime.datetime.now(datetime.timezone.utc)
+        event_counts, interest_counts, counted_ids = self.seed(until)
+        # Only documents inserted around the seed can also arrive as deltas
+        recent = until - datetime.timedelta(seconds=POLL_LOOKBACK_SECONDS)
+        with self._lock:
+            self._event_counts = Counter(event_counts)
+            self._interest_counts = Counter(interest_counts)
+            self._seeded_at = until
+            self._seeded_ids = {doc_id for doc_id in counted_ids
+                                if not isinstance(doc_id, ObjectId) or doc_id.generation_time >= recent}
+            self._seen_ids = {}
+            self.version += 1
+
+    def _apply(self, doc):
+        timestamp = doc.get("timestamp")
+        if timestamp is not None and timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+        with self._lock:
+            if doc.get("_id") in self._seeded_ids:
+                return
+            if doc.get("event_type") is not None:
+                self._event_counts[doc["event_type"]] += 1
+            # Interest is counted the way the rollup counters are, so deltas match the seed
+            field = classify_event(doc.get("event_type"), doc.get("status"), doc.get("interest_level"))
+            if field is not None:
+                self._interest_counts.update(interest_counts({field: 1}))
+            if timestamp is not None:
+                self.last_event_at = max(self.last_event_at or timestamp, timestamp)
+            self.version += 1
+
+    def _watch(self):
+        pipeline = [
+            {"$match": {"operationType": "insert"}},
+            {"$project": {**{f"fullDocument.{field}": 1 for field in WATCH_PROJECTION}, "operationType": 1}},
+        ]
+        # Open the stream before seeding so no insert falls between the two; a reconnect resumes instead
+        with self.collection.watch(pipeline, max_await_time_ms=1000, resume_after=self._resume_token) as stream:
+            self.mode = "change_stream"
+            if self._resume_token is None:
+                self._reseed()
+            while not self._stop.is_set():
+                change = stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is None:
+                    self._stop.wait(0.5)
+                    continue
+                self._apply(change.get("fullDocument") or {})
+
+    def _poll(self):
+        self.mode = "polling"
+        self._reseed()
+        while not self._stop.wait(self.poll_interval):
+            now = datetime.datetime.now(datetime.timezone.utc)
+            # Documents inserted before the seed were counted by it (or by the rollups)
+            window_start = max(self._seeded_at, now - datetime.timedelta(seconds=POLL_LOOKBACK_SECONDS))
+            cursor = self.collection.find({"_id": {"$gte": ObjectId.from_datetime(window_start)}}, WATCH_PROJECTION)
+            for doc in cursor:
+                if doc["_id"] in self._seen_ids:
+                    continue
+                self._seen_ids[doc["_id"]] = now
+                self._apply(doc)
+            # Forget ids that have left the window
+            self._seen_ids = {doc_id: seen for doc_id, seen in self._seen_ids.items()
+                              if seen > now - datetime.timedelta(seconds=2 * POLL_LOOKBACK_SECONDS)}
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                try:
+                    self._watch()
+                except OperationFailure:
+                    if self._resume_token is not None:
+                        # The resume point fell off the oplog: start over from a fresh seed
+                        self._resume_token = None
+                        continue
+                    # Change streams need a replica set or sharded cluster
+                    self._poll()
+            except PyMongoError as e:
+                self.error = str(e)
+                self.mode = "reconnecting"
+                self._stop.wait(RETRY_DELAY_SECONDS)
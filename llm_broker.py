@@ -0,0 +1,251 @@
+import datetime
+import functools
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from dotenv import load_dotenv
+from instrumentation import increment, timer
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+LLM_USAGE_COLLECTION = "llm_usage"
+# Budgets are shared by every caller in the process; set them a little under the account's limits
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 30000))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", os.getenv("DRAFT_MAX_RETRIES", 6)))
+LLM_MAX_BACKOFF_SECONDS = float(os.getenv("LLM_MAX_BACKOFF_SECONDS", 60))
+# Rough prompt size estimate used to reserve tokens before the real usage is known
+CHARS_PER_TOKEN = 4
+
+# Lower number is served first when both lanes are waiting for budget
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANE_PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+# ===============================
+# RATE LIMITING
+# ===============================
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute, holding at most a minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (amounts over capacity wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def give_back(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+def estimate_tokens(request):
+    prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+    return prompt_chars // CHARS_PER_TOKEN + (request.get("max_tokens") or 256)
+
+def retry_after_seconds(error):
+    """Reads the server's Retry-After hint from an API error, if it sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+# ===============================
+# BROKER
+# ===============================
+class LLMBroker:
+    """Schedules chat completions against one request and token budget per process.
+
+    Callers wait in priority order (interactive before batch, then first come
+    first served) until both budgets allow their request. Retryable errors are
+    retried with jittered exponential backoff; a 429 pauses every lane until
+    the server's Retry-After has passed, so one caller's rate limit is not
+    immediately hit again by the others. Each call's token usage is recorded in
+    the `llm_usage` collection.
+    """
+
+    def __init__(self, client, usage_collection=None, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_retries=LLM_MAX_RETRIES):
+        self.client = client
+        self.usage_collection = usage_collection
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._paused_until = 0.0
+
+    def _acquire(self, lane, tokens):
+        ticket = (LANE_PRIORITIES.get(lane, LANE_PRIORITIES[BATCH]), next(self._tickets))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._waiting[0] == ticket:
+                        wait = max(self._paused_until - time.monotonic(),
+                                   self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            return
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _settle(self, reserved, used):
+        """Corrects the token bucket once the real usage of a request is known."""
+        with self._cond:
+            if used < reserved:
+                self.tokens.give_back(reserved - used)
+            else:
+                self.tokens.take(used - reserved)
+            self._cond.notify_all()
+
+    def _pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def complete(self, lane=BATCH, **request):
+        """Runs `chat.completions.create(**request)` within the shared budget, retrying transient errors."""
+        reserved = estimate_tokens(request)
+        started = time.monotonic()
+        # One first attempt plus up to `max_retries` retries
+        for attempt in range(1, self.max_retries + 2):
+            with timer(f"llm_queue_{lane}"):
+                self._acquire(lane, reserved)
+            try:
+                with timer("openai_chat_completion"):
+                    response = self.client.chat.completions.create(**request)
+            except RETRYABLE_ERRORS as e:
+                # A failed attempt still counts against the request budget but uses no tokens
+                self._settle(reserved, 0)
+                increment("llm_retries_total", lane=lane, error=type(e).__name__)
+                if attempt > self.max_retries:
+                    self._record_usage(lane, request, None, attempt, started, type(e).__name__)
+                    raise
+                backoff = min(2 ** (attempt - 1), LLM_MAX_BACKOFF_SECONDS) + random.uniform(0, 1)
+                hint = retry_after_seconds(e)
+                if isinstance(e, RateLimitError):
+                    self._pause(hint if hint is not None else backoff)
+                time.sleep(max(backoff, hint or 0))
+                continue
+            except Exception as e:
+                self._settle(reserved, 0)
+                self._record_usage(lane, request, None, attempt, started, type(e).__name__)
+                raise
+            usage = getattr(response, "usage", None)
+            # Streams report no usage up front, so the reservation stands as the estimate
+            self._settle(reserved, usage.total_tokens if usage else reserved)
+            self._record_usage(lane, request, usage, attempt, started, "ok")
+            return response
+
+    def _record_usage(self, lane, request, usage, attempts, started, status):
+        entry = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
+            "lane": lane,
+            "model": request.get("model"),
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "total_tokens": usage.total_tokens if usage else 0,
+            "estimated": usage is None and status == "ok",
+            "attempts": attempts,
+            "latency_ms": (time.monotonic() - started) * 1000,
+            "status": status,
+        }
+        increment("llm_tokens_total", entry["total_tokens"], lane=lane, model=entry["model"])
+        if self.usage_collection is not None:
+            try:
+                self.usage_collection.insert_one(entry)
+            except PyMongoError:
+                pass
+
+    def lane(self, lane):
+        """Returns a `complete` callable bound to one lane, for use with the llm_cache helpers."""
+        return functools.partial(self.complete, lane)
+
+    def usage_summary(self, since=None):
+        return usage_summary(self.usage_collection, since)
+
+
+def usage_summary(collection, since=None):
+    """Aggregates recorded usage per lane and model: calls, tokens, retries and failures."""
+    if collection is None:
+        return []
+    since = since or datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id": {"lane": "$lane", "model": "$model"},
+            "calls": {"$sum": 1},
+            "prompt_tokens": {"$sum": "$prompt_tokens"},
+            "completion_tokens": {"$sum": "$completion_tokens"},
+            "retries": {"$sum": {"$subtract": ["$attempts", 1]}},
+            "failures": {"$sum": {"$cond": [{"$eq": ["$status", "ok"]}, 0, 1]}},
+            "avg_latency_ms": {"$avg": "$latency_ms"},
+        }},
+        {"$sort": {"_id.lane": 1, "_id.model": 1}},
+    ]
+    try:
+        return [{"lane": doc["_id"]["lane"], "model": doc["_id"]["model"],
+                 **{key: value for key, value in doc.items() if key != "_id"}}
+                for doc in collection.aggregate(pipeline)]
+    except PyMongoError:
+        return []
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_llm_broker():
+    """Returns the process-wide broker; usage only reaches the metrics if MongoDB is unavailable."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            collection = None
+            try:
+                client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+                client.admin.command('ping')
+                collection = client[MONGO_DB_NAME][LLM_USAGE_COLLECTION]
+                collection.create_index([("timestamp", -1)])
+            except Exception:
+                collection = None
+            _broker = LLMBroker(OpenAI(api_key=os.getenv("OPENAI_API_KEY")), collection)
+        return _broker
@@ -0,0 +1,197 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+LLM_CACHE_COLLECTION = "llm_cache"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2048))
+
+# ===============================
+# CACHE
+# ===============================
+def make_cache_key(model, system_prompt, user_prompt, temperature):
+    """Builds a stable cache key for a single chat completion request."""
+    raw = json.dumps([model, system_prompt, user_prompt, float(temperature)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier response cache: an in-process LRU in front of a MongoDB collection.
+
+    Entries expire after `ttl_seconds` in both tiers. MongoDB removes expired
+    documents through a TTL index; the in-memory tier evicts the least recently
+    used entry once it holds `max_entries`.
+    """
+
+    def __init__(self, collection=None, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.collection is not None:
+            try:
+                self.collection.create_index("expires_at", expireAfterSeconds=0)
+            except PyMongoError:
+                self.collection = None
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.collection is not None:
+            try:
+                doc = self.collection.find_one(
+                    {"_id": key, "expires_at": {"$gt": datetime.datetime.now(datetime.timezone.utc)}},
+                    {"response": 1, "expires_at": 1}
+                )
+            except PyMongoError:
+                doc = None
+            if doc:
+                expires_at = doc["expires_at"].replace(tzinfo=datetime.timezone.utc).timestamp()
+                self._remember(key, doc["response"], expires_at)
+                with self._lock:
+                    self.persistent_hits += 1
+                return doc["response"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value, model=None):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        if self.collection is not None:
+            try:
+                self.collection.replace_one(
+                    {"_id": key},
+                    {
+                        "response": value,
+                        "model": model,
+                        "created_at": datetime.datetime.now(datetime.timezone.utc),
+                        "expires_at": datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc),
+                    },
+                    upsert=True
+                )
+            except PyMongoError:
+                pass
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Returns the process-wide cache, falling back to memory-only if MongoDB is unavailable."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            collection = None
+            try:
+                client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+                client.admin.command('ping')
+                collection = client[MONGO_DB_NAME][LLM_CACHE_COLLECTION]
+            except Exception:
+                collection = None
+            _cache = LLMResponseCache(collection)
+        return _cache
+
+def cached_chat_completion(complete, model, system_prompt, user_prompt, temperature, max_tokens, refresh=False):
+    """Returns the completion text for a system/user prompt pair, serving repeats from the cache.
+
+    `complete` is called with the usual chat completion keyword arguments on a
+    miss. Pass `refresh=True` to skip the lookup and overwrite the cached entry.
+    """
+    cache = get_llm_cache()
+    key = make_cache_key(model, system_prompt, user_prompt, temperature)
+    if not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = complete(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    text = response.choices[0].message.content
+    cache.set(key, text, model=model)
+    return text
+
+def streamed_chat_completion(complete, model, system_prompt, user_prompt, temperature, max_tokens):
+    """Yields completion text as it arrives and caches the full text once the stream ends.
+
+    The cache is never read here: streaming is used when a fresh completion is
+    wanted, and the finished text replaces whatever was cached for the request.
+    """
+    stream = complete(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+    )
+    parts = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    get_llm_cache().set(make_cache_key(model, system_prompt, user_prompt, temperature), "".join(parts), model=model)
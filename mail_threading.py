@@ -0,0 +1,55 @@
+import re
+from email.utils import make_msgid
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MESSAGE_ID_PATTERN = re.compile(r"<[^<>\s]+>")
+THREAD_ORIGIN_PROJECTION = {
+    "message_id": 1, "recipient_email": 1, "original_recipient": 1, "campaign_id": 1, "sender": 1,
+}
+
+# ===============================
+# MESSAGE-ID HELPERS
+# ===============================
+def new_message_id(sender_email):
+    """Generates a globally unique Message-ID on the sender's domain."""
+    domain = sender_email.split("@")[-1] if sender_email and "@" in sender_email else None
+    return make_msgid(domain=domain)
+
+def parse_message_ids(header_value):
+    """Extracts the <...> message ids from an In-Reply-To or References header."""
+    if not header_value:
+        return []
+    return MESSAGE_ID_PATTERN.findall(str(header_value))
+
+def reference_chain(in_reply_to, references):
+    """Returns the References value for a reply: the parent's chain followed by the parent."""
+    chain = list(references or [])
+    if in_reply_to and in_reply_to not in chain:
+        chain.append(in_reply_to)
+    return chain
+
+# ===============================
+# DATABASE
+# ===============================
+def setup_thread_indexes(db):
+    db.email_logs.create_index("message_id", sparse=True)
+
+def find_thread_origin(db, in_reply_to=None, references=None):
+    """Finds the outbound log entry an inbound message answers, via the indexed message_id.
+
+    In-Reply-To is checked first, then References from the most recent ancestor
+    backwards, all in a single `$in` query.
+    """
+    candidates = parse_message_ids(in_reply_to) + list(reversed(references or []))
+    if not candidates:
+        return None
+    matches = {
+        doc["message_id"]: doc
+        for doc in db.email_logs.find({"message_id": {"$in": candidates}}, THREAD_ORIGIN_PROJECTION)
+    }
+    for message_id in candidates:
+        if message_id in matches:
+            return matches[message_id]
+    return None
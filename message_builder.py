@@ -0,0 +1,88 @@
+import email.quoprimime
+import time
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import formatdate
+from functools import lru_cache
+
+# ===============================
+# CONFIGURATION
+# ===============================
+CRLF = b"\r\n"
+MAX_7BIT_LINE = 998
+
+# ===============================
+# HEADER SKELETONS
+# ===============================
+def _fold(name, value):
+    return SMTP.fold_binary(name, value)
+
+def _header(name, value):
+    """Folds a per-message header through the policy's header classes.
+
+    Non-ASCII display names are RFC 2047-encoded; values containing CR or LF
+    are refused so a stored address can't inject extra headers.
+    """
+    value = str(value)
+    if "\r" in value or "\n" in value:
+        raise ValueError(f"{name} header may not contain CR or LF characters")
+    # Short plain-ASCII values fold to themselves, so the (slow) header parser is skipped for them
+    if value.isascii() and len(name) + len(value) + 2 <= SMTP.max_line_length:
+        return f"{name}: {value}".encode("ascii") + CRLF
+    return SMTP.header_factory(name, value).fold(policy=SMTP).encode("ascii")
+
+@lru_cache(maxsize=256)
+def message_skeleton(sender, subject):
+    """Folded, RFC 2047-encoded header bytes shared by every message with this sender and subject.
+
+    Built once through EmailMessage so non-ASCII subjects are encoded
+    correctly, then reused as plain bytes.
+    """
+    skeleton = EmailMessage(policy=SMTP)
+    skeleton["From"] = sender
+    skeleton["Subject"] = subject
+    skeleton["MIME-Version"] = "1.0"
+    return b"".join(_fold(name, value) for name, value in skeleton.items())
+
+@lru_cache(maxsize=4)
+def _date_header(second):
+    return _fold("Date", formatdate(second, usegmt=True))
+
+def _encode_body(body):
+    """Returns (content headers, body bytes) using 7bit when possible, else quoted-printable UTF-8."""
+    text = body.replace("\r\n", "\n").replace("\r", "\n")
+    try:
+        encoded = text.encode("ascii")
+        if all(len(line) <= MAX_7BIT_LINE for line in encoded.split(b"\n")):
+            headers = b'Content-Type: text/plain; charset="us-ascii"\r\nContent-Transfer-Encoding: 7bit\r\n'
+            return headers, encoded.replace(b"\n", CRLF)
+    except UnicodeEncodeError:
+        pass
+    headers = b'Content-Type: text/plain; charset="utf-8"\r\nContent-Transfer-Encoding: quoted-printable\r\n'
+    qp = email.quoprimime.body_encode(text.encode("utf-8").decode("latin-1"), eol="\r\n")
+    return headers, qp.encode("ascii")
+
+# ===============================
+# MESSAGE CONSTRUCTION
+# ===============================
+def build_message(sender, recipient, subject, body, message_id, in_reply_to=None, references=None):
+    """Serializes a single-part text/plain message to bytes ready for smtplib's sendmail().
+
+    Only the recipient, ids, date and body are rendered per message; the
+    rest of the header block comes from the cached skeleton. Raises
+    ValueError for header values that would break the header block.
+    """
+    content_headers, body_bytes = _encode_body(body)
+    parts = [
+        message_skeleton(sender, subject),
+        _header("To", recipient),
+        _date_header(int(time.time())),
+        _header("Message-ID", message_id),
+    ]
+    if in_reply_to:
+        parts.append(_header("In-Reply-To", in_reply_to))
+        parts.append(_header("References", " ".join(references) if references else in_reply_to))
+    parts += [content_headers, CRLF, body_bytes]
+    if not body_bytes.endswith(CRLF):
+        parts.append(CRLF)
+    return b"".join(parts)
@@ -0,0 +1,75 @@
+import streamlit as st
+import pandas as pd
+import os
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from instrumentation import METRICS_PORT, latency_summary, render_prometheus, reset_metrics
+from llm_broker import LLM_USAGE_COLLECTION, usage_summary
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+
+# ===============================
+# DATABASE FUNCTIONS
+# ===============================
+@st.cache_resource
+def init_connection():
+    """Returns the llm_usage collection, or None if MongoDB is unreachable."""
+    try:
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+        client.admin.command('ping')
+        return client[MONGO_DB_NAME][LLM_USAGE_COLLECTION]
+    except Exception:
+        return None
+
+# ===============================
+# MAIN STREAMLIT APP
+# ===============================
+def main():
+    st.title("⏱ Performance")
+    st.caption("Latency of the pipeline's hot paths since this server process started. "
+               + (f"Prometheus scrapes `/metrics` on port {METRICS_PORT}." if METRICS_PORT
+                  else "Set `METRICS_PORT` to expose them to Prometheus."))
+
+    rows = latency_summary()
+    if not rows:
+        st.info("No timings recorded yet. Send emails, handle replies or scrape to collect some.")
+        return
+
+    df = pd.DataFrame(rows)
+    operations = df[df["metric"] == "operation_duration_seconds"].drop(columns="metric")
+    mongo = df[df["metric"] == "mongo_command_duration_seconds"].drop(columns="metric")
+
+    tab1, tab2, tab3, tab4 = st.tabs(["Operations", "MongoDB Commands", "LLM Usage (24h)", "Prometheus"])
+    with tab1:
+        st.dataframe(operations.sort_values("total_s", ascending=False), hide_index=True, use_container_width=True,
+                     column_config={col: st.column_config.NumberColumn(format="%.1f")
+                                    for col in ["avg_ms", "p50_ms", "p95_ms", "p99_ms"]})
+        if not operations.empty:
+            st.bar_chart(operations.set_index("series")["p95_ms"])
+    with tab2:
+        if mongo.empty:
+            st.info("No MongoDB commands timed yet.")
+        else:
+            st.dataframe(mongo.sort_values("total_s", ascending=False), hide_index=True, use_container_width=True)
+    with tab3:
+        usage = usage_summary(init_connection())
+        if not usage:
+            st.info("No LLM usage recorded in the last 24 hours.")
+        else:
+            st.dataframe(pd.DataFrame(usage), hide_index=True, use_container_width=True,
+                         column_config={"avg_latency_ms": st.column_config.NumberColumn(format="%.0f")})
+    with tab4:
+        metrics_text = render_prometheus()
+        st.code(metrics_text, language="text")
+        st.download_button("⬇️ Download metrics", data=metrics_text, file_name="metrics.prom", mime="text/plain")
+
+    if st.button("🔄 Reset Timings"):
+        reset_metrics()
+        st.rerun()
@@ -0,0 +1,208 @@
+import cProfile
+import datetime
+import marshal
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict, deque
+import streamlit as st
+import pandas as pd
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pyinstrument is optional; cProfile is always available
+    SamplingProfiler = None
+
+# ===============================
+# CONFIGURATION
+# ===============================
+# Profile every render, or only sessions opened with ?profile=1
+PROFILE_PAGES = os.getenv("PROFILE_PAGES", "false").lower() == "true"
+# "cprofile" (deterministic), "pyinstrument" (sampling) or "auto" (pyinstrument when installed)
+PROFILE_BACKEND = os.getenv("PROFILE_BACKEND", "auto").lower()
+PROFILE_HISTORY = int(os.getenv("PROFILE_HISTORY", 20))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", 25))
+# Bounds for reconstructing cProfile stacks: deeper or smaller paths are folded into their parent
+PROFILE_COLLAPSED_MAX_DEPTH = int(os.getenv("PROFILE_COLLAPSED_MAX_DEPTH", 48))
+PROFILE_COLLAPSED_MIN_SHARE = float(os.getenv("PROFILE_COLLAPSED_MIN_SHARE", 0.0005))
+PROFILE_COLLAPSED_MAX_STACKS = int(os.getenv("PROFILE_COLLAPSED_MAX_STACKS", 20000))
+
+_history = defaultdict(lambda: deque(maxlen=PROFILE_HISTORY))
+_history_lock = threading.Lock()
+
+def profiling_enabled():
+    return PROFILE_PAGES or st.query_params.get("profile") == "1"
+
+def _backend():
+    if PROFILE_BACKEND == "pyinstrument" or (PROFILE_BACKEND == "auto" and SamplingProfiler is not None):
+        if SamplingProfiler is not None:
+            return "pyinstrument"
+    return "cprofile"
+
+# ===============================
+# CPROFILE OUTPUT
+# ===============================
+def _function_label(func):
+    file_name, line, name = func
+    if file_name == "~":
+        return name
+    return f"{name} ({os.path.basename(file_name)}:{line})"
+
+def _cprofile_top(stats, limit):
+    rows = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({"function": _function_label(func), "calls": nc,
+                     "self_ms": tt * 1000, "cumulative_ms": ct * 1000})
+    return sorted(rows, key=lambda row: row["self_ms"], reverse=True)[:limit]
+
+def _cprofile_collapsed(stats):
+    """Approximates collapsed stacks (flamegraph.pl / speedscope input) from cProfile's caller graph.
+
+    cProfile only records caller->callee edges, so a function's time is split
+    between its callers in proportion to the time each edge accounts for.
+    Enumerating every caller path is exponential in the graph, so paths below
+    PROFILE_COLLAPSED_MIN_SHARE of the total, deeper than
+    PROFILE_COLLAPSED_MAX_DEPTH or beyond PROFILE_COLLAPSED_MAX_STACKS are cut
+    and their time is credited to the stack that reached them.
+    """
+    children = defaultdict(list)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            children[caller].append((func, edge[3]))
+
+    total_time = sum(stats.stats[root][3] for root in roots)
+    min_time = total_time * PROFILE_COLLAPSED_MIN_SHARE
+    lines = defaultdict(float)
+
+    def walk(func, path, inclusive):
+        total_ct = stats.stats[func][3]
+        share = inclusive / total_ct if total_ct else 0
+        label = ";".join(path)
+        self_time = stats.stats[func][2] * share
+        for child, edge_ct in children.get(func, []):
+            child_label = _function_label(child)
+            child_time = edge_ct * share
+            if child_label in path or child_time <= 0:
+                continue
+            if child_time < min_time or len(path) >= PROFILE_COLLAPSED_MAX_DEPTH \
+                    or len(lines) >= PROFILE_COLLAPSED_MAX_STACKS:
+                self_time += child_time
+                continue
+            walk(child, path + [child_label], child_time)
+        if self_time > 0:
+            lines[label] += self_time
+
+    for root in roots:
+        walk(root, [_function_label(root)], stats.stats[root][3])
+    return "\n".join(f"{stack} {int(seconds * 1e6)}" for stack, seconds in lines.items() if seconds * 1e6 >= 1)
+
+# ===============================
+# PYINSTRUMENT OUTPUT
+# ===============================
+def _frame_label(frame):
+    return f"{frame.function} ({os.path.basename(frame.file_path or '?')}:{frame.line_no})"
+
+def _frame_self_time(frame):
+    return frame.time - sum(child.time for child in frame.children)
+
+def _pyinstrument_top(root, limit):
+    totals = defaultdict(lambda: {"calls": 0, "self_ms": 0.0, "cumulative_ms": 0.0})
+    stack = [root] if root else []
+    while stack:
+        frame = stack.pop()
+        row = totals[_frame_label(frame)]
+        row["calls"] += 1
+        row["self_ms"] += _frame_self_time(frame) * 1000
+        row["cumulative_ms"] += frame.time * 1000
+        stack.extend(frame.children)
+    rows = [{"function": label, **values} for label, values in totals.items()]
+    return sorted(rows, key=lambda row: row["self_ms"], reverse=True)[:limit]
+
+def _pyinstrument_collapsed(root):
+    lines = []
+
+    def walk(frame, path):
+        path = path + [_frame_label(frame)]
+        self_time = _frame_self_time(frame)
+        if self_time > 0:
+            lines.append(f"{';'.join(path)} {int(self_time * 1e6)}")
+        for child in frame.children:
+            walk(child, path)
+
+    if root:
+        walk(root, [])
+    return "\n".join(lines)
+
+# ===============================
+# PAGE PROFILING
+# ===============================
+def profile_page(page, render):
+    """Runs a page's main() under the profiler and records the result in the page's ring buffer.
+
+    Streamlit's st.rerun()/st.stop() raise control-flow exceptions; the
+    profile is still recorded before they propagate.
+    """
+    backend = _backend()
+    profiler = SamplingProfiler() if backend == "pyinstrument" else cProfile.Profile()
+    try:
+        profiler.start() if backend == "pyinstrument" else profiler.enable()
+    except (RuntimeError, ValueError):
+        # Another profiler already owns this thread
+        return render()
+    started = time.perf_counter()
+    try:
+        return render()
+    finally:
+        duration = time.perf_counter() - started
+        if backend == "pyinstrument":
+            profiler.stop()
+            root = profiler.last_session.root_frame() if profiler.last_session else None
+            record = {"top": _pyinstrument_top(root, PROFILE_TOP_N),
+                      "build_collapsed": lambda: _pyinstrument_collapsed(root), "prof": None}
+        else:
+            profiler.disable()
+            stats = pstats.Stats(profiler)
+            # Collapsed stacks are only built when asked for, keeping the render path cheap
+            record = {"top": _cprofile_top(stats, PROFILE_TOP_N),
+                      "build_collapsed": lambda: _cprofile_collapsed(stats), "prof": marshal.dumps(stats.stats)}
+        record.update({"page": page, "backend": backend, "duration_ms": duration * 1000,
+                       "recorded_at": datetime.datetime.now(datetime.timezone.utc)})
+        with _history_lock:
+            _history[page].append(record)
+
+def page_profiles(page):
+    with _history_lock:
+        return list(_history[page])
+
+def render_profile_panel(page):
+    """Shows the latest profile of `page` with downloads for pstats and collapsed-stack output."""
+    profiles = page_profiles(page)
+    if not profiles:
+        return
+    latest = profiles[-1]
+    slug = page.lower().replace(" ", "_")
+    stamp = latest["recorded_at"].strftime("%Y%m%d_%H%M%S")
+    with st.expander(f"🔬 Render profile: {latest['duration_ms']:.0f} ms ({latest['backend']})"):
+        st.caption(f"Top {PROFILE_TOP_N} functions by self time in the last render. "
+                   f"The last {PROFILE_HISTORY} renders of each page are kept.")
+        st.dataframe(pd.DataFrame(latest["top"]), hide_index=True, use_container_width=True,
+                     column_config={col: st.column_config.NumberColumn(format="%.2f")
+                                    for col in ["self_ms", "cumulative_ms"]})
+        st.line_chart(pd.DataFrame({"render ms": [profile["duration_ms"] for profile in profiles]}))
+        d_col1, d_col2 = st.columns(2)
+        with d_col1:
+            if latest.get("collapsed") is None and st.button("🔥 Build collapsed stacks", key=f"collapse_{slug}"):
+                latest["collapsed"] = latest["build_collapsed"]()
+            if latest.get("collapsed") is not None:
+                st.download_button("⬇️ Collapsed stacks (flamegraph)", data=latest["collapsed"],
+                                   file_name=f"{slug}_{stamp}.collapsed.txt", mime="text/plain",
+                                   help="Open in speedscope.app or render with flamegraph.pl.")
+        with d_col2:
+            if latest["prof"] is not None:
+                st.download_button("⬇️ cProfile stats (.prof)", data=latest["prof"],
+                                   file_name=f"{slug}_{stamp}.prof", mime="application/octet-stream",
+                                   help="Load with pstats, snakeviz or flameprof.")
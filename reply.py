@@ -1,17 +1,25 @@
 import streamlit as st
 import imaplib
 import email
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import email.utils
 import smtplib
 import datetime
 import pandas as pd
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, OperationFailure
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from urllib.parse import quote
+from analytics_rollup import record_event
+from bounce_processing import apply_bounces, is_bounce, parse_bounce, setup_bounce_indexes
+from bulk_smtp import BulkSmtpSender, batched
+from contact_schema import setup_contact_schema_indexes
+from message_builder import build_message
+from mail_threading import find_thread_origin, new_message_id, parse_message_ids, reference_chain, setup_thread_indexes
+from email_templates import load_templates_from_db, render_with_unsubscribe
+from llm_broker import INTERACTIVE, get_llm_broker
+from llm_cache import cached_chat_completion
+from instrumentation import timed, timer
+from reporting import report
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,7 +27,6 @@ load_dotenv()
 # ===============================
 # CONFIGURATION
 # ===============================
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 EMAIL = os.getenv("SENDER_EMAIL")
@@ -28,8 +35,13 @@ SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 IMAP_SERVER = os.getenv("IMAP_SERVER")
 IMAP_PORT = int(os.getenv("IMAP_PORT", 993))
+# Plain connections are only for local test servers (see benchmarks/)
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() != "false"
+IMAP_USE_SSL = os.getenv("IMAP_USE_SSL", "true").lower() != "false"
 SCHEDULING_LINK = os.getenv("SCHEDULING_LINK")
 OTHER_SERVICES_LINK = os.getenv("OTHER_SERVICES_LINK")
+# Three days by default; the scheduler checks for due follow-ups every few minutes
+FOLLOW_UP_WAIT_MINUTES = float(os.getenv("FOLLOW_UP_WAIT_MINUTES", 3 * 1440))
 
 # ===============================
 # DATABASE FUNCTIONS
@@ -41,27 +53,45 @@ def get_db_connection():
         db = client[MONGO_DB_NAME]
         return client, db
     except ConnectionFailure as e:
-        st.error(f"❌ *Database Connection Error:* {e}")
+        report.error(f"❌ *Database Connection Error:* {e}")
         return None, None
 
 def setup_database_indexes(db):
     """Ensures all required unique indexes exist."""
     try:
         db.unsubscribe_list.create_index("email", unique=True)
+        db.email_logs.create_index("recipient_email")
+        setup_thread_indexes(db)
+        setup_bounce_indexes(db)
+        setup_contact_schema_indexes(db)
     except OperationFailure as e:
-        st.error(f"❌ Failed to set up database indexes: {e}")
+        report.error(f"❌ Failed to set up database indexes: {e}")
 
-def log_event_to_db(db, event_type, email_addr, subject, status=None, interest_level=None, mail_id=None, body=None):
+def is_known_contact(db, email_addr):
+    """Indexed point lookup: only people we have already emailed get classified and answered."""
+    addresses = list({email_addr, email_addr.strip().lower()})
+    return db.email_logs.find_one({"recipient_email": {"$in": addresses}}, {"_id": 1}) is not None
+
+def log_event_to_db(db, event_type, email_addr, subject, status=None, interest_level=None, mail_id=None, body=None,
+                    message_id=None, in_reply_to=None, original_recipient=None, campaign_id=None):
     try:
         log_entry = {
             "timestamp": datetime.datetime.now(datetime.timezone.utc),
             "event_type": event_type, "recipient_email": email_addr,
             "subject": subject, "status": status, "interest_level": interest_level,
-            "mail_id": mail_id, "body": body
+            "mail_id": mail_id, "body": body, "sender": EMAIL,
+            "message_id": message_id, "in_reply_to": in_reply_to,
+            "original_recipient": original_recipient, "campaign_id": campaign_id
         }
         db.email_logs.insert_one(log_entry)
     except Exception as e:
-        st.error(f"❌ Failed to log event to database: {e}")
+        report.error(f"❌ Failed to log event to database: {e}")
+        return
+    try:
+        record_event(db, event_type, log_entry["timestamp"], status=status, interest_level=interest_level,
+                     campaign_id=campaign_id, sender=EMAIL)
+    except Exception as e:
+        report.warning(f"⚠ Failed to update analytics rollups: {e}")
 
 # ===============================
 # AI & EMAIL FUNCTIONS
@@ -76,6 +106,7 @@ def check_interest_manually(email_body):
     if any(keyword in body_lower for keyword in positive_keywords): return "positive"
     return "neutral"
 
+@timed()
 def check_interest_with_openai(email_body):
     """Tries to classify business interest with OpenAI, falls back to manual check on failure."""
     try:
@@ -90,32 +121,60 @@ def check_interest_with_openai(email_body):
         - Email: "Can you send me more details?" -> neutral
         - Email: "Please remove me from your mailing list." -> negative
         """
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Classify this email reply:\n\n\"{email_body}\""}
-            ],
-            max_tokens=5,
-            temperature=0
-        )
-        interest = response.choices[0].message.content.strip().lower().replace(".", "")
+        interest = cached_chat_completion(
+            get_llm_broker().lane(INTERACTIVE),
+            model="gpt-4o", system_prompt=system_prompt,
+            user_prompt=f"Classify this email reply:\n\n\"{email_body}\"",
+            temperature=0, max_tokens=5,
+        ).strip().lower().replace(".", "")
         return interest if interest in ["positive", "negative", "neutral"] else "neutral"
     except Exception as e:
-        st.warning(f"⚠ OpenAI API failed. Falling back to keyword-based analysis. (Error: {e})")
+        report.warning(f"⚠ OpenAI API failed. Falling back to keyword-based analysis. (Error: {e})")
         return check_interest_manually(email_body)
 
+def open_smtp_session():
+    """Connects and authenticates to the SMTP server; use as a context manager."""
+    with timer("smtp_connect"):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    if SMTP_USE_TLS:
+        with timer("smtp_starttls"):
+            server.starttls()
+    with timer("smtp_login"):
+        server.login(EMAIL, PASSWORD)
+    return server
+
+def open_inbox():
+    imap_class = imaplib.IMAP4_SSL if IMAP_USE_SSL else imaplib.IMAP4
+    mail = imap_class(IMAP_SERVER, IMAP_PORT)
+    mail.login(EMAIL, PASSWORD)
+    mail.select("inbox")
+    return mail
+
+def safe_parse_bounce(msg, mail_id):
+    """Parses a DSN; a bounce that can't be parsed comes back as {"malformed": True} so it is never answered."""
+    try:
+        return parse_bounce(msg)
+    except Exception as e:
+        report.warning(f"⚠ Could not parse delivery report in email {mail_id}: {e}")
+    try:
+        return {"malformed": True} if is_bounce(msg) else None
+    except Exception:
+        # Can't even tell whether it is a bounce: keep it away from automatic replies
+        return {"malformed": True}
+
+@timed()
 def get_unread_emails():
     """Fetches unread emails from the inbox."""
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
-        mail.login(EMAIL, PASSWORD)
-        mail.select("inbox")
-        _, data = mail.search(None, '(UNSEEN)')
+        with timer("imap_connect"):
+            mail = open_inbox()
+        with timer("imap_search"):
+            _, data = mail.search(None, '(UNSEEN)')
         unread_ids = data[0].split()
         emails = []
         for e_id in unread_ids:
-            _, msg_data = mail.fetch(e_id, '(RFC822)')
+            with timer("imap_fetch"):
+                _, msg_data = mail.fetch(e_id, '(RFC822)')
             msg = email.message_from_bytes(msg_data[0][1])
             from_addr = email.utils.parseaddr(msg["From"])[1]
             subject = msg["Subject"]
@@ -127,59 +186,80 @@ def get_unread_emails():
                         break
             else:
                 body = msg.get_payload(decode=True).decode(errors='ignore')
-            emails.append({"from": from_addr, "subject": subject, "body": body, "id": e_id.decode()})
+            in_reply_to = parse_message_ids(msg["In-Reply-To"])
+            emails.append({
+                "from": from_addr, "subject": subject, "body": body, "id": e_id.decode(),
+                "message_id": (parse_message_ids(msg["Message-ID"]) or [None])[0],
+                "in_reply_to": in_reply_to[0] if in_reply_to else None,
+                "references": parse_message_ids(msg["References"]),
+                "bounce": safe_parse_bounce(msg, e_id.decode())
+            })
         mail.logout()
         return emails
     except Exception as e:
-        st.error(f"❌ Failed to fetch emails: {e}")
+        report.error(f"❌ Failed to fetch emails: {e}")
         return []
 
-def send_reply(db, to_email, original_subject, interest_level, mail_id):
-    """Sends a reply based on the classified interest level."""
-    body = ""
+@timed()
+def send_reply(db, to_email, original_subject, interest_level, mail_id, in_reply_to=None, references=None,
+               thread_origin=None):
+    """Sends a reply based on the classified interest level, threaded under the inbound message."""
     subject = f"Re: {original_subject}"
 
     if interest_level == "positive":
-        body = f"Hi,\n\nThank you for your positive response! I'm glad to hear you're interested.\n\nYou can book a meeting with me directly here: {SCHEDULING_LINK}\n\nI look forward to speaking with you.\n\nBest regards,\nAasrith"
+        template_name = "reply_positive"
     elif interest_level in ["negative", "neutral"]:
-        body = f"Hi,\n\nThank you for getting back to me. I understand.\n\nIn case you're interested, we also offer other services which you can explore here: {OTHER_SERVICES_LINK}\n\nBest regards,\nAasrith"
+        template_name = "reply_other"
     else:
         return
 
-    # Append the unsubscribe link to all replies
-    unsubscribe_link_url = f"https://unsubscribe-52pwl9yyy-gowthami-gs-projects.vercel.app/unsubscribe?email={quote(to_email)}"
-    unsubscribe_text = f"\n\nIf you prefer not to receive future emails, you can unsubscribe here: {unsubscribe_link_url}"
-    final_body = body + unsubscribe_text
+    # Every reply carries the recipient's unsubscribe link
+    final_body = render_with_unsubscribe(template_name, to_email)
 
-    msg = MIMEMultipart()
-    msg["From"], msg["To"], msg["Subject"] = EMAIL, to_email, subject
-    msg.attach(MIMEText(final_body, "plain"))
+    message_id = new_message_id(EMAIL)
+    thread_origin = thread_origin or {}
 
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL, PASSWORD)
-            server.sendmail(EMAIL, to_email, msg.as_string())
-        st.success(f"✅ Sent '{interest_level}' reply to {to_email}")
-        log_event_to_db(db, f"replied_{interest_level}", to_email, subject, "success", interest_level, mail_id, final_body)
+        msg = build_message(EMAIL, to_email, subject, final_body, message_id, in_reply_to,
+                            reference_chain(in_reply_to, references) if in_reply_to else None)
+        with open_smtp_session() as server:
+            with timer("smtp_send"):
+                server.sendmail(EMAIL, to_email, msg)
+        report.success(f"✅ Sent '{interest_level}' reply to {to_email}")
+        log_event_to_db(db, f"replied_{interest_level}", to_email, subject, "success", interest_level, mail_id, final_body,
+                        message_id=message_id, in_reply_to=in_reply_to,
+                        original_recipient=thread_origin.get("original_recipient") or thread_origin.get("recipient_email"),
+                        campaign_id=thread_origin.get("campaign_id"))
         mark_as_read(mail_id)
     except Exception as e:
-        st.error(f"❌ Failed to send reply to {to_email}: {e}")
+        report.error(f"❌ Failed to send reply to {to_email}: {e}")
 
 def mark_as_read(mail_id):
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER); mail.login(EMAIL, PASSWORD); mail.select("inbox")
+        mail = open_inbox()
         mail.store(mail_id.encode(), '+FLAGS', '\\Seen'); mail.logout()
     except Exception as e:
-        st.warning(f"Could not mark email {mail_id} as read: {e}")
+        report.warning(f"Could not mark email {mail_id} as read: {e}")
+
+def flag_for_review(mail_id):
+    """Stars a message in the mailbox and marks it read, so a person handles it instead of the automation."""
+    try:
+        mail = open_inbox()
+        mail.store(mail_id.encode(), '+FLAGS', '(\\Flagged \\Seen)'); mail.logout()
+    except Exception as e:
+        report.warning(f"Could not flag email {mail_id} for review: {e}")
 
 # ===============================
 # AUTOMATED TASK PROCESSING
 # ===============================
+@timed()
 def process_follow_ups(db):
     """Sends a follow-up to contacts who haven't replied to the last outreach email."""
-    waiting_period = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=2)
-    replied_emails = db.email_logs.distinct("recipient_email", {"event_type": {"$regex": "^replied"}})
+    waiting_period = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=FOLLOW_UP_WAIT_MINUTES)
+    # A reply from a different address still counts for the thread's original recipient
+    replied_filter = {"event_type": {"$regex": "^replied"}}
+    replied_emails = list(set(db.email_logs.distinct("recipient_email", replied_filter)) |
+                          set(db.email_logs.distinct("original_recipient", replied_filter)) - {None})
 
     pipeline = [
         {'$match': {'event_type': {'$in': ['initial_outreach', 'follow_up_sent']}}},
@@ -187,6 +267,7 @@ def process_follow_ups(db):
         {'$group': {
             '_id': '$recipient_email',
             'last_contact_time': {'$last': '$timestamp'},
+            'last_message_id': {'$last': '$message_id'},
             'outreach_count': {'$sum': 1}
         }},
         {'$match': {
@@ -202,28 +283,40 @@ def process_follow_ups(db):
 
     unsubscribed_docs = db.unsubscribe_list.find({}, {'email': 1})
     unsubscribed_emails = {doc['email'] for doc in unsubscribed_docs}
+    subject = "Quick Follow-Up"
+    pending = [candidate for candidate in candidates if candidate['_id'] not in unsubscribed_emails]
     actions_taken = 0
+    for batch in batched(pending):
+        outgoing = {}
+        for candidate in batch:
+            email_to_follow_up = candidate['_id']
+            body = render_with_unsubscribe("follow_up", email_to_follow_up)
+            message_id = new_message_id(EMAIL)
+            # Thread the follow-up under the previous message so replies to it correlate
+            try:
+                msg = build_message(EMAIL, email_to_follow_up, subject, body, message_id,
+                                    candidate.get('last_message_id'))
+            except ValueError as e:
+                report.error(f"❌ Cannot build follow-up to {email_to_follow_up!r}: {e}")
+                continue
+            outgoing[email_to_follow_up] = {"body": body, "message_id": message_id,
+                                            "in_reply_to": candidate.get('last_message_id'), "msg": msg}
 
-    for candidate in candidates:
-        email_to_follow_up = candidate['_id']
-        if email_to_follow_up in unsubscribed_emails: continue
-
-        subject = "Quick Follow-Up"
-        body_content = f"Hi,\n\nJust wanted to quickly follow up on my previous email. If it's not the right time, no worries.\n\nWe also have other services you might find interesting: {OTHER_SERVICES_LINK}\n\nBest regards,\nAasrith"
-        unsubscribe_link_url = f"https://unsubscribe-52pwl9yyy-gowthami-gs-projects.vercel.app/unsubscribe?email={quote(email_to_follow_up)}"
-        unsubscribe_text = f"\n\nIf you prefer not to receive future emails, you can unsubscribe here: {unsubscribe_link_url}"
-        body = body_content + unsubscribe_text
-        
-        msg = MIMEMultipart(); msg["From"], msg["To"], msg["Subject"] = EMAIL, email_to_follow_up, subject; msg.attach(MIMEText(body, "plain"))
-        try:
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls(); server.login(EMAIL, PASSWORD)
-                server.sendmail(EMAIL, email_to_follow_up, msg.as_string())
-            st.success(f"✅ Follow-up sent to {email_to_follow_up}")
-            log_event_to_db(db, "follow_up_sent", email_to_follow_up, subject, "success", body=body)
-            actions_taken += 1
-        except Exception as e:
-            st.error(f"❌ Failed to send follow-up to {email_to_follow_up}: {e}")
+        def log_result(result):
+            # Logged as soon as the server accepts it, so an interrupted sweep doesn't send it again
+            item = outgoing[result.key]
+            if not result.ok:
+                report.error(f"❌ Failed to send follow-up to {result.key}: {result.error or result.refused.get(result.key)}")
+                return
+            report.success(f"✅ Follow-up sent to {result.key}")
+            log_event_to_db(db, "follow_up_sent", result.key, subject, "success", body=item["body"],
+                            message_id=item["message_id"], in_reply_to=item["in_reply_to"])
+
+        # Bodies carry per-recipient unsubscribe links, so each message has one RCPT but all share a session
+        sender = BulkSmtpSender(open_smtp_session, EMAIL)
+        with timer("send_follow_ups"):
+            results = sender.send(((to, to, item["msg"]) for to, item in outgoing.items()), on_result=log_result)
+        actions_taken += sum(result.ok for result in results)
     return actions_taken
 
 def process_unsubscribes(db):
@@ -254,12 +347,75 @@ def process_unsubscribes(db):
                     }},
                     upsert=True
                 )
-                st.warning(f"🚫 Added {email_addr} to unsubscribe list.")
+                report.warning(f"🚫 Added {email_addr} to unsubscribe list.")
                 actions_taken += 1
             except Exception as e:
-                st.error(f"Failed to add {email_addr} to unsubscribe list: {e}")
+                report.error(f"Failed to add {email_addr} to unsubscribe list: {e}")
     return actions_taken
 
+def process_inbox(db):
+    """Handles unread mail: bounces feed suppression, replies from known contacts are classified and answered."""
+    unread_emails = get_unread_emails()
+    # Delivery failures are never classified as replies
+    malformed = [mail for mail in unread_emails if mail["bounce"] and mail["bounce"].get("malformed")]
+    bounces = [mail for mail in unread_emails if mail["bounce"] and not mail["bounce"].get("malformed")]
+    unread_emails = [mail for mail in unread_emails if not mail["bounce"]]
+    for mail in malformed:
+        report.warning(f"⚠️ Flagged unreadable delivery report {mail['id']} from {mail['from']} for manual review.")
+        flag_for_review(mail["id"])
+    if bounces:
+        try:
+            suppressed = apply_bounces(db, [mail["bounce"] for mail in bounces])
+            report.write(f"Processed {len(bounces)} bounce notification(s); suppressed {suppressed} address(es).")
+            for mail in bounces:
+                mark_as_read(mail["id"])
+        except Exception as e:
+            report.error(f"❌ Failed to process bounces: {e}")
+    if unread_emails:
+        report.write(f"Found {len(unread_emails)} new email(s).")
+        for mail in unread_emails:
+            report.write(f"Processing reply from: {mail['from']}")
+
+            thread_origin = find_thread_origin(db, mail["in_reply_to"], mail["references"])
+            if thread_origin or is_known_contact(db, mail['from']):
+                origin = thread_origin or {}
+                log_event_to_db(db, "received", mail["from"], mail["subject"], mail_id=mail["id"], body=mail["body"],
+                                message_id=mail["message_id"], in_reply_to=mail["in_reply_to"],
+                                original_recipient=origin.get("original_recipient") or origin.get("recipient_email"),
+                                campaign_id=origin.get("campaign_id"))
+                interest = check_interest_with_openai(mail["body"])
+                report.write(f"-> Interest level: *{interest}*")
+                send_reply(db, mail["from"], mail["subject"], interest, mail["id"],
+                           in_reply_to=mail["message_id"], references=mail["references"],
+                           thread_origin=thread_origin)
+            else:
+                report.warning(f"⚠️ Ignored email from {mail['from']} as they are not a known contact in the database.")
+                mark_as_read(mail["id"])
+
+        report.success("✅ Finished processing new replies.")
+    else:
+        report.write("No new replies to process.")
+
+def run_automations(db):
+    """Runs one full pass of the reply pipeline: inbox, follow-ups, then unresponsive contacts."""
+    report.info("--- 1. Checking for new replies ---")
+    process_inbox(db)
+
+    report.info("--- 2. Checking for pending follow-ups ---")
+    follow_ups_sent = process_follow_ups(db)
+    if follow_ups_sent > 0:
+        report.write(f"Sent {follow_ups_sent} follow-up email(s)..")
+    else:
+        report.write("No contacts needed a follow-up.")
+
+    report.info("--- 3. Checking for unresponsive contacts ---")
+    unsubscribes_processed = process_unsubscribes(db)
+    if unsubscribes_processed > 0:
+        report.write(f"Unsubscribed {unsubscribes_processed} contact(s) due to no reply.")
+    else:
+        report.write("No contacts met the criteria for unsubscribing.")
+    return {"follow_ups": follow_ups_sent, "unsubscribes": unsubscribes_processed}
+
 # ===============================
 # MAIN STREAMLIT APP
 # ===============================
@@ -268,49 +424,23 @@ def main():
     client, db = get_db_connection()
     if not client: return
     setup_database_indexes(db)
+    try:
+        load_templates_from_db(db)
+    except Exception as e:
+        st.warning(f"⚠ Could not load email templates. Using built-in defaults. (Error: {e})")
 
     if st.button("Check Emails & Run Automations"):
         with st.spinner("Processing all tasks..."):
-            
-            st.info("--- 1. Checking for new replies ---")
-            unread_emails = get_unread_emails()
-            if unread_emails:
-                st.write(f"Found {len(unread_emails)} new email(s).")
-                for mail in unread_emails:
-                    st.write(f"Processing reply from: {mail['from']}")
-                    
-                    is_known_contact = db.email_logs.find_one({"recipient_email": mail['from']})
-
-                    if is_known_contact:
-                        log_event_to_db(db, "received", mail["from"], mail["subject"], mail_id=mail["id"], body=mail["body"])
-                        interest = check_interest_with_openai(mail["body"])
-                        st.write(f"-> Interest level: *{interest}*")
-                        send_reply(db, mail["from"], mail["subject"], interest, mail["id"])
-                    else:
-                        st.warning(f"⚠️ Ignored email from {mail['from']} as they are not a known contact in the database.")
-                        mark_as_read(mail["id"])
-
-                st.success("✅ Finished processing new replies.")
-            else:
-                st.write("No new replies to process.")
-            
-            st.info("--- 2. Checking for pending follow-ups ---")
-            follow_ups_sent = process_follow_ups(db)
-            if follow_ups_sent > 0:
-                 st.write(f"Sent {follow_ups_sent} follow-up email(s)..")
-            else:
-                st.write("No contacts needed a follow-up.")
-
-            st.info("--- 3. Checking for unresponsive contacts ---")
-            unsubscribes_processed = process_unsubscribes(db)
-            if unsubscribes_processed > 0:
-                st.write(f"Unsubscribed {unsubscribes_processed} contact(s) due to no reply.")
-            else:
-                st.write("No contacts met the criteria for unsubscribing.")
-            
+            run_automations(db)
             st.success("✅ All automated tasks complete.")
             st.markdown("---")
 
+    jobs = list(db.scheduled_jobs.find({}, {"interval_seconds": 1, "enabled": 1, "next_run_at": 1,
+                                             "last_finished_at": 1, "last_status": 1, "last_error": 1}))
+    if jobs:
+        with st.expander("⏱ Scheduled automations (run by `python cli.py worker`)"):
+            st.dataframe(pd.DataFrame(jobs).rename(columns={"_id": "job"}), hide_index=True, use_container_width=True)
+
     client.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import logging
+
+# ===============================
+# CONFIGURATION
+# ===============================
+logger = logging.getLogger("morphius")
+
+# ===============================
+# REPORTERS
+# ===============================
+class Reporter:
+    """Receives status messages from the pipeline functions. The base class discards them."""
+
+    def write(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def success(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+    def progress(self, done, total, text=""):
+        pass
+
+
+class StreamlitReporter(Reporter):
+    """Renders messages as Streamlit alerts in the current page."""
+
+    def write(self, message):
+        import streamlit as st
+        st.write(message)
+
+    def info(self, message):
+        import streamlit as st
+        st.info(message)
+
+    def success(self, message):
+        import streamlit as st
+        st.success(message)
+
+    def warning(self, message):
+        import streamlit as st
+        st.warning(message)
+
+    def error(self, message):
+        import streamlit as st
+        st.error(message)
+
+
+class LogReporter(Reporter):
+    """Writes messages to the 'morphius' logger, for the CLI and background workers."""
+
+    def __init__(self, log=logger):
+        self.log = log
+
+    def write(self, message):
+        self.log.info(message)
+
+    def info(self, message):
+        self.log.info(message)
+
+    def success(self, message):
+        self.log.info(message)
+
+    def warning(self, message):
+        self.log.warning(message)
+
+    def error(self, message):
+        self.log.error(message)
+
+    def progress(self, done, total, text=""):
+        self.log.debug("%s/%s %s", done, total, text)
+
+
+_reporter = StreamlitReporter()
+
+def get_reporter():
+    return _reporter
+
+def set_reporter(reporter):
+    """Routes all pipeline messages to `reporter`; returns the previous one."""
+    global _reporter
+    previous, _reporter = _reporter, reporter
+    return previous
+
+
+class _ReporterProxy:
+    """Forwards to whichever reporter is active, so modules can bind `report` at import time."""
+
+    def __getattr__(self, name):
+        return getattr(_reporter, name)
+
+
+report = _ReporterProxy()
@@ -0,0 +1,207 @@
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+SCHEDULED_JOBS_COLLECTION = "scheduled_jobs"
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 5))
+# Missed intervals beyond this are dropped instead of replayed back to back
+SCHEDULER_MAX_CATCH_UP = int(os.getenv("SCHEDULER_MAX_CATCH_UP", 3))
+
+logger = logging.getLogger("morphius.scheduler")
+
+# Handlers live in code; the schedule itself (interval, jitter, enabled) lives in MongoDB
+_handlers = {}
+_defaults = {}
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _aware(value):
+    # PyMongo returns naive UTC datetimes unless the client is tz_aware
+    return value.replace(tzinfo=datetime.timezone.utc) if value and value.tzinfo is None else value
+
+# ===============================
+# JOB DEFINITIONS
+# ===============================
+def register_job(name, handler, interval_seconds, jitter_seconds=0, lock_seconds=None, catch_up=True):
+    """Registers the code for a scheduled job and its default schedule.
+
+    `handler` is called with the database handle. `lock_seconds` bounds how
+    long a crashed worker can hold the job; it defaults to the interval (at
+    least five minutes). A live worker renews the lock while the handler
+    runs, so a long run is never taken over. With `catch_up`, runs missed while no worker was up
+    are replayed, up to SCHEDULER_MAX_CATCH_UP of them.
+    """
+    _handlers[name] = handler
+    _defaults[name] = {
+        "interval_seconds": interval_seconds,
+        "jitter_seconds": jitter_seconds,
+        "lock_seconds": lock_seconds or max(interval_seconds, 300),
+        "catch_up": catch_up,
+        "enabled": True,
+    }
+
+def register_default_jobs():
+    """Registers the reply-pipeline automations that used to need a button press."""
+    import reply
+
+    register_job("process_inbox", reply.process_inbox,
+                 int(os.getenv("INBOX_POLL_SECONDS", 60)), jitter_seconds=10)
+    register_job("process_follow_ups", reply.process_follow_ups,
+                 int(os.getenv("FOLLOW_UP_INTERVAL_SECONDS", 300)), jitter_seconds=60)
+    register_job("process_unsubscribes", reply.process_unsubscribes,
+                 int(os.getenv("UNSUBSCRIBE_INTERVAL_SECONDS", 3600)), jitter_seconds=300, catch_up=False)
+
+def setup_scheduler(db):
+    """Creates missing job documents; schedules already stored in MongoDB are left as they are."""
+    collection = db[SCHEDULED_JOBS_COLLECTION]
+    collection.create_index([("enabled", 1), ("next_run_at", 1)])
+    now = _now()
+    for name, defaults in _defaults.items():
+        # New jobs start at a random point of their first interval so workers don't fire everything at once
+        first_run = now + datetime.timedelta(seconds=random.uniform(0, defaults["interval_seconds"]))
+        try:
+            collection.update_one(
+                {"_id": name},
+                {"$setOnInsert": {**defaults, "next_run_at": first_run, "locked_by": None,
+                                  "lock_expires_at": None, "run_count": 0, "created_at": now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another worker created it at the same moment
+            pass
+
+def list_jobs(db):
+    return list(db[SCHEDULED_JOBS_COLLECTION].find().sort("_id", 1))
+
+# ===============================
+# LOCKING
+# ===============================
+def claim_due_job(db, worker_id, now=None):
+    """Atomically takes the lock on the most overdue job, or returns None if nothing is due."""
+    now = now or _now()
+    job = db[SCHEDULED_JOBS_COLLECTION].find_one_and_update(
+        {
+            "_id": {"$in": list(_handlers)},
+            "enabled": True,
+            "next_run_at": {"$lte": now},
+            "$or": [{"locked_by": None}, {"lock_expires_at": {"$lt": now}}],
+        },
+        [{"$set": {
+            "locked_by": worker_id,
+            "lock_expires_at": {"$add": [now, {"$multiply": ["$lock_seconds", 1000]}]},
+            "last_started_at": now,
+        }}],
+        sort=[("next_run_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+    return job
+
+def renew_lock(db, job, worker_id):
+    """Pushes the lock expiry out by another `lock_seconds`; returns False if this worker lost the lock."""
+    now = _now()
+    result = db[SCHEDULED_JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "locked_by": worker_id},
+        {"$set": {"lock_expires_at": now + datetime.timedelta(seconds=job["lock_seconds"])}}
+    )
+    return result.matched_count == 1
+
+def _heartbeat(db, job, worker_id, stop):
+    while not stop.wait(job["lock_seconds"] / 3):
+        try:
+            if not renew_lock(db, job, worker_id):
+                logger.error("Worker %s lost the lock on job %s while it was running", worker_id, job["_id"])
+                return
+        except Exception:
+            logger.exception("Could not renew the lock on job %s", job["_id"])
+
+def next_run_time(job, now):
+    """Returns (slot, run_at) for the next run.
+
+    Slots follow the original cadence; jitter is added on top of the slot so
+    it never accumulates as drift. Missed slots are replayed back to back when
+    the job catches up, at most SCHEDULER_MAX_CATCH_UP of them.
+    """
+    interval = datetime.timedelta(seconds=job["interval_seconds"])
+    slot = _aware(job.get("slot_at") or job["next_run_at"])
+    missed = int((now - slot) / interval)
+    if job.get("catch_up", True) and missed > 0:
+        replay = max(slot + interval, now - interval * SCHEDULER_MAX_CATCH_UP)
+        return replay, replay
+    slot += interval * (missed + 1)
+    return slot, slot + datetime.timedelta(seconds=random.uniform(0, job.get("jitter_seconds") or 0))
+
+def release_job(db, job, worker_id, status, error=None):
+    """Records the outcome and schedules the next run, as long as this worker still holds the lock.
+
+    Returns False, and logs an error, if the lock was lost: another worker may have run the job concurrently.
+    """
+    now = _now()
+    slot, run_at = next_run_time(job, now)
+    result = db[SCHEDULED_JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "locked_by": worker_id},
+        {"$set": {
+            "locked_by": None, "lock_expires_at": None,
+            "slot_at": slot, "next_run_at": run_at,
+            "last_finished_at": now, "last_status": status, "last_error": error,
+            "last_duration_seconds": (now - _aware(job["last_started_at"])).total_seconds(),
+        }, "$inc": {"run_count": 1}}
+    )
+    if result.matched_count == 0:
+        logger.error("Worker %s no longer held the lock on job %s when it finished; "
+                     "another worker may have run it at the same time", worker_id, job["_id"])
+        return False
+    return True
+
+# ===============================
+# WORKER
+# ===============================
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def run_due_jobs(db, worker_id):
+    """Runs every job that is due right now, one at a time. Returns the number run."""
+    ran = 0
+    while True:
+        job = claim_due_job(db, worker_id)
+        if not job:
+            return ran
+        logger.info("Running job %s", job["_id"])
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(db, job, worker_id, stop), daemon=True,
+                         name=f"lock-heartbeat-{job['_id']}").start()
+        try:
+            _handlers[job["_id"]](db)
+            status, error = "success", None
+        except Exception as e:
+            logger.exception("Job %s failed", job["_id"])
+            status, error = "failed", str(e)
+        finally:
+            stop.set()
+        release_job(db, job, worker_id, status, error)
+        ran += 1
+
+def run_worker(db, worker_id=None, poll_seconds=SCHEDULER_POLL_SECONDS, stop_event=None):
+    """Runs due jobs until `stop_event` is set. Any number of workers can share one database."""
+    worker_id = worker_id or default_worker_id()
+    stop_event = stop_event or threading.Event()
+    setup_scheduler(db)
+    logger.info("Scheduler worker %s started with jobs: %s", worker_id, ", ".join(sorted(_handlers)))
+    while not stop_event.is_set():
+        run_due_jobs(db, worker_id)
+        # Jittered polling keeps several workers from querying in lockstep
+        stop_event.wait(poll_seconds * random.uniform(0.8, 1.2))
+    logger.info("Scheduler worker %s stopped", worker_id)
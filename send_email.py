@@ -3,10 +3,17 @@ import pandas as pd
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from io import StringIO
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import re
 from dotenv import load_dotenv
-from urllib.parse import quote
+from contact_dedup import ACTIVE_CONTACT_FILTER, count_golden_contacts
+from contact_schema import normalize_domain, primary_email
+from email_templates import TEMPLATE_CONSTANTS, load_templates_from_db, render_template, unsubscribe_url
+from llm_broker import BATCH, INTERACTIVE, get_llm_broker
+from llm_cache import cached_chat_completion, streamed_chat_completion, get_llm_cache
+from instrumentation import timed
+from reporting import report
 
 # ===============================
 # LOAD CONFIG
@@ -14,7 +21,13 @@ from urllib.parse import quote
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
-client_ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+DRAFT_CONCURRENCY = int(os.getenv("DRAFT_CONCURRENCY", 8))
+CONTACT_PAGE_SIZE = int(os.getenv("CONTACT_PAGE_SIZE", 50))
+DRAFT_SUBJECT = "Connecting from Morphius AI"
+CONTACT_PROJECTION = {
+    "name": 1, "work_emails": 1, "personal_emails": 1, "phones": 1,
+    "domain": 1, "source": 1, "source_url": 1, "linkedin_url": 1
+}
 
 # ===============================
 # HELPERS & CALLBACKS
@@ -26,19 +39,63 @@ def get_db_connection():
         db = client[MONGO_DB_NAME]
         return client, db
     except ConnectionFailure as e:
-        st.error(f"❌ Database Connection Error: {e}")
+        report.error(f"❌ Database Connection Error: {e}")
         return None, None
 
-def fetch_cleaned_contacts(db):
+def setup_contact_indexes(db):
+    """Indexes the fields the contact picker filters and pages on."""
     try:
-        cursor = db.cleaned_contacts.find().sort('_id', -1)
-        df = pd.DataFrame(list(cursor))
+        db.cleaned_contacts.create_index([("domain", 1), ("_id", -1)])
+    except Exception as e:
+        report.warning(f"⚠ Could not create contact indexes. Error: {e}")
+
+def build_contact_query(domain_filter=None):
+    """Matches domains starting with the filter; domains are stored lowercased so the prefix can use the index."""
+    query = dict(ACTIVE_CONTACT_FILTER)
+    prefix = normalize_domain(domain_filter)
+    if prefix:
+        query["domain"] = {"$regex": "^" + re.escape(prefix)}
+    return query
+
+def count_cleaned_contacts(db, domain_filter=None):
+    try:
+        if not domain_filter:
+            return count_golden_contacts(db)
+        return db.cleaned_contacts.count_documents(build_contact_query(domain_filter))
+    except Exception as e:
+        report.warning(f"⚠ Could not count contacts. Error: {e}")
+        return 0
+
+def fetch_cleaned_contacts(db, domain_filter=None, before_id=None, page_size=CONTACT_PAGE_SIZE):
+    """Fetches one page of contacts, newest first, filtered and projected server-side.
+
+    Pages are keyed on `_id`: pass the last `_id` of the previous page as
+    `before_id`. Returns the page as a DataFrame and whether more pages follow.
+    """
+    try:
+        query = build_contact_query(domain_filter)
+        if before_id is not None:
+            query["_id"] = {"$lt": before_id}
+        docs = list(db.cleaned_contacts.find(query, CONTACT_PROJECTION).sort('_id', -1).limit(page_size + 1))
+        df = pd.DataFrame(docs[:page_size])
         if '_id' in df.columns:
             df.rename(columns={'_id': 'mongo_id'}, inplace=True)
-        return df
+        return df, len(docs) > page_size
+    except Exception as e:
+        report.warning(f"⚠ Could not fetch contacts. Error: {e}")
+        return pd.DataFrame(), False
+
+def fetch_all_matching_contacts(db, domain_filter=None):
+    try:
+        cursor = db.cleaned_contacts.find(build_contact_query(domain_filter), CONTACT_PROJECTION).sort('_id', -1)
+        return [{**doc, "mongo_id": doc.pop("_id")} for doc in cursor]
     except Exception as e:
-        st.warning(f"⚠ Could not fetch contacts. Error: {e}")
-        return pd.DataFrame()
+        report.warning(f"⚠ Could not fetch contacts. Error: {e}")
+        return []
+
+def reset_contact_pages():
+    st.session_state.contact_page_cursors = [None]
+    st.session_state.contact_page = 0
 
 def update_subject(index, email_id):
     for i, email_draft in enumerate(st.session_state.edited_emails):
@@ -58,8 +115,8 @@ def update_body(index, email_id):
 # UNSUBSCRIBE HELPER
 # ===============================
 def append_unsubscribe_link(body_text, recipient_email):
-    unsubscribe_link = f"\n\n\nIf you prefer not to receive future emails, you can unsubscribe here: https://unsubscribe-52pwl9yyy-gowthami-gs-projects.vercel.app/unsubscribe?email={quote(recipient_email)}"
-    return body_text.strip() + unsubscribe_link
+    footer = render_template("outreach_unsubscribe_footer", unsubscribe_url=unsubscribe_url(recipient_email))
+    return body_text.strip() + footer
 
 # ===============================
 # AI-POWERED LOGIC
@@ -70,65 +127,129 @@ def decode_prompt_to_domain(prompt):
         You are an expert business analyst. Respond with ONLY a lowercase keyword for the domain.
         If uncertain, respond with 'general'.
         """
-        response = client_ai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=10,
-            temperature=0.1,
-        )
-        domain = response.choices[0].message.content.strip().lower()
+        domain = cached_chat_completion(
+            get_llm_broker().lane(INTERACTIVE),
+            model="gpt-4o", system_prompt=system_message, user_prompt=prompt,
+            temperature=0.1, max_tokens=10,
+        ).strip().lower()
         return domain
     except Exception as e:
-        st.error(f"OpenAI API Error: {e}")
+        report.error(f"OpenAI API Error: {e}")
         return None
 
 def get_fallback_template(domain, name, email=""):
-    greeting =  "Dear Sir/Madam,"
-    signature = "\n\nBest regards,\nGowthami\nEmployee, Morphius AI\nhttps://www.morphius.in/"
-    
     if "edtech" in str(domain).lower():
-        body = f"I came across your profile in the EdTech space. At Morphius AI, we personalize learning and improve educational outcomes.\n\nI would be keen to connect and share insights."
+        template_name = "fallback_edtech"
     elif "commerce" in str(domain).lower():
-        body = f"I noticed your experience in e-commerce. Morphius AI creates AI-driven tools that enhance customer engagement and optimize online retail.\n\nA brief chat about industry trends could be mutually beneficial."
+        template_name = "fallback_commerce"
     elif "health" in str(domain).lower():
-        body = f"Your work in healthcare is impressive. At Morphius AI, we leverage AI to streamline diagnostics and improve patient care pathways.\n\nI would value a discussion on healthcare technology."
+        template_name = "fallback_health"
     else:
-        body = f"I came across your profile and was interested in your work in the {domain} sector. Morphius AI builds AI solutions across industries.\n\nI would be delighted to connect."
+        template_name = "fallback_general"
     
-    final_body = f"{greeting}\n\n{body}{signature}"
+    final_body = render_template(template_name, domain=str(domain))
     return append_unsubscribe_link(final_body, email)
 
-def generate_personalized_email_body(contact_details):
+def build_draft_request(contact_details):
+    """Returns the chat completion arguments used to draft an email for a contact."""
     name = contact_details.get('name')
     domain = contact_details.get('domain', 'their industry')
     linkedin = contact_details.get('linkedin_url', '')
-    email = contact_details.get('work_emails') or contact_details.get('personal_emails', '')
     
     greeting = "Dear Sir/Madam,"
-    signature = "\n\nBest regards,\nGowthami\nEmployee, Morphius AI\nhttps://www.morphius.in/"
+    signature = "\n\n" + TEMPLATE_CONSTANTS["outreach_signature"]
     
-    try:
-        prompt = f"""
+    prompt = f"""
         Write a professional outreach email for {name} in the {domain} sector. LinkedIn: {linkedin}.
         Start with: "{greeting}" and end with "{signature}".
         """
-        response = client_ai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a business development assistant. Only output the email body."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300, temperature=0.75,
-        )
-        body = response.choices[0].message.content.strip()
+    return {
+        "model": "gpt-4o",
+        "system_prompt": "You are a business development assistant. Only output the email body.",
+        "user_prompt": prompt,
+        "temperature": 0.75,
+        "max_tokens": 300,
+    }
+
+def get_contact_email(contact_details):
+    return primary_email(contact_details) or ''
+
+@timed()
+def generate_draft_body(contact_details, refresh=False):
+    """Generates a draft body without touching the UI, so it is safe to run in worker threads.
+
+    Returns a (body, error) tuple; on failure the body is the fallback template.
+    Repeat requests for the same contact are served from the LLM cache unless
+    `refresh` is set.
+    """
+    email = get_contact_email(contact_details)
+    try:
+        body = cached_chat_completion(get_llm_broker().lane(BATCH), refresh=refresh, **build_draft_request(contact_details)).strip()
     except Exception as e:
-        st.warning(f"⚠ OpenAI API failed. Using fallback template. (Error: {e})")
-        body = get_fallback_template(domain, name, email)
+        return get_fallback_template(contact_details.get('domain', 'their industry'), contact_details.get('name'), email), e
 
-    return append_unsubscribe_link(body, email)
+    return append_unsubscribe_link(body, email), None
+
+def stream_draft_body(contact_details):
+    """Yields a freshly generated draft body token by token (without the unsubscribe link)."""
+    return streamed_chat_completion(get_llm_broker().lane(INTERACTIVE), **build_draft_request(contact_details))
+
+@timed()
+def generate_personalized_email_body(contact_details, refresh=False):
+    body, error = generate_draft_body(contact_details, refresh=refresh)
+    if error:
+        report.warning(f"⚠ OpenAI API failed. Using fallback template. (Error: {error})")
+    return body
+
+def generate_drafts_concurrently(contacts, max_workers=DRAFT_CONCURRENCY):
+    """Runs draft generation for many contacts in parallel.
+
+    `contacts` is an iterable of (key, contact_details) pairs. Yields
+    (key, contact_details, body, error) as each completion finishes, so callers
+    can render drafts incrementally instead of waiting for the whole batch.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(generate_draft_body, contact): (key, contact)
+            for key, contact in contacts
+        }
+        for future in as_completed(futures):
+            key, contact = futures[future]
+            body, error = future.result()
+            yield key, contact, body, error
+
+def build_drafts(rows, progress=None):
+    """Generates outreach drafts for (key, contact) rows, returned in input order.
+
+    Contacts without an address are skipped. `progress`, if given, is called
+    with (done, total) as drafts complete.
+    """
+    pending = []
+    for key, row in rows:
+        to_email = primary_email(row)
+        if not to_email:
+            report.warning(f"⚠️ Skipped '{row.get('name', 'Unknown')}' - no valid email.")
+            continue
+        pending.append((key, {**row, "to_email": to_email}))
+
+    order = {key: position for position, (key, _) in enumerate(pending)}
+    drafts = []
+    for done, (key, contact, body, error) in enumerate(generate_drafts_concurrently(pending), start=1):
+        to_email = contact.pop("to_email")
+        drafts.append({
+            "id": key, "name": contact['name'], "to_email": to_email,
+            "subject": DRAFT_SUBJECT, "body": body,
+            "contact_details": contact,
+            "regen_counter": 0
+        })
+        if progress:
+            progress(done, len(pending))
+        if error:
+            report.warning(f"⚠ Used fallback template for {contact['name']}. (Error: {error})")
+        else:
+            report.success(f"✅ Draft ready for {contact['name']} <{to_email}>")
+    drafts.sort(key=lambda draft: order[draft["id"]])
+    return drafts
 
 # ===============================
 # MAIN STREAMLIT APP
@@ -140,10 +261,20 @@ def main():
         st.session_state.edited_emails = []
     if 'filter_domain' not in st.session_state:
         st.session_state.filter_domain = None
+    if 'selected_contacts' not in st.session_state:
+        st.session_state.selected_contacts = {}
+        st.session_state.selection_version = 0
+    if 'contact_page_cursors' not in st.session_state:
+        reset_contact_pages()
 
     client_mongo, db = get_db_connection()
     if not client_mongo:
         return
+    setup_contact_indexes(db)
+    try:
+        load_templates_from_db(db)
+    except Exception as e:
+        st.warning(f"⚠ Could not load email templates. Using built-in defaults. (Error: {e})")
 
     st.header("Step 1: Filter Contacts by Prompt")
     prompt = st.text_input("Enter a prompt (e.g., 'top 10 colleges', 'e-commerce startups')", key="prompt_input")
@@ -152,6 +283,7 @@ def main():
         if st.button("🔍 Filter Contacts"):
             if prompt:
                 domain = decode_prompt_to_domain(prompt)
+                reset_contact_pages()
                 if domain and domain != 'general':
                     st.session_state.filter_domain = domain
                     st.success(f"Filtered contacts for domain: *{domain}*")
@@ -164,51 +296,81 @@ def main():
     with col2:
         if st.button("🔄 Show All Contacts"):
             st.session_state.filter_domain = None
+            reset_contact_pages()
             st.rerun()
 
+    cache_stats = get_llm_cache().stats()
+    st.caption(f"LLM cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+               f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} entries in memory)")
+
     st.header("Step 2: Select Contacts & Generate Drafts")
-    contacts_df = fetch_cleaned_contacts(db)
+    domain_filter = st.session_state.filter_domain
+    page = st.session_state.contact_page
+    total_matching = count_cleaned_contacts(db, domain_filter)
+    contacts_df, has_more = fetch_cleaned_contacts(db, domain_filter, st.session_state.contact_page_cursors[page])
+
+    s_col1, s_col2 = st.columns(2)
+    with s_col1:
+        if st.button(f"☑ Select All {total_matching} Matching Contacts", disabled=total_matching == 0):
+            for contact in fetch_all_matching_contacts(db, domain_filter):
+                st.session_state.selected_contacts[str(contact["mongo_id"])] = contact
+            st.session_state.selection_version += 1
+            client_mongo.close()
+            st.rerun()
+    with s_col2:
+        if st.button("✖ Clear Selection", disabled=not st.session_state.selected_contacts):
+            st.session_state.selected_contacts = {}
+            st.session_state.selection_version += 1
+            client_mongo.close()
+            st.rerun()
     client_mongo.close()
+
     if contacts_df.empty:
         st.info("No contacts found.")
         return
+    if domain_filter:
+        st.info(f"Showing {total_matching} contacts matching domain '{domain_filter}'")
 
+    selected = st.session_state.selected_contacts
     display_df = contacts_df.copy()
-    if st.session_state.filter_domain:
-        display_df = contacts_df[contacts_df['domain'].str.contains(st.session_state.filter_domain, case=False, na=False)].copy()
-        st.info(f"Showing {len(display_df)} contacts matching domain '{st.session_state.filter_domain}'")
+    display_df['mongo_id'] = display_df['mongo_id'].astype(str)
+    display_df.insert(0, "Select", display_df['mongo_id'].isin(selected.keys()))
 
-    if 'Select' not in display_df.columns:
-        display_df.insert(0, "Select", False)
+    edited_df = st.data_editor(display_df, hide_index=True, disabled=list(display_df.columns.drop("Select")),
+                               key=f"data_editor_{domain_filter}_{page}_{st.session_state.selection_version}")
+    page_rows = dict(zip(display_df['mongo_id'], contacts_df.to_dict('records')))
+    for mongo_id, is_selected in zip(edited_df['mongo_id'], edited_df['Select']):
+        if is_selected:
+            selected[mongo_id] = page_rows[mongo_id]
+        else:
+            selected.pop(mongo_id, None)
 
-    select_all = st.checkbox("Select All Contacts", value=False)
-    if select_all:
-        display_df['Select'] = True
+    total_pages = max(1, -(-total_matching // CONTACT_PAGE_SIZE))
+    p_col1, p_col2, p_col3 = st.columns([1, 2, 1])
+    with p_col1:
+        if st.button("⬅ Previous Page", disabled=page == 0):
+            st.session_state.contact_page -= 1
+            st.rerun()
+    with p_col2:
+        st.caption(f"Page {page + 1} of {total_pages} · {len(selected)} contacts selected")
+    with p_col3:
+        if st.button("Next Page ➡", disabled=not has_more):
+            cursors = st.session_state.contact_page_cursors
+            del cursors[page + 1:]
+            cursors.append(contacts_df['mongo_id'].iloc[-1])
+            st.session_state.contact_page += 1
+            st.rerun()
 
-    edited_df = st.data_editor(display_df, hide_index=True, disabled=list(display_df.columns.drop("Select")), key="data_editor")
-    selected_rows = edited_df[edited_df['Select']]
+    selected_rows = list(selected.items())
 
-    if st.button(f"Generate Drafts for {len(selected_rows)} Selected Contacts", disabled=selected_rows.empty):
-        st.session_state.edited_emails = []
-        for i, row in selected_rows.iterrows():
-            to_email = None
-            work_email_val = row.get('work_emails')
-            if isinstance(work_email_val, str) and work_email_val.strip():
-                to_email = work_email_val.split(',')[0].strip()
-            if not to_email:
-                personal_email_val = row.get('personal_emails')
-                if isinstance(personal_email_val, str) and personal_email_val.strip():
-                    to_email = personal_email_val.split(',')[0].strip()
-            if not to_email:
-                st.warning(f"⚠️ Skipped '{row.get('name', 'Unknown')}' - no valid email.")
-                continue
-            body = generate_personalized_email_body(row)
-            st.session_state.edited_emails.append({
-                "id": i, "name": row['name'], "to_email": to_email,
-                "subject": "Connecting from Morphius AI", "body": body,
-                "contact_details": row.to_dict(),
-                "regen_counter": 0
-            })
+    if st.button(f"Generate Drafts for {len(selected_rows)} Selected Contacts", disabled=not selected_rows):
+        progress_bar = st.progress(0, text=f"Generating {len(selected_rows)} drafts...")
+        with st.container():
+            drafts = build_drafts(
+                selected_rows,
+                lambda done, total: progress_bar.progress(done / total, text=f"Generated {done}/{total} drafts...")
+            )
+        st.session_state.edited_emails = drafts
         st.rerun()
 
     if st.session_state.edited_emails:
@@ -224,20 +386,30 @@ def main():
                 
                 b_col1, b_col2 = st.columns(2)
                 with b_col1:
-                    if st.button("🔄 Regenerate Body", key=f"regen_{unique_id}_{regen_count}"):
-                        new_body = generate_personalized_email_body(email_draft['contact_details'])
-                        st.session_state.edited_emails[i]['body'] = new_body
-                        st.session_state.edited_emails[i]['regen_counter'] += 1
-                        st.toast(f"Generated a new draft for {email_draft['name']}!")
-                        st.rerun()
+                    regenerate = st.button("🔄 Regenerate Body", key=f"regen_{unique_id}_{regen_count}")
                 with b_col2:
-                    if st.button("✍ Clear & Write Manually", key=f"clear_{unique_id}_{regen_count}"):
-                        manual_template = f"Hi {email_draft.get('name', '')},\n\n\n\nBest regards,\nGowthami\nEmployee, Morphius AI\nhttps://www.morphius.in/"
-                        manual_template = append_unsubscribe_link(manual_template, email_draft['to_email'])
-                        st.session_state.edited_emails[i]['body'] = manual_template
-                        st.session_state.edited_emails[i]['regen_counter'] += 1
-                        st.toast(f"Cleared draft for {email_draft['name']}.")
-                        st.rerun()
+                    clear = st.button("✍ Clear & Write Manually", key=f"clear_{unique_id}_{regen_count}")
+
+                if regenerate:
+                    contact_details = email_draft['contact_details']
+                    try:
+                        streamed_body = st.empty().write_stream(stream_draft_body(contact_details))
+                        new_body = append_unsubscribe_link(streamed_body.strip(), get_contact_email(contact_details))
+                    except Exception as e:
+                        st.warning(f"⚠ OpenAI API failed. Using fallback template. (Error: {e})")
+                        new_body = get_fallback_template(contact_details.get('domain', 'their industry'),
+                                                         contact_details.get('name'), get_contact_email(contact_details))
+                    st.session_state.edited_emails[i]['body'] = new_body
+                    st.session_state.edited_emails[i]['regen_counter'] += 1
+                    st.toast(f"Generated a new draft for {email_draft['name']}!")
+                    st.rerun()
+                if clear:
+                    manual_template = render_template("manual", name=email_draft.get('name', ''))
+                    manual_template = append_unsubscribe_link(manual_template, email_draft['to_email'])
+                    st.session_state.edited_emails[i]['body'] = manual_template
+                    st.session_state.edited_emails[i]['regen_counter'] += 1
+                    st.toast(f"Cleared draft for {email_draft['name']}.")
+                    st.rerun()
 
         st.markdown("### 📥 Download All Drafts")
         df_export = pd.DataFrame(st.session_state.edited_emails)[["name", "to_email", "subject", "body"]]
@@ -0,0 +1,182 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from dotenv import load_dotenv
+from instrumentation import increment
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ===============================
+# CONFIGURATION
+# ===============================
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+SINGLE_FLIGHT_COLLECTION = "single_flight"
+# How long a process may hold a key before others assume it died and take over
+SINGLE_FLIGHT_LOCK_SECONDS = int(os.getenv("SINGLE_FLIGHT_LOCK_SECONDS", 120))
+# Finished results stay readable this long, for processes that were waiting or arrive just after
+SINGLE_FLIGHT_RESULT_TTL_SECONDS = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL_SECONDS", 60))
+SINGLE_FLIGHT_POLL_SECONDS = float(os.getenv("SINGLE_FLIGHT_POLL_SECONDS", 0.5))
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# ===============================
+# KEYS
+# ===============================
+def normalize_url(url):
+    """Canonicalizes a URL so trivially different spellings of the same page share a key."""
+    parts = urlsplit(str(url).strip())
+    scheme = (parts.scheme or "http").lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/")
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+def flight_key(namespace, value):
+    """Hashes a namespace and a JSON-serializable request description into a key."""
+    raw = json.dumps([namespace, value], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# ===============================
+# SINGLE FLIGHT
+# ===============================
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one execution whose result every caller shares.
+
+    Within a process, callers of a key already in flight wait on its future.
+    Across processes, the first caller claims a lock document in MongoDB; the
+    others poll it until the result is published (kept `result_ttl_seconds`)
+    or the lock expires, in which case they take over. Results must be
+    BSON-serializable to be shared across processes.
+    """
+
+    def __init__(self, collection=None, lock_seconds=SINGLE_FLIGHT_LOCK_SECONDS,
+                 result_ttl_seconds=SINGLE_FLIGHT_RESULT_TTL_SECONDS, poll_seconds=SINGLE_FLIGHT_POLL_SECONDS):
+        self.collection = collection
+        self.lock_seconds = lock_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_seconds = poll_seconds
+        self.owner = uuid.uuid4().hex
+        self._calls = {}
+        self._lock = threading.Lock()
+        if self.collection is not None:
+            try:
+                self.collection.create_index("expires_at", expireAfterSeconds=0)
+            except PyMongoError:
+                self.collection = None
+
+    def do(self, key, func, shareable=None):
+        """Returns `func()`, or the result of an identical call already in flight.
+
+        `shareable(result)` decides whether a result is published to other
+        processes; results it rejects (e.g. transient errors) are only shared
+        with callers in this process that were already waiting.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            increment("single_flight_calls_total", outcome="shared_local")
+            return future.result()
+
+        try:
+            result = self._run(key, func, shareable)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _run(self, key, func, shareable):
+        if self.collection is None:
+            increment("single_flight_calls_total", outcome="leader")
+            return func()
+        while True:
+            claimed, doc = self._claim(key)
+            if claimed:
+                break
+            if doc is not None and doc.get("status") == "done":
+                increment("single_flight_calls_total", outcome="shared_remote")
+                return doc["result"]
+            time.sleep(self.poll_seconds)
+
+        increment("single_flight_calls_total", outcome="leader")
+        try:
+            result = func()
+        except BaseException:
+            self._release(key)
+            raise
+        if shareable is not None and not shareable(result):
+            self._release(key)
+            return result
+        try:
+            self.collection.update_one({"_id": key, "owner": self.owner}, {"$set": {
+                "status": "done", "result": result,
+                "expires_at": _now() + datetime.timedelta(seconds=self.result_ttl_seconds),
+            }})
+        except PyMongoError:
+            self._release(key)
+        return result
+
+    def _claim(self, key):
+        """Takes the lock for `key` unless a live lock or fresh result exists; returns (claimed, doc)."""
+        now = _now()
+        try:
+            self.collection.find_one_and_update(
+                {"_id": key, "expires_at": {"$lte": now}},
+                {"$set": {"status": "running", "owner": self.owner,
+                          "expires_at": now + datetime.timedelta(seconds=self.lock_seconds)},
+                 "$unset": {"result": ""}},
+                upsert=True
+            )
+            return True, None
+        except DuplicateKeyError:
+            return False, self.collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+        except PyMongoError:
+            # Without the shared lock, fall back to in-process coalescing only
+            return True, None
+
+    def _release(self, key):
+        try:
+            self.collection.delete_one({"_id": key, "owner": self.owner})
+        except PyMongoError:
+            pass
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Returns the process-wide instance, coalescing in-process only if MongoDB is unavailable."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            collection = None
+            try:
+                client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+                client.admin.command('ping')
+                collection = client[MONGO_DB_NAME][SINGLE_FLIGHT_COLLECTION]
+            except Exception:
+                collection = None
+            _single_flight = SingleFlight(collection)
+        return _single_flight